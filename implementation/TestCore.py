@@ -1,8 +1,13 @@
 #!/bin/bash/python3
 #encoding: utf-8
 
-from core import Link, Party, Crypto, Octets
+from core import Link, Party, Crypto, Octets, Frame, AsyncLink, AsyncParty, StreamLink, ShmLink, Membership, StateMachine, Log, Timeout, FailureDetector, SessionManager, Scheduler
 
+import asyncio
+import os
+import socket
+import threading
+import time
 import unittest
 
 
@@ -31,6 +36,38 @@ class TestOctets(unittest.TestCase):
 
 		self.assertEqual(result, expected)
 
+	def test_get_len_zero(self):
+		print("""[get_len] of 0""")
+		result = Octets.get_len(0)
+
+		self.assertEqual(result, 1)
+
+	def test_encode_uint(self):
+		print("""[encode_uint]""")
+		expected = b"\x04\xb2\xd0\x5d\xff"
+
+		result = Octets.encode_uint(2999999999)
+
+		self.assertEqual(result, expected)
+
+	def test_decode_uint(self):
+		print("""[decode_uint] of a 64 bits value""")
+		b = b"\x00\x08\xff\xff\xff\xff\xff\xff\xff\xff\x00"
+		expected = (18446744073709551615, 10)
+
+		result = Octets.decode_uint(b, 1)
+
+		self.assertEqual(result, expected)
+
+	def test_varint(self):
+		print("""[encode_varint] and [decode_varint]""")
+		expected = b"\xac\x02"
+
+		result = Octets.encode_varint(300)
+
+		self.assertEqual(result, expected)
+		self.assertEqual(Octets.decode_varint(result), (300, 2))
+
 
 class TestMessage(unittest.TestCase):
 	@classmethod
@@ -522,10 +559,11 @@ class TestMaster(unittest.TestCase):
 		print(f"""[makeCircuit]""")
 		master = Party.Master(1)
 		master.known_parties = [2,3,4]
-		master.prime_p = 31
-		master.k = 3
+		session = Party.Session(1)
+		session.prime_p = 31
+		session.k = 3
 
-		result = master.makeCircuit()
+		result = master.makeCircuit(session)
 
 		expected = Crypto.Circuit()
 		a = Crypto.Gate(Crypto.Gate.SHARE, value = 2)
@@ -542,5 +580,1582 @@ class TestMaster(unittest.TestCase):
 
 		self.assertEqual(result, expected)
 
+class HubInterface(Link.Interface):
+	"""
+	Interface exchanging encoded frames through a shared dictionary, used to run parties in a single process.
+	"""
+	def __init__(self, hub, pid):
+		super(HubInterface, self).__init__("hub", pid)
+		self.hub = hub
+		hub[self.get_addr()] = self
+
+	async def start(self):
+		pass
+
+	def broadcast(self, message):
+		for addr, interface in list(self.hub.items()):
+			if addr != self.get_addr():
+				interface.deliver(message.to_bytes(), self.get_addr())
+
+	def send_to(self, to_pid, message):
+		self.hub[self.parties_addr[to_pid]].deliver(message.to_bytes(), self.get_addr())
+
+
+class LossyHubInterface(HubInterface):
+	"""
+	Hub interface losing one datagram out of every.
+	"""
+	def __init__(self, hub, pid, every):
+		super(LossyHubInterface, self).__init__(hub, pid)
+		self.every = every
+		self.count = 0
+
+	def lose(self):
+		self.count += 1
+		return self.count % self.every == 0
+
+	def broadcast(self, message):
+		if not self.lose():
+			super(LossyHubInterface, self).broadcast(message)
+
+	def send_to(self, to_pid, message):
+		if not self.lose():
+			super(LossyHubInterface, self).send_to(to_pid, message)
+
+
+class TestReliableInterface(unittest.TestCase):
+	@classmethod
+	def setUpClass(self):
+		print("""Launching ReliableInterface class test...""")
+
+	@classmethod
+	def setUp(self):
+		print("""\tLaunching new test:""", end=" ")
+
+	@classmethod
+	def tearDown(self):
+		print("""\tTest done.""")
+
+	@classmethod
+	def tearDownClass(self):
+		print("""ReliableInterface class test done.""")
+
+	def make_pair(self, every):
+		hub = {}
+		sender = Link.ReliableInterface(LossyHubInterface(hub, 1, every), 1, rto = 0.02)
+		receiver = Link.ReliableInterface(HubInterface(hub, 2), 2)
+		sender.set_party(2, ("hub", 2))
+		received = []
+		receiver.set_recv_handler(received.append)
+
+		return sender, receiver, received
+
+	def make_message(self, payload):
+		frame = Frame.Frame(Frame.Frame.SHARE, Frame.Frame.PCEPS, 1, payload, session = 1)
+		return Link.Message(Link.Message.FRAME, ("hub", 1), frame)
+
+	def test_retransmit(self):
+		print("""[send_to] retransmits lost frames""")
+		sender, receiver, received = self.make_pair(2)
+
+		for i in range(6):
+			sender.send_to(2, self.make_message(i))
+		time.sleep(0.5)
+
+		self.assertEqual([m.content.get_payload() for m in received], list(range(6)))
+		self.assertEqual(sender.get_stats()["unacked"], 0)
+		self.assertTrue(sender.get_stats()["retransmissions"] >= 3)
+
+	def test_duplicate(self):
+		print("""[on_frames] delivers duplicates once""")
+		sender, receiver, received = self.make_pair(1000)
+		message = self.make_message(1)
+		sender.send_to(2, message)
+		reliable = Frame.Frame(Frame.Frame.RELIABLE, Frame.Frame.PCEPS, 1, (sender.epoch, 1, 1, message.content), session = 1)
+
+		receiver.on_frames([Link.Message(Link.Message.FRAME, ("hub", 1), reliable)])
+
+		self.assertEqual(len(received), 1)
+		self.assertEqual(receiver.get_stats()["duplicates"], 1)
+		self.assertEqual(sender.get_stats()["unacked"], 0)
+
+	def test_give_up(self):
+		print("""[retransmit] gives up a frame, the following ones are delivered""")
+		sender, receiver, received = self.make_pair(1000)
+		sender.max_transmissions = 2
+		send_to = sender.interface.send_to
+		# the first frame never arrives
+		sender.interface.send_to = lambda to_pid, message: None if message.content.get_payload()[1] == 1 else send_to(to_pid, message)
+
+		for i in range(3):
+			sender.send_to(2, self.make_message(i))
+		time.sleep(0.5)
+
+		self.assertEqual([m.content.get_payload() for m in received], [1, 2])
+		self.assertEqual(sender.get_stats()["lost"], 1)
+		self.assertIsNone(sender.peers[2].forward)
+
+	def test_restarted_receiver(self):
+		print("""[send_to] to a party that restarted""")
+		sender, receiver, received = self.make_pair(1000)
+		sender.send_to(2, self.make_message(0))
+		# a new run of the party, that never got the first frame
+		receiver = Link.ReliableInterface(HubInterface(sender.interface.hub, 2), 2)
+		received = []
+		receiver.set_recv_handler(received.append)
+
+		sender.send_to(2, self.make_message(1))
+
+		self.assertEqual([m.content.get_payload() for m in received], [1])
+		self.assertEqual(sender.get_stats()["unacked"], 0)
+
+	def test_broadcast(self):
+		print("""[broadcast] of a BVECT frame to every known party""")
+		sender, receiver, received = self.make_pair(1000)
+		frame = Frame.Frame(Frame.Frame.BVECT, Frame.Frame.PCEAS, 1, [3, 5], session = 1)
+
+		sender.broadcast(Link.Message(Link.Message.FRAME, ("hub", 1), frame))
+
+		self.assertEqual([m.content for m in received], [frame])
+		self.assertEqual(sender.get_stats()["unacked"], 0)
+
+	def test_broadcast_container(self):
+		print("""[broadcast] of a container packing a BVECT frame with a PING""")
+		sender, receiver, received = self.make_pair(1000)
+		outbound = Link.Coalescer(sender, schedule = lambda delay, callback: None)
+		frames = [Frame.Frame(Frame.Frame.BVECT, Frame.Frame.PCEAS, 1, [3, 5], session = 1), Frame.Frame(Frame.Frame.PING, Frame.Frame.PCEAS, 1, 1)]
+		for frame in frames:
+			outbound.broadcast(Link.Message(Link.Message.FRAME, ("hub", 1), frame))
+
+		# the first datagram is lost
+		sender.interface.count = 999
+		outbound.flush()
+		time.sleep(0.2)
+
+		self.assertEqual([m.content for m in received], frames)
+		self.assertEqual(sender.get_stats()["retransmissions"], 1)
+
+
+class TestStreamInterface(unittest.TestCase):
+	@classmethod
+	def setUpClass(self):
+		print("""Launching StreamInterface class test...""")
+
+	@classmethod
+	def setUp(self):
+		print("""\tLaunching new test:""", end=" ")
+
+	@classmethod
+	def tearDown(self):
+		print("""\tTest done.""")
+
+	@classmethod
+	def tearDownClass(self):
+		print("""StreamInterface class test done.""")
+
+	def make_message(self, payload):
+		frame = Frame.Frame(Frame.Frame.SHARE, Frame.Frame.PCEPS, 1, payload, session = 3)
+		return Link.Message(Link.Message.FRAME, None, frame)
+
+	def wait_for(self, predicate, timeout = 5):
+		deadline = time.monotonic() + timeout
+		while not predicate() and time.monotonic() < deadline:
+			time.sleep(0.01)
+
+	def test_parser(self):
+		print("""[feed] with frames split across reads""")
+		parser = StreamLink.StreamParser()
+		data = b"\x00\x00\x00\x02ab\x00\x00\x00\x00\x00\x00\x00\x03cde"
+
+		result = [parser.feed(data[i:i+3]) for i in range(0, len(data), 3)]
+
+		self.assertEqual(result, [[], [b"ab"], [], [b""], [], [b"cde"]])
+
+	def test_parser_oversized(self):
+		print("""[feed] Stream Protocol Exception on oversized frame""")
+		parser = StreamLink.StreamParser(max_frame_size = 16)
+		result = lambda: parser.feed(b"\x00\x00\x01\x00")
+		expected = StreamLink.StreamProtocolException
+		self.assertRaises(expected, result)
+
+	def test_broadcast_advert(self):
+		print("""[broadcast] of an ADVERT coalesced with a PING""")
+		datagram = RecordingInterface()
+		ni1 = StreamLink.StreamInterface("127.0.0.1", 0, datagram = datagram)
+		ni2 = StreamLink.StreamInterface("127.0.0.1", 0)
+		received = []
+		ni2.set_recv_handler(received.append)
+		ni1.set_party(2, ni2.get_addr())
+		ni1.start()
+		ni2.start()
+		outbound = Link.Coalescer(ni1, schedule = lambda delay, callback: None)
+		advert = Frame.Frame(Frame.Frame.ADVERT, Frame.Frame.PCEPS, 1, 1)
+		ping = Frame.Frame(Frame.Frame.PING, Frame.Frame.PCEPS, 1, 1)
+		for frame in (advert, ping):
+			outbound.broadcast(Link.Message(Link.Message.FRAME, ni1.get_addr(), frame))
+
+		try:
+			outbound.flush()
+			self.wait_for(lambda: received)
+		finally:
+			ni1.stop()
+			ni2.stop()
+
+		# the ADVERT reaches the parties not connected yet, the PING the connected ones
+		(destination, message), = datagram.sent
+		self.assertIsNone(destination)
+		self.assertEqual(message.content.get_payload(), [advert.to_bytes()])
+		self.assertEqual([m.content for m in received], [ping])
+
+	def test_send_to_unreachable(self):
+		print("""[send_to] to a party that left, without connecting again before the retry delay""")
+		closed = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+		closed.bind(("127.0.0.1", 0))
+		addr = closed.getsockname()
+		ni = StreamLink.StreamInterface("127.0.0.1", 0)
+		ni.set_party(2, addr)
+		try:
+			results = [ni.send_to(2, self.make_message(i)) for i in range(3)]
+			delay = ni.unreachable[addr][1]
+			# the retry delay expires
+			ni.unreachable[addr][0] = 0
+			results.append(ni.send_to(2, self.make_message(3)))
+		finally:
+			ni.stop()
+			closed.close()
+
+		self.assertEqual(results, [Link.FAILED] * 4)
+		self.assertEqual(delay, ni.min_retry_delay)
+		self.assertEqual(ni.unreachable[addr][1], 2 * ni.min_retry_delay)
+		self.assertEqual(ni.get_stats()["unreachable"], 1)
+
+	def test_send_to(self):
+		print("""[send_to] both ways on a single connection""")
+		ni1 = StreamLink.StreamInterface("127.0.0.1", 0)
+		ni2 = StreamLink.StreamInterface("127.0.0.1", 0)
+		received1, received2 = [], []
+		ni1.set_recv_handler(received1.append)
+		ni2.set_recv_handler(received2.append)
+		ni1.set_party(2, ni2.get_addr())
+		ni2.set_party(1, ni1.get_addr())
+		ni1.start()
+		ni2.start()
+
+		big = 2**(8*3000) - 1 # larger than a datagram
+		try:
+			for i in range(3):
+				ni1.send_to(2, self.make_message(i))
+			ni1.send_to(2, self.make_message(big))
+			self.wait_for(lambda: len(received2) == 4)
+			ni2.send_to(1, self.make_message(7))
+			self.wait_for(lambda: len(received1) == 1)
+		finally:
+			ni1.stop()
+			ni2.stop()
+
+		self.assertEqual([m.content.get_payload() for m in received2], [0, 1, 2, big])
+		self.assertEqual(received2[0].get_origin(), ni1.get_addr())
+		self.assertEqual([m.content.get_payload() for m in received1], [7])
+		self.assertEqual(ni1.get_stats()["connects"] + ni2.get_stats()["connects"], 1)
+
+	def test_run_PCEAS(self):
+		print("""[run_session] with PCEAS over TCP""")
+		interfaces = {pid: StreamLink.StreamInterface("127.0.0.1", 0) for pid in range(1, 5)}
+		master = Party.Master(1, version = Frame.Frame.PCEAS, networkInterface = interfaces[1])
+		parties = [master] + [Party.Party(pid, networkInterface = interfaces[pid]) for pid in range(2, 5)]
+		for party in parties:
+			party.timeout = 5
+			party.state = Party.Party.AWAITING
+			party.known_parties = list(range(1, 5))
+			for pid in range(1, 5):
+				if pid != party.party_id:
+					party.networkInterface.set_party(pid, interfaces[pid].get_addr())
+			party.networkInterface.start()
+
+		try:
+			session = master.prepare_session()
+			master.send_request(session)
+			master.run_session(session)
+		finally:
+			for interface in interfaces.values():
+				interface.stop()
+
+		self.assertTrue(15 <= session.final_result <= 25)
+
+
+class TestLoopbackInterface(unittest.TestCase):
+	@classmethod
+	def setUpClass(self):
+		print("""Launching LoopbackInterface class test...""")
+
+	@classmethod
+	def setUp(self):
+		print("""\tLaunching new test:""", end=" ")
+
+	@classmethod
+	def tearDown(self):
+		print("""\tTest done.""")
+
+	@classmethod
+	def tearDownClass(self):
+		print("""LoopbackInterface class test done.""")
+
+	def make_pair(self, serialize = False):
+		loopback = Link.Loopback(serialize = serialize)
+		ni1 = Link.LoopbackInterface(loopback, 1)
+		ni2 = Link.LoopbackInterface(loopback, 2)
+		ni1.set_party(2, ni2.get_addr())
+		received = []
+		ni2.set_recv_handler(received.append)
+
+		return ni1, received
+
+	def test_send_to(self):
+		print("""[send_to] without serialization""")
+		ni1, received = self.make_pair()
+		frame = Frame.Frame(Frame.Frame.BVECT, Frame.Frame.PCEAS, 1, [3, 5], session = 1)
+
+		ni1.send_to(2, Link.Message(Link.Message.FRAME, ni1.get_addr(), frame))
+
+		self.assertIs(received[0].content, frame)
+		self.assertEqual(received[0].get_origin(), ("loopback", 1))
+
+	def test_send_to_serialize(self):
+		print("""[send_to] with serialization""")
+		ni1, received = self.make_pair(serialize = True)
+		frame = Frame.Frame(Frame.Frame.BVECT, Frame.Frame.PCEAS, 1, [3, 5], session = 1)
+
+		ni1.send_to(2, Link.Message(Link.Message.FRAME, ni1.get_addr(), frame))
+
+		self.assertIsNot(received[0].content, frame)
+		self.assertEqual(received[0].content, frame)
+
+	def test_broadcast_sync(self):
+		print("""[broadcast] copies the circuit of SYNC frames""")
+		ni1, received = self.make_pair()
+		circuit = Crypto.Circuit()
+		gate = Crypto.Gate(Crypto.Gate.ADD)
+		gate.set_inputs([Crypto.Gate(Crypto.Gate.SHARE, value = 2), Crypto.Gate(Crypto.Gate.SHARE, value = 3)])
+		circuit.add_gate(gate)
+		frame = Frame.Frame(Frame.Frame.SYNC, Frame.Frame.PCEPS, 1, (263, circuit), session = 1)
+
+		ni1.broadcast(Link.Message(Link.Message.FRAME, ni1.get_addr(), frame))
+
+		self.assertIsNot(received[0].content.get_payload()[1], circuit)
+		self.assertEqual(received[0].content.get_payload()[1], circuit)
+
+	def test_compute_PCEAS(self):
+		print("""[compute] with PCEAS between 30 asyncio parties""")
+		import simulator
+		result = asyncio.run(simulator.simulate(30))
+
+		self.assertTrue(15 <= result <= 25)
+
+	def test_run_PCEPS(self):
+		print("""[run_session] with PCEPS between threaded parties""")
+		loopback = Link.Loopback()
+		master = Party.Master(1, networkInterface = Link.LoopbackInterface(loopback, 1))
+		parties = [master] + [Party.Party(pid, networkInterface = Link.LoopbackInterface(loopback, pid)) for pid in range(2, 7)]
+		for party in parties:
+			party.timeout = 5
+			party.state = Party.Party.AWAITING
+			party.known_parties = list(range(1, 7))
+			for pid in range(1, 7):
+				party.networkInterface.set_party(pid, ("loopback", pid))
+
+		session = master.prepare_session()
+		master.send_request(session)
+		master.run_session(session)
+
+		self.assertTrue(15 <= session.final_result <= 25)
+
+
+class TestShmInterface(unittest.TestCase):
+	@classmethod
+	def setUpClass(self):
+		print("""Launching ShmInterface class test...""")
+
+	@classmethod
+	def setUp(self):
+		print("""\tLaunching new test:""", end=" ")
+
+	@classmethod
+	def tearDown(self):
+		print("""\tTest done.""")
+
+	@classmethod
+	def tearDownClass(self):
+		print("""ShmInterface class test done.""")
+
+	def test_ring_buffer(self):
+		print("""[put] and [get_all] wrapping around the end of the buffer""")
+		name = f"mpctest{os.getpid()}"
+		producer = ShmLink.RingBuffer(name, 64)
+		consumer = ShmLink.RingBuffer(name, 64)
+		frames = [bytes([i]) * 20 for i in range(6)]
+
+		result = []
+		try:
+			for frame in frames:
+				self.assertTrue(producer.put(frame))
+				result.extend(consumer.get_all())
+		finally:
+			producer.close()
+			consumer.close(unlink = True)
+
+		self.assertEqual(result, frames)
+
+	@unittest.skipUnless(os.path.isdir("/dev/shm"), "POSIX shared memory not mapped to /dev/shm")
+	def test_ring_buffer_sized_late(self):
+		print("""[RingBuffer] attached to a segment created but not sized yet""")
+		name = f"mpctest{os.getpid()}"
+		fd = os.open(f"/dev/shm/{name}", os.O_CREAT | os.O_EXCL | os.O_RDWR, 0o600)
+		timer = threading.Timer(0.05, lambda: os.ftruncate(fd, ShmLink.HEADER_SIZE + 64))
+		timer.start()
+		try:
+			ring = ShmLink.RingBuffer(name, 64)
+			capacity = ring.capacity
+			ring.close(unlink = True)
+		finally:
+			timer.join()
+			os.close(fd)
+
+		self.assertEqual(capacity, 64)
+
+	def test_ring_buffer_full(self):
+		print("""[put] on a full buffer""")
+		name = f"mpctest{os.getpid()}"
+		ring = ShmLink.RingBuffer(name, 64)
+		try:
+			result = [ring.put(b"\x00" * 20) for _ in range(3)]
+		finally:
+			ring.close(unlink = True)
+
+		self.assertEqual(result, [True, True, False])
+
+	def test_send_to(self):
+		print("""[send_to] and [broadcast]""")
+		prefix = f"mpctest{os.getpid()}"
+		ni1 = ShmLink.ShmInterface(1, peers = (1, 2), prefix = prefix)
+		ni2 = ShmLink.ShmInterface(2, peers = (1, 2), prefix = prefix)
+		received = []
+		ni2.set_recv_handler(received.append)
+		frame = Frame.Frame(Frame.Frame.SHARE, Frame.Frame.PCEPS, 1, 1234, session = 3)
+		try:
+			ni1.send_to(2, Link.Message(Link.Message.FRAME, ni1.get_addr(), frame))
+			ni1.broadcast(Link.Message(Link.Message.FRAME, ni1.get_addr(), frame))
+			ni2.deliver_batch(ni2.drain())
+		finally:
+			ni1.close()
+			ni2.close()
+
+		self.assertEqual([m.content for m in received], [frame, frame])
+		self.assertEqual(received[0].get_origin(), ("shm", 1))
+
+	def test_run_PCEAS(self):
+		print("""[run_session] with PCEAS between processes""")
+		import simulator
+		result = simulator.simulate_processes(4, duration = 10)
+
+		self.assertTrue(15 <= result <= 25)
+
+
+class TestAsyncNetworkInterface(unittest.TestCase):
+	@classmethod
+	def setUpClass(self):
+		print("""Launching AsyncNetworkInterface class test...""")
+
+	@classmethod
+	def setUp(self):
+		print("""\tLaunching new test:""", end=" ")
+
+	@classmethod
+	def tearDown(self):
+		print("""\tTest done.""")
+
+	@classmethod
+	def tearDownClass(self):
+		print("""AsyncNetworkInterface class test done.""")
+
+	def test_send_to(self):
+		print("""[send_to] over UDP on the loopback""")
+		async def scenario():
+			received = asyncio.get_running_loop().create_future()
+			ni1 = AsyncLink.AsyncNetworkInterface("127.0.0.1", 0)
+			ni2 = AsyncLink.AsyncNetworkInterface("127.0.0.1", 0)
+			ni2.set_recv_handler(lambda message: received.set_result(message))
+			await ni1.start()
+			await ni2.start()
+			ni1.set_party(2, ni2.get_addr())
+
+			frame = Frame.Frame(Frame.Frame.SHARE, Frame.Frame.PCEPS, 1, 1234, session = 3)
+			ni1.send_to(2, Link.Message(Link.Message.FRAME, ni1.get_addr(), frame))
+			message = await asyncio.wait_for(received, 5)
+			ni1.stop()
+			ni2.stop()
+			return message.get()
+
+		m_type, m_origin, m_content = asyncio.run(scenario())
+
+		self.assertEqual(m_type, Link.Message.FRAME)
+		self.assertEqual(m_content, Frame.Frame(Frame.Frame.SHARE, Frame.Frame.PCEPS, 1, 1234, session = 3))
+
+
+class TestAsyncParty(unittest.TestCase):
+	@classmethod
+	def setUpClass(self):
+		print("""Launching AsyncParty class test...""")
+
+	@classmethod
+	def setUp(self):
+		print("""\tLaunching new test:""", end=" ")
+
+	@classmethod
+	def tearDown(self):
+		print("""\tTest done.""")
+
+	@classmethod
+	def tearDownClass(self):
+		print("""AsyncParty class test done.""")
+
+	def make_parties(self, version, n = 4):
+		hub = {}
+		master = AsyncParty.AsyncMaster(1, version = version, networkInterface = HubInterface(hub, 1))
+		parties = [master] + [AsyncParty.AsyncParty(pid, networkInterface = HubInterface(hub, pid)) for pid in range(2, n+1)]
+		for party in parties:
+			party.timeout = 2
+			party.state = Party.Party.AWAITING
+			party.known_parties = list(range(1, n+1))
+			for pid in range(1, n+1):
+				party.networkInterface.set_party(pid, ("hub", pid))
+
+		return parties
+
+	def test_wait_timeout(self):
+		print("""[wait] on a condition never fulfilled""")
+		async def scenario():
+			party = AsyncParty.AsyncParty(2, networkInterface = HubInterface({}, 2))
+			await party.start()
+			return await party.wait(lambda: False, 0.05)
+
+		result = asyncio.run(scenario())
+
+		self.assertFalse(result)
+
+	def test_compute_PCEPS(self):
+		print("""[compute] with PCEPS""")
+		async def scenario():
+			parties = self.make_parties(Frame.Frame.PCEPS)
+			for party in parties:
+				await party.start()
+			return await parties[0].compute()
+
+		result = asyncio.run(scenario())
+
+		self.assertTrue(15 <= result <= 25)
+
+	def test_compute_PCEAS(self):
+		print("""[compute] with PCEAS""")
+		async def scenario():
+			parties = self.make_parties(Frame.Frame.PCEAS)
+			for party in parties:
+				await party.start()
+			return await parties[0].compute()
+
+		result = asyncio.run(scenario())
+
+		self.assertTrue(15 <= result <= 25)
+
+	def test_run_resume(self):
+		print("""[run_session] going on without an input party that never shares""")
+		async def scenario():
+			parties = self.make_parties(Frame.Frame.PCEPS, n = 6)
+			for party in parties:
+				await party.start()
+			master = parties[0]
+			master.min_timeout = 0.1
+			for pid in range(2, 7):
+				master.timeouts.observe(Timeout.INPUT, pid, 0.01)
+			session = master.prepare_session()
+			session.k = 3
+			master.makeCircuit(session)
+			late = [p for p in parties[1:] if p.party_id in session.circuit.get_input_ids()][0]
+			late.share_inputs = lambda session: None
+			master.send_request(session)
+			return session, late, await master.run_session(session)
+
+		session, late, result = asyncio.run(scenario())
+
+		self.assertEqual(session.dropped, [late.party_id])
+		self.assertTrue(15 <= result <= 25)
+
+class TestMembership(unittest.TestCase):
+	@classmethod
+	def setUpClass(self):
+		print("""Launching Membership class test...""")
+
+	@classmethod
+	def setUp(self):
+		print("""\tLaunching new test:""", end=" ")
+
+	@classmethod
+	def tearDown(self):
+		print("""\tTest done.""")
+
+	@classmethod
+	def tearDownClass(self):
+		print("""Membership class test done.""")
+
+	def test_addr(self):
+		print("""[set_addr] and [get_id]""")
+		membership = Membership.Membership()
+
+		self.assertTrue(membership.set_addr(2, ("127.0.0.1", 5002)))
+		self.assertFalse(membership.set_addr(2, ("127.0.0.1", 6002)))
+		self.assertEqual(membership.get_addr(2), ("127.0.0.1", 5002))
+		self.assertEqual(membership.get_id(("127.0.0.1", 5002)), 2)
+		self.assertIsNone(membership.get_id(("127.0.0.1", 6002)))
+
+		membership.forget(2)
+		self.assertIsNone(membership.get_id(("127.0.0.1", 5002)))
+		self.assertTrue(membership.set_addr(2, ("127.0.0.1", 6002)))
+
+	def test_known(self):
+		print("""[add], [remove] and [ban]""")
+		membership = Membership.Membership()
+		for pid in [3, 1, 2]:
+			self.assertTrue(membership.add(pid))
+		self.assertFalse(membership.add(1))
+		self.assertEqual(membership.get_known(), [1, 2, 3])
+
+		self.assertTrue(membership.remove(2))
+		self.assertFalse(membership.remove(2))
+		self.assertTrue(membership.ban(3))
+		self.assertFalse(membership.add(3))
+		self.assertEqual(membership.get_known(), [1])
+		self.assertTrue(membership.is_banned(3))
+
+	def test_index(self):
+		print("""[index]""")
+		membership = Membership.Membership()
+		membership.add(7)
+		membership.set_addr(4, ("hub", 4))
+		membership.set_known([9, 7])
+
+		self.assertEqual([membership.index(pid) for pid in [7, 4, 9, 5]], [0, 1, 2, 3])
+		membership.remove(7)
+		self.assertEqual(membership.index(7), 0)
+
+	def test_shared(self):
+		print("""[Party] sharing the registry of its network interface""")
+		interface = Link.LoopbackInterface(Link.Loopback(), 1)
+		party = Party.Party(1, networkInterface = interface)
+		message = Link.Message(Link.Message.FRAME, ("loopback", 2), Frame.Frame(Frame.Frame.ADVERT, Frame.Frame.PCEPS, 2, 2))
+		party.state = Party.Party.AWAITING
+		party.on_recv(message)
+
+		self.assertIs(party.membership, interface.membership)
+		self.assertEqual(party.known_parties, [1, 2])
+		self.assertEqual(interface.get_party_id_by_addr(("loopback", 2)), 2)
+
+		party.membership.ban(2)
+		self.assertEqual(party.known_parties, [1])
+		self.assertIn(2, party.blacklist)
+
+
+class TestSessionManager(unittest.TestCase):
+	@classmethod
+	def setUpClass(self):
+		print("""Launching SessionManager class test...""")
+
+	@classmethod
+	def setUp(self):
+		print("""\tLaunching new test:""", end=" ")
+
+	@classmethod
+	def tearDown(self):
+		print("""\tTest done.""")
+
+	@classmethod
+	def tearDownClass(self):
+		print("""SessionManager class test done.""")
+
+	def test_open(self):
+		print("""[open] and [close]""")
+		sessions = SessionManager.SessionManager(max_sessions = 2, max_finished = 2)
+		first = sessions.open(1, lambda: Party.Session(1))
+
+		self.assertIs(sessions.get(1), first)
+		self.assertIsNone(sessions.open(1, lambda: Party.Session(1)))
+		self.assertIsNotNone(sessions.open(2, lambda: Party.Session(2)))
+		# full
+		self.assertIsNone(sessions.open(3, lambda: Party.Session(3)))
+
+		self.assertTrue(sessions.close(first))
+		self.assertFalse(sessions.close(first))
+		self.assertIsNone(sessions.get(1))
+		self.assertTrue(sessions.is_finished(1))
+		self.assertIsNone(sessions.open(1, lambda: Party.Session(1)))
+		self.assertIsNotNone(sessions.open(3, lambda: Party.Session(3)))
+		self.assertEqual(len(sessions), 2)
+
+	def test_evict(self):
+		print("""[open] evicting the sessions past their deadline when full""")
+		sessions = SessionManager.SessionManager(max_sessions = 1, lifetime = 0)
+		stale = sessions.open(1, lambda: Party.Session(1))
+		fresh = sessions.open(2, lambda: Party.Session(2))
+
+		self.assertIsNotNone(fresh)
+		self.assertTrue(stale.stop_prot)
+		self.assertTrue(sessions.is_finished(1))
+
+	def test_rename(self):
+		print("""[rename]""")
+		sessions = SessionManager.SessionManager()
+		session = sessions.open(1, lambda: Party.Session(1))
+
+		self.assertTrue(sessions.rename(session, 5))
+		self.assertIs(sessions.get(5), session)
+		self.assertEqual(session.session_id, 5)
+		self.assertTrue(sessions.is_finished(1))
+
+		sessions.close(session)
+		self.assertFalse(sessions.rename(session, 6))
+		self.assertIs(sessions.get_finished(6), session)
+
+	def test_hold(self):
+		print("""[hold] and [take_held]""")
+		sessions = SessionManager.SessionManager(max_pending_sessions = 2, max_pending_frames = 2)
+		frames = [Frame.Frame(Frame.Frame.SHARE, Frame.Frame.PCEPS, pid, 42, session = 1) for pid in range(3)]
+
+		self.assertEqual([sessions.hold(frame) for frame in frames], [True, True, False])
+		sessions.hold(Frame.Frame(Frame.Frame.SHARE, Frame.Frame.PCEPS, 2, 42, session = 2))
+		sessions.hold(Frame.Frame(Frame.Frame.SHARE, Frame.Frame.PCEPS, 2, 42, session = 3))
+		# the oldest session is forgotten
+		self.assertEqual(sessions.take_held(1), [])
+		self.assertEqual(len(sessions.take_held(3)), 1)
+		self.assertEqual(sessions.take_held(3), [])
+
+
+class TestStateMachine(unittest.TestCase):
+	@classmethod
+	def setUpClass(self):
+		print("""Launching StateMachine class test...""")
+
+	@classmethod
+	def setUp(self):
+		print("""\tLaunching new test:""", end=" ")
+
+	@classmethod
+	def tearDown(self):
+		print("""\tTest done.""")
+
+	@classmethod
+	def tearDownClass(self):
+		print("""StateMachine class test done.""")
+
+	class Subject:
+		def __init__(self):
+			self.state = 0
+
+	def test_dispatch(self):
+		print("""[dispatch] with guards, targets and entry/exit actions""")
+		machine = StateMachine.StateMachine("test")
+		calls = []
+		machine.add([0], [1, 2], [0], lambda x: calls.append(x), guard = lambda x: x > 0, target = 1)
+		machine.add([1], [1], [0], lambda x: 2 if x == 3 else None)
+		machine.add_exit(0, lambda subject: calls.append("exit 0"))
+		machine.add_entry(1, lambda subject: calls.append("enter 1"))
+		subject = self.Subject()
+
+		self.assertFalse(machine.dispatch(subject, 1, 0, -1))
+		self.assertFalse(machine.dispatch(subject, 1, 1, 5))
+		self.assertTrue(machine.dispatch(subject, 2, 0, 5))
+		self.assertEqual(subject.state, 1)
+		self.assertEqual(calls, [5, "exit 0", "enter 1"])
+		self.assertTrue(machine.dispatch(subject, 1, 0, 4))
+		self.assertEqual(subject.state, 1)
+		self.assertTrue(machine.dispatch(subject, 1, 0, 3))
+		self.assertEqual(subject.state, 2)
+
+		stats = machine.get_stats()
+		self.assertEqual(stats[(0, 1, 0)]["rejected"], 1)
+		self.assertEqual(stats[(0, 2, 0)]["count"], 1)
+		self.assertEqual(stats[(1, 1, 0)]["count"], 2)
+		self.assertNotIn((0, 1, 1), stats)
+		self.assertEqual(stats["unhandled"], 1)
+
+
+class TestLog(unittest.TestCase):
+	@classmethod
+	def setUpClass(self):
+		print("""Launching Log class test...""")
+
+	@classmethod
+	def setUp(self):
+		print("""\tLaunching new test:""", end=" ")
+
+	@classmethod
+	def tearDown(self):
+		print("""\tTest done.""")
+
+	@classmethod
+	def tearDownClass(self):
+		Log.setup()
+		print("""Log class test done.""")
+
+	class Counted:
+		def __init__(self):
+			self.formatted = False
+
+		def __str__(self):
+			self.formatted = True
+			return "counted"
+
+	def test_levels(self):
+		print("""[log] formatting only the enabled levels""")
+		path = f"/tmp/mpc-test-{os.getpid()}.log"
+		Log.setup(Log.INFO, path = path, stdout = False)
+		party = Party.Party(1, networkInterface = HubInterface({}, 1))
+		debug = self.Counted()
+		party.log("debug %s", debug, level = Log.DEBUG)
+		party.log("info %s", self.Counted())
+		party.log("warning %d", 3, level = Log.WARNING)
+		Log.get_logger("Link").debug("bound to port %d", 5005)
+		Log.get_logger("Link").info("port %d", 5005)
+		Log.handler.close()
+
+		with open(path) as f:
+			lines = f.read().splitlines()
+		os.remove(path)
+		self.assertEqual(lines, ["[PARTY: 1] info counted", "[PARTY: 1] warning 3", "[Link] port 5005"])
+		self.assertFalse(debug.formatted)
+
+
+class TestTimeoutEstimator(unittest.TestCase):
+	@classmethod
+	def setUpClass(self):
+		print("""Launching TimeoutEstimator class test...""")
+
+	@classmethod
+	def setUp(self):
+		print("""\tLaunching new test:""", end=" ")
+
+	@classmethod
+	def tearDown(self):
+		print("""\tTest done.""")
+
+	@classmethod
+	def tearDownClass(self):
+		print("""TimeoutEstimator class test done.""")
+
+	def test_observe(self):
+		print("""[observe] and [get]""")
+		estimator = Timeout.TimeoutEstimator()
+		self.assertIsNone(estimator.get(Timeout.INPUT, 2))
+
+		estimator.observe(Timeout.INPUT, 2, 0.1)
+		self.assertAlmostEqual(estimator.get(Timeout.INPUT, 2), 0.3)
+		estimator.observe(Timeout.INPUT, 2, 0.1)
+		self.assertAlmostEqual(estimator.get(Timeout.INPUT, 2), 0.25)
+		self.assertIsNone(estimator.get(Timeout.RESULT, 2))
+
+	def test_get_timeout(self):
+		print("""[get_timeout] bounded, for all or some of the peers""")
+		estimator = Timeout.TimeoutEstimator()
+		for peer, sample in [(2, 0.1), (3, 1), (4, 0.01)]:
+			estimator.observe(Timeout.RESULT, peer, sample)
+
+		self.assertAlmostEqual(estimator.get_timeout(Timeout.RESULT, [2, 3, 4], 0.05, 10), 3)
+		self.assertAlmostEqual(estimator.get_timeout(Timeout.RESULT, [2, 3, 4], 0.05, 10, needed = 2), 0.3)
+		self.assertAlmostEqual(estimator.get_timeout(Timeout.RESULT, [2, 3, 4], 0.05, 10, needed = 1), 0.05)
+		self.assertAlmostEqual(estimator.get_timeout(Timeout.RESULT, [2, 3, 4], 0.05, 2), 2)
+		self.assertEqual(estimator.get_timeout(Timeout.RESULT, [2, 5], 0.05, 10), 10)
+
+	def test_backoff(self):
+		print("""[backoff]""")
+		estimator = Timeout.TimeoutEstimator()
+		estimator.observe(Timeout.INPUT, 1, 0.001)
+		estimator.backoff(Timeout.INPUT, [1, 2], 0.5)
+
+		self.assertGreaterEqual(estimator.get(Timeout.INPUT, 1), 1)
+		self.assertIsNone(estimator.get(Timeout.INPUT, 2))
+
+
+class TestPhiAccrualDetector(unittest.TestCase):
+	@classmethod
+	def setUpClass(self):
+		print("""Launching PhiAccrualDetector class test...""")
+
+	@classmethod
+	def setUp(self):
+		print("""\tLaunching new test:""", end=" ")
+
+	@classmethod
+	def tearDown(self):
+		print("""\tTest done.""")
+
+	@classmethod
+	def tearDownClass(self):
+		print("""PhiAccrualDetector class test done.""")
+
+	def test_phi(self):
+		print("""[phi] growing with the time since the last heartbeat""")
+		detector = FailureDetector.PhiAccrualDetector(threshold = 8, min_std = 0.1, acceptable_pause = 0)
+		for i in range(10):
+			detector.heartbeat(2, now = i)
+
+		self.assertTrue(detector.is_alive(3, now = 100))
+		self.assertLess(detector.phi(2, now = 10), 1)
+		self.assertTrue(detector.is_alive(2, now = 10.2))
+		self.assertFalse(detector.is_alive(2, now = 12))
+		self.assertLess(detector.phi(2, now = 11), detector.phi(2, now = 12))
+
+		detector.forget(2)
+		self.assertTrue(detector.is_alive(2, now = 12))
+
+	def test_burst(self):
+		print("""[is_alive] after a burst of frames followed by a lost ping""")
+		detector = FailureDetector.PhiAccrualDetector()
+		for i in range(10):
+			detector.heartbeat(2, now = i)
+		# 100 frames in half a second, then the ping of time 10 is lost
+		for i in range(100):
+			detector.seen(2, now = 9 + i / 200)
+
+		self.assertTrue(detector.is_alive(2, now = 11.7))
+		self.assertFalse(detector.is_alive(2, now = 20))
+
+	def test_ping_message(self):
+		print("""[decode] of a heartbeat frame""")
+		interface = HubInterface({}, 1)
+		frame = Frame.Frame(Frame.Frame.PING, Frame.Frame.PCEPS, 2, 1)
+
+		message, = interface.decode(frame.to_bytes(), ("hub", 2))
+
+		self.assertEqual(message.get(), (Link.Message.PING, ("hub", 2), frame))
+
+	def test_live_parties(self):
+		print("""[prepare_session] picking providers among the live parties""")
+		hub = {}
+		master = Party.Master(1, networkInterface = HubInterface(hub, 1))
+		master.known_parties = list(range(1, 6))
+		now = time.monotonic()
+		for i in range(10):
+			for pid in range(2, 6):
+				# party 5 stopped answering 10 seconds ago
+				master.detector.heartbeat(pid, now = now - 20 + i if pid == 5 else now - 9 + i)
+
+		self.assertEqual(master.get_live_parties(), [1, 2, 3, 4])
+		for _ in range(20):
+			session = master.prepare_session()
+			self.assertNotIn(5, session.circuit.get_input_ids())
+			master.clean(session)
+
+
+class TestMessageQueue(unittest.TestCase):
+	@classmethod
+	def setUpClass(self):
+		print("""Launching MessageQueue class test...""")
+
+	@classmethod
+	def setUp(self):
+		print("""\tLaunching new test:""", end=" ")
+
+	@classmethod
+	def tearDown(self):
+		print("""\tTest done.""")
+
+	@classmethod
+	def tearDownClass(self):
+		print("""MessageQueue class test done.""")
+
+	def test_put_get(self):
+		print("""[put] and [get]""")
+		q = Link.MessageQueue(4)
+		message = Link.Message(Link.Message.PING, 1, "test")
+
+		q.put(message)
+		result = q.get(timeout = 0)
+
+		self.assertEqual(result, message)
+
+	def test_get_empty(self):
+		print("""[get] on empty queue""")
+		q = Link.MessageQueue(4)
+
+		result = q.get(timeout = 0)
+
+		self.assertEqual(result, None)
+
+	def test_stats(self):
+		print("""[get_stats] after overflow""")
+		q = Link.MessageQueue(2)
+		for i in range(5):
+			q.put(Link.Message(Link.Message.PING, 1, i))
+		q.get()
+		expected = {"depth": 1, "high_water": 2, "received": 5, "dropped": 3}
+
+		result = q.get_stats()
+
+		self.assertEqual(result, expected)
+
+	def test_put_batch(self):
+		print("""[put_batch] with overflow""")
+		q = Link.MessageQueue(3)
+		messages = [Link.Message(Link.Message.PING, 1, i) for i in range(5)]
+
+		result = q.put_batch(messages)
+
+		self.assertEqual(result, 2)
+		self.assertEqual([q.get(timeout = 0) for _ in range(3)], messages[:3])
+
+
+class TestNetworkInterfaceBatch(unittest.TestCase):
+	@classmethod
+	def setUpClass(self):
+		print("""Launching NetworkInterface batch receiving test...""")
+
+	@classmethod
+	def setUp(self):
+		print("""\tLaunching new test:""", end=" ")
+
+	@classmethod
+	def tearDown(self):
+		print("""\tTest done.""")
+
+	@classmethod
+	def tearDownClass(self):
+		print("""NetworkInterface batch receiving test done.""")
+
+	def test_drain(self):
+		print("""[drain] several pending datagrams""")
+		ni = Link.NetworkInterface("127.0.0.1", 0, batch_size = 4)
+		ni.bind()
+		sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+		for i in range(6):
+			sender.sendto(bytes([i]), ni.s.getsockname())
+		time.sleep(0.1)
+
+		first = ni.drain(timeout = 1)
+		second = ni.drain(timeout = 1)
+		third = ni.drain(timeout = 0)
+		sender.close()
+		ni.s.close()
+
+		self.assertEqual([b for b, _ in first + second], [bytes([i]) for i in range(6)])
+		self.assertEqual((len(first), len(second), third), (4, 2, []))
+		self.assertEqual(ni.get_stats()["max_batch"], 4)
+		self.assertEqual(ni.get_stats()["datagrams"], 6)
+
+	def test_drain_truncated(self):
+		print("""[drain] dropping the datagrams larger than their buffer""")
+		for ancillary in (True, False):
+			ni = Link.NetworkInterface("127.0.0.1", 0, buffer_size = 16)
+			if not ancillary:
+				ni.ancillary_size = 0
+			ni.bind()
+			sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+			for data in (bytes(15), bytes(16), bytes(100), bytes(3)):
+				sender.sendto(data, ni.s.getsockname())
+			time.sleep(0.1)
+
+			batch = ni.drain(timeout = 1)
+			sender.close()
+			ni.s.close()
+
+			# without the flags of recvmsg, a datagram filling its buffer may have been truncated
+			expected = [bytes(15), bytes(16), bytes(3)] if ancillary else [bytes(15), bytes(3)]
+			self.assertEqual([b for b, _ in batch], expected)
+			self.assertEqual(ni.get_stats()["truncated"], 4 - len(expected))
+
+	def test_deliver_batch(self):
+		print("""[deliver_batch] with an undecodable datagram""")
+		ni = Link.NetworkInterface()
+		ni.s.close()
+		received = []
+		ni.set_batch_handler(received.append)
+		message = Link.Message(Link.Message.FRAME, 1, Frame.Frame(Frame.Frame.ADVERT, Frame.Frame.PCEPS, 2, 2))
+
+		ni.deliver_batch([(message.to_bytes(), ("127.0.0.1", 5005)), (b"\xff\xff", ("127.0.0.1", 5005))])
+
+		self.assertEqual(len(received), 1)
+		self.assertEqual(len(received[0]), 1)
+		self.assertEqual(ni.get_stats()["decode_errors"], 1)
+
+	def test_bind(self):
+		print("""[bind] on a port chosen by the system""")
+		ni = Link.NetworkInterface("127.0.0.1", 0)
+
+		ni.bind()
+		result = ni.get_addr()
+		expected = ni.s.getsockname()
+		ni.s.close()
+
+		self.assertEqual(result, expected)
+		self.assertNotEqual(result[1], 0)
+
+	def test_broadcast_multicast(self):
+		print("""[broadcast] to a multicast group shared by two parties of the host""")
+		group = ("239.255.77.1", 50505)
+		ni1 = Link.NetworkInterface("127.0.0.1", 0, multicast_group = group, multicast_interface = "127.0.0.1")
+		ni2 = Link.NetworkInterface("127.0.0.1", 0, multicast_group = group, multicast_interface = "127.0.0.1")
+		ni1.bind()
+		ni2.bind()
+		frame = Frame.Frame(Frame.Frame.ADVERT, Frame.Frame.PCEPS, 1, 1)
+
+		ni1.broadcast(Link.Message(Link.Message.FRAME, ni1.get_addr(), frame))
+		result = ni2.drain(timeout = 1)
+		for ni in (ni1, ni2):
+			ni.s.close()
+			ni.m.close()
+
+		self.assertEqual(result, [(frame.to_bytes(), ni1.get_addr())])
+
+	def test_multicast_port(self):
+		print("""[NetworkInterface] Value Error when bound to the port of its multicast group""")
+		result = lambda: Link.NetworkInterface("127.0.0.1", 50505, multicast_group = ("239.255.77.1", 50505), multicast_interface = "127.0.0.1")
+		expected = ValueError
+		self.assertRaises(expected, result)
+
+
+class RecordingInterface(Link.Interface):
+	"""
+	Interface keeping the sent messages, by destination (None for broadcast).
+	"""
+	def __init__(self):
+		super(RecordingInterface, self).__init__("127.0.0.1", 5005)
+		self.sent = []
+
+	def start(self):
+		pass
+
+	def broadcast(self, message):
+		self.sent.append((None, message))
+
+	def send_to(self, to_pid, message):
+		self.sent.append((to_pid, message))
+
+
+class TestCoalescer(unittest.TestCase):
+	@classmethod
+	def setUpClass(self):
+		print("""Launching Coalescer class test...""")
+
+	@classmethod
+	def setUp(self):
+		print("""\tLaunching new test:""", end=" ")
+
+	@classmethod
+	def tearDown(self):
+		print("""\tTest done.""")
+
+	@classmethod
+	def tearDownClass(self):
+		print("""Coalescer class test done.""")
+
+	def make_message(self, payload):
+		frame = Frame.Frame(Frame.Frame.SHARE, Frame.Frame.PCEPS, 1, payload, session = 1)
+		return Link.Message(Link.Message.FRAME, ("127.0.0.1", 5005), frame)
+
+	def test_flush(self):
+		print("""[flush] packs the frames of each destination""")
+		interface = RecordingInterface()
+		outbound = Link.Coalescer(interface, schedule = lambda delay, callback: None)
+		for i in range(3):
+			outbound.send_to(2, self.make_message(i))
+		outbound.send_to(3, self.make_message(5))
+
+		outbound.flush()
+
+		self.assertEqual([pid for pid, _ in interface.sent], [2, 3])
+		self.assertEqual(interface.sent[0][1].content.get_type(), Frame.Frame.CONTAINER)
+		self.assertEqual([m.content.get_payload() for m in interface.decode(interface.sent[0][1].to_bytes(), ("127.0.0.1", 5005))], [0, 1, 2])
+		self.assertEqual(interface.sent[1][1], self.make_message(5))
+		self.assertEqual(outbound.get_stats(), {"frames": 4, "datagrams": 2})
+
+	def test_mtu(self):
+		print("""[send_to] flushes full datagrams""")
+		interface = RecordingInterface()
+		outbound = Link.Coalescer(interface, mtu = 64, schedule = lambda delay, callback: None)
+		for i in range(20):
+			outbound.send_to(2, self.make_message(2**31 + i))
+		outbound.flush()
+
+		sizes = [len(message.to_bytes()) for _, message in interface.sent]
+		frames = sum(len(interface.decode(message.to_bytes(), None)) for _, message in interface.sent)
+
+		self.assertTrue(max(sizes) <= 64)
+		self.assertEqual(frames, 20)
+
+	def test_deadline(self):
+		print("""[send_to] flushes after the delay""")
+		interface = RecordingInterface()
+		outbound = Link.Coalescer(interface, delay = 0.01)
+		outbound.broadcast(self.make_message(1))
+		outbound.broadcast(self.make_message(2))
+
+		time.sleep(0.2)
+
+		self.assertEqual(len(interface.sent), 1)
+
+
+class TestPartyRuntime(unittest.TestCase):
+	@classmethod
+	def setUpClass(self):
+		print("""Launching threaded Party runtime test...""")
+
+	@classmethod
+	def setUp(self):
+		print("""\tLaunching new test:""", end=" ")
+
+	@classmethod
+	def tearDown(self):
+		print("""\tTest done.""")
+
+	@classmethod
+	def tearDownClass(self):
+		print("""Threaded Party runtime test done.""")
+
+	def make_parties(self, version, n = 4, make_interface = HubInterface):
+		hub = {}
+		master = Party.Master(1, version = version, networkInterface = make_interface(hub, 1))
+		parties = [master] + [Party.Party(pid, networkInterface = make_interface(hub, pid)) for pid in range(2, n+1)]
+		for party in parties:
+			party.timeout = 5
+			party.state = Party.Party.AWAITING
+			party.known_parties = list(range(1, n+1))
+			for pid in range(1, n+1):
+				party.networkInterface.set_party(pid, ("hub", pid))
+
+		return parties
+
+	def run_computation(self, version, make_interface = HubInterface):
+		master = self.make_parties(version, make_interface = make_interface)[0]
+		session = master.prepare_session()
+		master.send_request(session)
+		master.run_session(session)
+
+		return session.final_result
+
+	def test_run_PCEPS(self):
+		print("""[run_session] with PCEPS""")
+		result = self.run_computation(Frame.Frame.PCEPS)
+
+		self.assertTrue(15 <= result <= 25)
+
+	def test_run_PCEAS(self):
+		print("""[run_session] with PCEAS""")
+		result = self.run_computation(Frame.Frame.PCEAS)
+
+		self.assertTrue(15 <= result <= 25)
+
+	def test_reconstruct_threshold(self):
+		print("""[reconstruct] from the first k results, checking the other ones""")
+		master = Party.Master(1, networkInterface = HubInterface({}, 1))
+		session = Party.Session(1)
+		session.k = 2
+		session.prime_p = 31
+		# f(x) = 5 + 3x
+		session.results = {1: 8, 3: 14, 2: 11}
+
+		self.assertTrue(master.has_results(session))
+		self.assertEqual(master.reconstruct(session), 5/2)
+		self.assertTrue(session.consistent)
+
+		session.results[2] = 12
+		master.reconstruct(session)
+		self.assertEqual(session.final_result, 5/2)
+		self.assertFalse(session.consistent)
+
+	def test_run_silent_party(self):
+		print("""[run_session] without waiting for a party that never answers""")
+		parties = self.make_parties(Frame.Frame.PCEPS, n = 5)
+		master = parties[0]
+		session = master.prepare_session()
+		silent = [p for p in parties[1:] if p.party_id not in session.circuit.get_input_ids()][0]
+		# the party takes part in the computation but never sends its result
+		silent.send_result = lambda session, result: None
+		master.send_request(session)
+		begin = time.monotonic()
+		master.run_session(session)
+
+		self.assertLess(time.monotonic() - begin, master.timeout)
+		self.assertTrue(15 <= session.final_result <= 25)
+
+	def test_run_late_result(self):
+		print("""[run_session] checking a result received after the reconstruction""")
+		parties = self.make_parties(Frame.Frame.PCEPS, n = 5)
+		master = parties[0]
+		session = master.prepare_session()
+		late = parties[-1]
+		held = []
+		late.send_result = lambda session, result: held.append((session, result))
+		master.send_request(session)
+		master.run_session(session)
+
+		self.assertTrue(15 <= session.final_result <= 25)
+		self.assertNotIn(late.party_id, session.results)
+		self.assertTrue(session.consistent)
+		# the session is closed, the result is still checked
+		late_session, result = held[0]
+		Party.Party.send_result(late, late_session, (result + 1) % session.prime_p)
+		late.outbound.flush()
+
+		self.assertTrue(master.wait(lambda: late.party_id in session.results, master.timeout))
+		self.assertFalse(session.consistent)
+
+	def test_run_adaptive_timeout(self):
+		print("""[run_session] failing as soon as an input party is late by its observed timing""")
+		parties = self.make_parties(Frame.Frame.PCEPS, n = 5)
+		master = parties[0]
+		master.min_timeout = 0.1
+		for pid in range(2, 6):
+			master.timeouts.observe(Timeout.INPUT, pid, 0.01)
+		session = master.prepare_session()
+		late = [p for p in parties[1:] if p.party_id in session.circuit.get_input_ids()][0]
+		late.share_inputs = lambda session: None
+		master.send_request(session)
+		begin = time.monotonic()
+		master.run_session(session)
+
+		self.assertLess(time.monotonic() - begin, 1)
+		self.assertIsNone(session.final_result)
+		# backed off for the next computation
+		self.assertGreaterEqual(master.timeouts.get(Timeout.INPUT, late.party_id), 0.2)
+
+	def test_frames_before_request(self):
+		print("""[on_recv] frames received before the request of their session are handled with it""")
+		master, party = self.make_parties(Frame.Frame.PCEPS)[:2]
+		party.start_session = lambda session: None
+		session = master.prepare_session()
+		share = Frame.Frame(Frame.Frame.SHARE, Frame.Frame.PCEPS, 3, 42, session = session.session_id)
+		party.on_recv(Link.Message(Link.Message.FRAME, ("hub", 3), share))
+		request = Frame.Frame(Frame.Frame.REQUEST, Frame.Frame.PCEPS, 1, (session.prime_p, session.circuit), session = session.session_id)
+		party.on_recv(Link.Message(Link.Message.FRAME, ("hub", 1), request))
+		opened = party.get_session(session.session_id)
+
+		self.assertEqual(opened.state, Party.Party.COMP)
+		self.assertEqual(opened.k, session.k)
+		self.assertEqual(opened.shares, {3: 42})
+		self.assertEqual(party.sessions.pending, {})
+
+	def test_run_restarted_master(self):
+		print("""[compute] by a restarted Master, whose session ids the parties have not seen yet""")
+		parties = self.make_parties(Frame.Frame.PCEPS)
+		hub = parties[0].networkInterface.hub
+		first = parties[0].compute()
+		interface = HubInterface({}, 1)
+		master = Party.Master(1, networkInterface = interface)
+		# the new run joins the network once ready, late frames of the former run may still be on their way
+		interface.hub = hub
+		hub[interface.get_addr()] = interface
+		master.timeout = 5
+		master.state = Party.Party.AWAITING
+		master.known_parties = list(range(1, 5))
+		for pid in range(1, 5):
+			master.networkInterface.set_party(pid, ("hub", pid))
+
+		second = master.compute()
+
+		self.assertTrue(15 <= first <= 25)
+		self.assertTrue(15 <= second <= 25)
+
+	def test_run_concurrent(self):
+		print("""[compute] several computations at the same time""")
+		master = self.make_parties(Frame.Frame.PCEAS)[0]
+		futures = [master.workers.submit(master.compute) for _ in range(4)]
+		results = [future.result() for future in futures]
+
+		self.assertTrue(all(15 <= result <= 25 for result in results))
+		self.assertEqual(len(master.sessions), 0)
+		first = min(master.sessions.finished)
+		self.assertEqual(sorted(master.sessions.finished), list(range(first, first + 4)))
+
+	def test_scheduler(self):
+		print("""[submit] computations with their participants, selection policy or circuit""")
+		master = self.make_parties(Frame.Frame.PCEPS, n = 5)[0]
+		circuit = Crypto.Circuit()
+		gate = Crypto.Gate(Crypto.Gate.ADD)
+		gate.set_inputs([Crypto.Gate(Crypto.Gate.SHARE, value = 2), Crypto.Gate(Crypto.Gate.SHARE, value = 3)])
+		circuit.add_gate(gate)
+		futures = [master.submit(participants = [2, 3, 4]), master.submit(select = lambda live: live[-2:], priority = 1), master.submit(circuit = circuit)]
+		outcomes = [future.result(timeout = 10) for future in futures]
+
+		self.assertEqual(outcomes[0].inputs, [2, 3, 4])
+		self.assertEqual(outcomes[1].inputs, [4, 5])
+		self.assertTrue(all(15 <= outcome.result <= 25 for outcome in outcomes[:2]))
+		# sum of the inputs
+		self.assertTrue(30 <= outcomes[2].result <= 50)
+		self.assertEqual(sorted(outcomes[0].timings), ["input", "queued", "result", "setup", "total"])
+		self.assertTrue(all(t >= 0 for outcome in outcomes for t in outcome.timings.values()))
+		# the circuit of the caller is not modified
+		self.assertEqual(circuit.get_input_ids(), [2, 3])
+
+	def test_scheduler_master_input(self):
+		print("""[submit] computations the Master is an input party of""")
+		master = self.make_parties(Frame.Frame.PCEAS)[0]
+		futures = [master.submit(participants = [1, 2, 3]), master.submit(select = lambda live: live[:2])]
+		outcomes = [future.result(timeout = 10) for future in futures]
+
+		self.assertEqual([outcome.inputs for outcome in outcomes], [[1, 2, 3], [1, 2]])
+		self.assertEqual([outcome.dropped for outcome in outcomes], [[], []])
+		self.assertTrue(all(15 <= outcome.result <= 25 for outcome in outcomes))
+		self.assertTrue(all(outcome.timings["total"] < master.min_timeout for outcome in outcomes))
+		# the threshold would be the number of parties
+		self.assertRaises(Scheduler.ComputationError, master.submit(select = lambda live: live).result, 10)
+
+	def test_scheduler_failures(self):
+		print("""[submit] computations failing or cancelled""")
+		master = self.make_parties(Frame.Frame.PCEPS)[0]
+
+		self.assertRaises(Scheduler.ComputationError, master.submit(participants = [2, 9]).result, 10)
+		self.assertRaises(Scheduler.ComputationError, master.submit(deadline = 0).result, 10)
+		master.scheduler.stop()
+		self.assertRaises(Scheduler.ComputationError, master.submit)
+
+	def test_scheduler_priority(self):
+		print("""[take] requests by priority then submission order""")
+		scheduler = Scheduler.Scheduler(Party.Master(1, networkInterface = HubInterface({}, 1)))
+		low, high, other = [Scheduler.Request(priority = p) for p in (0, 2, 0)]
+		for request in (low, high, other):
+			scheduler.queue.append((-request.priority, next(scheduler.order), request))
+		scheduler.queue.sort()
+
+		self.assertEqual(scheduler.take(2), [high, low])
+		self.assertEqual(scheduler.take(2), [other])
+
+	def make_resumable(self, version):
+		parties = self.make_parties(version, n = 8)
+		master = parties[0]
+		master.min_timeout = 0.1
+		for pid in range(2, 9):
+			master.timeouts.observe(Timeout.INPUT, pid, 0.01)
+		session = master.prepare_session()
+		session.k = 3
+		master.makeCircuit(session)
+		late = [p for p in parties[1:] if p.party_id in session.circuit.get_input_ids()][0]
+
+		return master, session, late
+
+	def test_run_resume(self):
+		print("""[run_session] going on without an input party that never shares""")
+		for version in (Frame.Frame.PCEPS, Frame.Frame.PCEAS):
+			master, session, late = self.make_resumable(version)
+			late.share_inputs = lambda session: None
+			session_id = session.session_id
+			master.send_request(session)
+			begin = time.monotonic()
+			master.run_session(session)
+
+			self.assertLess(time.monotonic() - begin, master.timeout)
+			self.assertEqual(session.dropped, [late.party_id])
+			self.assertNotEqual(session.session_id, session_id)
+			self.assertEqual(len(session.circuit.get_input_ids()), 2)
+			self.assertTrue(15 <= session.final_result <= 25)
+
+	def test_scheduler_resume(self):
+		print("""[submit] a computation going on without an input party that never shares""")
+		parties = self.make_parties(Frame.Frame.PCEPS, n = 8)
+		master = parties[0]
+		master.min_timeout = 0.1
+		for pid in range(2, 9):
+			master.timeouts.observe(Timeout.INPUT, pid, 0.01)
+		parties[1].share_inputs = lambda session: None
+
+		outcome = master.submit(participants = [2, 3, 4]).result(timeout = 10)
+
+		self.assertEqual(outcome.dropped, [2])
+		self.assertNotEqual(outcome.session_id, outcome.final_session_id)
+		self.assertIsNotNone(master.sessions.get_finished(outcome.session_id))
+		# the wait for the late party is part of the input phase
+		self.assertLess(outcome.timings["setup"], master.min_timeout)
+		self.assertGreaterEqual(outcome.timings["input"], master.min_timeout)
+
+	def test_run_resume_sent_results(self):
+		print("""[run_session] results sent with the former circuit computed again after a delta SYNC""")
+		master, session, late = self.make_resumable(Frame.Frame.PCEPS)
+		send_to = late.networkInterface.send_to
+		# the other parties get every share, the Master misses the one of the late party
+		late.networkInterface.send_to = lambda to_pid, message: None if to_pid == 1 else send_to(to_pid, message)
+		master.send_request(session)
+		master.run_session(session)
+
+		self.assertEqual(session.dropped, [late.party_id])
+		self.assertTrue(15 <= session.final_result <= 25)
+		self.assertTrue(session.consistent)
+
+	def test_stats(self):
+		print("""[get_stats] of the transitions run by the Master""")
+		master = self.make_parties(Frame.Frame.PCEAS)[0]
+		session = master.prepare_session()
+		master.send_request(session)
+		master.run_session(session)
+		stats = master.get_stats()
+
+		# the Master reconstructs as soon as it has k results, its own included
+		self.assertGreaterEqual(stats["session"][(Party.Party.COMP, Frame.Frame.RESULT, Frame.Frame.PCEAS)]["count"], session.k - 1)
+		self.assertEqual(stats["party"][(Party.Party.AWAITING, Frame.Frame.SHARE, Frame.Frame.PCEAS)]["count"], len([p for p in session.circuit.get_input_ids() if p != 1]))
+
+	def test_run_PCEAS_multicast(self):
+		print("""[run_session] with PCEAS over UDP, broadcasting to a multicast group""")
+		group = ("239.255.77.2", 50506)
+		interfaces = {pid: Link.NetworkInterface("127.0.0.1", 0, multicast_group = group, multicast_interface = "127.0.0.1") for pid in range(1, 5)}
+		for interface in interfaces.values():
+			interface.bind()
+		make_interface = lambda hub, pid: interfaces[pid]
+		master = self.make_parties(Frame.Frame.PCEAS, make_interface = make_interface)[0]
+		for interface in interfaces.values():
+			for pid in interfaces:
+				interface.membership.forget(pid)
+				interface.set_party(pid, interfaces[pid].get_addr())
+			interface.start()
+
+		try:
+			session = master.prepare_session()
+			master.send_request(session)
+			master.run_session(session)
+		finally:
+			for interface in interfaces.values():
+				interface.stop()
+
+		self.assertTrue(15 <= session.final_result <= 25)
+
+	def test_wait(self):
+		print("""[wait] woken up by a received frame""")
+		hub = {}
+		party = Party.Party(2, networkInterface = HubInterface(hub, 2))
+		sender = HubInterface(hub, 1)
+		sender.set_recv_handler(lambda message: None)
+		party.state = Party.Party.AWAITING
+		frame = Frame.Frame(Frame.Frame.ADVERT, Frame.Frame.PCEPS, 1, 1)
+		threading.Timer(0.1, lambda: sender.broadcast(Link.Message(Link.Message.FRAME, sender.get_addr(), frame))).start()
+
+		begin = time.monotonic()
+		self.assertTrue(party.wait(lambda: 1 in party.known_parties, 5))
+		self.assertLess(time.monotonic() - begin, 1)
+		self.assertFalse(party.wait(lambda: 3 in party.known_parties, 0.05))
+
+	def test_run_stop(self):
+		print("""[run] returning once stopped""")
+		party = Party.Party(2, networkInterface = HubInterface({}, 2))
+		party.timeout = 0.01
+		runner = threading.Thread(target = party.run, daemon = True)
+		runner.start()
+		time.sleep(0.1)
+		party.stop()
+		runner.join(1)
+
+		self.assertFalse(runner.is_alive())
+		self.assertEqual(party.advert_start_count, party.advert_count_threshold)
+
+	def test_run_PCEAS_lossy(self):
+		print("""[run_session] with PCEAS over a lossy network and the reliability layer""")
+		make_interface = lambda hub, pid: Link.ReliableInterface(LossyHubInterface(hub, pid, 3), pid, rto = 0.05)
+		result = self.run_computation(Frame.Frame.PCEAS, make_interface = make_interface)
+
+		self.assertTrue(15 <= result <= 25)
+
+
 if __name__ == '__main__':
 	unittest.main()
\ No newline at end of file
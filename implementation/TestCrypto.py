@@ -45,6 +45,22 @@ class TestCrypto(unittest.TestCase):
 
 		self.assertEqual(result, expected)
 
+	def test_compute_recombination_vector_sparse(self):
+		print("""[compute_recombination_vector] with non consecutive ids""")
+		result = Crypto.compute_recombination_vector([2,5,7], 31)
+		expected = {2:23,5:8,7:1}
+
+		self.assertEqual(result, expected)
+
+	def test_compute_recombination_vector_at(self):
+		print("""[compute_recombination_vector] at another point than 0""")
+		result = Crypto.compute_recombination_vector([1,2], 31, x = 3)
+		expected = {1:30,2:2}
+
+		self.assertEqual(result, expected)
+		# f(x) = 5 + 3x
+		self.assertEqual(Crypto.compute_MPC_result(result, {1:8,2:11}, 31), 14)
+
 	def test_compute_MPC_result(self):
 		print(f"""[compute_MPC_result]""")
 		import random
@@ -461,6 +477,42 @@ class TestCircuit(unittest.TestCase):
 
 		self.assertRaises(expected, result)
 
+	def test_compact_bytes(self):
+		print("""[to_compact_bytes] and [from_compact_bytes]""")
+		circuit = Crypto.Circuit()
+
+		a = Crypto.Gate(Crypto.Gate.SHARE, value = 1)
+		b = Crypto.Gate(Crypto.Gate.SHARE, value = 2)
+
+		gate1 = Crypto.Gate(Crypto.Gate.ADD)
+		gate1.set_inputs([a, b])
+
+		gate2 = Crypto.Gate(Crypto.Gate.CMUL, value = 2)
+		gate2.set_inputs([Crypto.Gate(Crypto.Gate.SHARE, value = 2)])
+
+		gate = Crypto.Gate(Crypto.Gate.MUL)
+		gate.set_inputs([gate1, gate2])
+
+		circuit.add_gate(gate1)
+		circuit.add_gate(gate2)
+		circuit.add_gate(gate)
+
+		expected = b"\x02\x01\x01\x03\x00\x00\x00\x02\x02\x02\x01\x03\x01"
+
+		result = circuit.to_compact_bytes()
+
+		self.assertEqual(result, expected)
+		self.assertEqual(Crypto.Circuit.from_compact_bytes(result), circuit)
+
+	def test_from_compact_bytes_error(self):
+		print("""[from_compact_bytes] with a reference to an unknown wire""")
+		b = b"\x01\x01\x01\x00\x01\x05"
+
+		result = lambda: Crypto.Circuit.from_compact_bytes(b)
+		expected = Crypto.CircuitTranslationError
+
+		self.assertRaises(expected, result)
+
 	def test_get_input_ids(self):
 		print("""[get_input_ids]""")
 		expected = [1,2]
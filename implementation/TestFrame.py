@@ -2,9 +2,11 @@
 #encoding: utf-8
 
 from core.Frame import *
+from core import Frame as FrameModule
 
 from core import Crypto
 
+import benchmark
 import unittest
 
 
@@ -27,8 +29,8 @@ class TestFrame(unittest.TestCase):
 
 	def test_eq(self):
 		print("""comparison between 2 identical frames""")
-		frame1 = Frame(0,1,2)
-		frame2 = Frame(0,1,2)
+		frame1 = Frame(0,1,2,3)
+		frame2 = Frame(0,1,2,3)
 
 		result = frame1 == frame2
 
@@ -36,8 +38,8 @@ class TestFrame(unittest.TestCase):
 
 	def test_eq_bad(self):
 		print("""comparison between 2 different frames""")
-		frame1 = Frame(0,1,2)
-		frame2 = Frame(0,1,1)
+		frame1 = Frame(0,1,2,3)
+		frame2 = Frame(0,1,2,1)
 
 		result = frame1 == frame2
 
@@ -45,8 +47,8 @@ class TestFrame(unittest.TestCase):
 
 	def test_eq_not(self):
 		print("""difference between 2 different frames""")
-		frame1 = Frame(0,1,2)
-		frame2 = Frame(0,1,1)
+		frame1 = Frame(0,1,2,3)
+		frame2 = Frame(0,1,2,1)
 
 		result = frame1 != frame2
 
@@ -54,7 +56,7 @@ class TestFrame(unittest.TestCase):
 
 	def test_eq_other_type(self):
 		print("""comparison between frame and another object of another type""")
-		frame1 = Frame(0,1,2)
+		frame1 = Frame(0,1,2,3)
 		frame2 = 1
 
 		result = frame1 == frame2
@@ -63,8 +65,8 @@ class TestFrame(unittest.TestCase):
 
 	def test_from_bytes_ADVERT(self):
 		print("""[from_bytes] for 0x0 type messages""")
-		frame = b"\x00\x01\x01"
-		expected = Frame(0,0,1)
+		frame = b"\x00\x01\x02\x01\x00\x01\x01"
+		expected = Frame(0,0,2,1)
 
 		result = Frame.from_bytes(frame)
 
@@ -72,8 +74,8 @@ class TestFrame(unittest.TestCase):
 
 	def test_from_bytes_SHARE(self):
 		print("""[from_bytes] for 0x1 type messages""")
-		frame = b"\x10\x01\x01"
-		expected = Frame(1,0,1)
+		frame = b"\x10\x01\x02\x01\x00\x01\x01"
+		expected = Frame(1,0,2,1)
 
 		result = Frame.from_bytes(frame)
 
@@ -81,8 +83,8 @@ class TestFrame(unittest.TestCase):
 
 	def test_from_bytes_MUL(self):
 		print("""[from_bytes] for 0x2 type messages""")
-		frame = b"\x20\x01\x01"
-		expected = Frame(2,0,1)
+		frame = b"\x20\x01\x02\x01\x00\x01\x01"
+		expected = Frame(2,0,2,1)
 
 		result = Frame.from_bytes(frame)
 
@@ -90,8 +92,8 @@ class TestFrame(unittest.TestCase):
 
 	def test_from_bytes_RESULT(self):
 		print("""[from_bytes] for 0x3 type messages""")
-		frame = b"\x30\x01\x01"
-		expected = Frame(3,0,1)
+		frame = b"\x30\x01\x02\x01\x00\x01\x01"
+		expected = Frame(3,0,2,1)
 
 		result = Frame.from_bytes(frame)
 
@@ -99,7 +101,7 @@ class TestFrame(unittest.TestCase):
 
 	def test_from_bytes_SYNC(self):
 		print("""[from_bytes] for 0x4 type messages""")
-		frame = b"\x40\x11\x02\x01\x07\x11\x10\x00\x01\x01\x00\x01\x02\x12\x01\x02\x00\x01\x02"
+		frame = b"\x40\x01\x01\x01\x00\x11\x02\x01\x07\x11\x10\x00\x01\x01\x00\x01\x02\x12\x01\x02\x00\x01\x02"
 		circuit = Crypto.Circuit()
 
 		a = Crypto.Gate(Crypto.Gate.SHARE, value = 1)
@@ -121,7 +123,7 @@ class TestFrame(unittest.TestCase):
 		circuit.add_gate(gate2)
 		circuit.add_gate(gate)
 
-		expected = Frame(4,0,(263, circuit))
+		expected = Frame(4,0,1,(263, circuit))
 
 		result = Frame.from_bytes(frame)
 
@@ -129,8 +131,12 @@ class TestFrame(unittest.TestCase):
 
 	def test_from_bytes_REQUEST(self):
 		print("""[from_bytes] for 0x5 type messages""")
-		frame = b"\x50\x01\x01"
-		expected = Frame(5,0,1)
+		frame = b"\x50\x01\x02\x01\x01\x0b\x02\x01\x07\xc0\x02\x01\x01\x01\x00\x00\x00"
+		circuit = Crypto.Circuit()
+		gate = Crypto.Gate(Crypto.Gate.ADD)
+		gate.set_inputs([Crypto.Gate(Crypto.Gate.SHARE, value = 1), Crypto.Gate(Crypto.Gate.SHARE, value = 2)])
+		circuit.add_gate(gate)
+		expected = Frame(5,0,2,(263, circuit),session=1)
 
 		result = Frame.from_bytes(frame)
 
@@ -138,8 +144,8 @@ class TestFrame(unittest.TestCase):
 
 	def test_from_bytes_LEAVE(self):
 		print("""[from_bytes] for 0x6 type messages""")
-		frame = b"\x60\x01\x01"
-		expected = Frame(6,0,1)
+		frame = b"\x60\x01\x02\x01\x00\x01\x01"
+		expected = Frame(6,0,2,1)
 
 		result = Frame.from_bytes(frame)
 
@@ -147,8 +153,8 @@ class TestFrame(unittest.TestCase):
 
 	def test_from_bytes_BVECT(self):
 		print("""[from_bytes] for 0x7 type messages""")
-		frame = b"\x71\x09\x01\x40\x02\x04\x00\x01\x0c\x01\x69"
-		expected = Frame(7,1,[64, 1024, 12, 105])
+		frame = b"\x71\x01\x01\x01\x00\x09\x01\x40\x02\x04\x00\x01\x0c\x01\x69"
+		expected = Frame(7,1,1,[64, 1024, 12, 105])
 
 		result = Frame.from_bytes(frame)
 
@@ -156,8 +162,8 @@ class TestFrame(unittest.TestCase):
 
 	def test_from_bytes_MALICIOUS(self):
 		print("""[from_bytes] for 0x8 type messages""")
-		frame = b"\x81\x09\x01\x40\x02\x04\x00\x01\x0c\x01\x69"
-		expected = Frame(8,1,[64, 1024, 12, 105])
+		frame = b"\x81\x01\x01\x01\x00\x09\x01\x40\x02\x04\x00\x01\x0c\x01\x69"
+		expected = Frame(8,1,1,[64, 1024, 12, 105])
 
 		result = Frame.from_bytes(frame)
 
@@ -172,15 +178,15 @@ class TestFrame(unittest.TestCase):
 
 	def test_from_bytes_UnknownType(self):
 		print("""[from_bytes] Unknown Type Exception""")
-		frame = b"\x70\x01\x01"
+		frame = b"\x70\x01\x01\x01\x00\x01\x01"
 		result = lambda: Frame.from_bytes(frame)
 		expected = UnknownTypeException
 		self.assertRaises(expected, result)
 
 	def test_to_bytes_ADVERT(self):
 		print("""[to_bytes] for 0x0 type messages""")
-		expected = b"\x00\x01\x01"
-		frame = Frame(0,0,1)
+		expected = b"\x00\x01\x02\x01\x00\x01\x01"
+		frame = Frame(0,0,2,1)
 
 		result = frame.to_bytes()
 
@@ -188,8 +194,8 @@ class TestFrame(unittest.TestCase):
 
 	def test_to_bytes_SHARE(self):
 		print("""[to_bytes] for 0x1 type messages""")
-		expected = b"\x10\x01\x01"
-		frame = Frame(1,0,1)
+		expected = b"\x10\x01\x02\x01\x00\x01\x01"
+		frame = Frame(1,0,2,1)
 
 		result = frame.to_bytes()
 
@@ -197,8 +203,8 @@ class TestFrame(unittest.TestCase):
 
 	def test_to_bytes_MUL(self):
 		print("""[to_bytes] for 0x2 type messages""")
-		expected = b"\x20\x01\x01"
-		frame = Frame(2,0,1)
+		expected = b"\x20\x01\x02\x01\x00\x01\x01"
+		frame = Frame(2,0,2,1)
 
 		result = frame.to_bytes()
 
@@ -206,8 +212,8 @@ class TestFrame(unittest.TestCase):
 
 	def test_to_bytes_RESULT(self):
 		print("""[to_bytes] for 0x3 type messages""")
-		expected = b"\x30\x01\x01"
-		frame = Frame(3,0,1)
+		expected = b"\x30\x01\x02\x01\x00\x01\x01"
+		frame = Frame(3,0,2,1)
 
 		result = frame.to_bytes()
 
@@ -215,7 +221,7 @@ class TestFrame(unittest.TestCase):
 
 	def test_to_bytes_SYNC(self):
 		print("""[to_bytes] for 0x4 type messages""")
-		expected = b"\x40\x11\x02\x01\x07\x11\x10\x00\x01\x01\x00\x01\x02\x12\x01\x02\x00\x01\x02"
+		expected = b"\x40\x01\x01\x01\x00\x11\x02\x01\x07\xc0\x02\x01\x01\x03\x00\x00\x00\x02\x02\x02\x01\x03\x01"
 		circuit = Crypto.Circuit()
 
 		a = Crypto.Gate(Crypto.Gate.SHARE, value = 1)
@@ -237,16 +243,38 @@ class TestFrame(unittest.TestCase):
 		circuit.add_gate(gate2)
 		circuit.add_gate(gate)
 
-		frame = Frame(4,0,(263,circuit))
+		frame = Frame(4,0,1,(263,circuit))
 
 		result = frame.to_bytes()
 
 		self.assertEqual(result, expected)
 
+	def test_SYNC_large_circuit(self):
+		print("""[to_bytes] and [from_bytes] for 0x4 type messages with a large circuit""")
+		circuit = Crypto.Circuit()
+		previous_gate = Crypto.Gate(Crypto.Gate.SHARE, value = 1)
+		for i in range(2, 301):
+			gate = Crypto.Gate(Crypto.Gate.ADD)
+			gate.set_inputs([previous_gate, Crypto.Gate(Crypto.Gate.SHARE, value = i)])
+			circuit.add_gate(gate)
+			previous_gate = gate
+
+		frame = Frame(4,1,1,(263, 257, circuit))
+
+		encoded = frame.to_bytes()
+		result = Frame.from_bytes(encoded)
+
+		self.assertEqual(result, frame)
+		self.assertLess(len(encoded), len(circuit.to_bytes())//4)
+
 	def test_to_bytes_REQUEST(self):
 		print("""[to_bytes] for 0x5 type messages""")
-		expected = b"\x50\x01\x01"
-		frame = Frame(5,0,1)
+		expected = b"\x50\x01\x02\x01\x01\x0b\x02\x01\x07\xc0\x02\x01\x01\x01\x00\x00\x00"
+		circuit = Crypto.Circuit()
+		gate = Crypto.Gate(Crypto.Gate.ADD)
+		gate.set_inputs([Crypto.Gate(Crypto.Gate.SHARE, value = 1), Crypto.Gate(Crypto.Gate.SHARE, value = 2)])
+		circuit.add_gate(gate)
+		frame = Frame(5,0,2,(263, circuit),session=1)
 
 		result = frame.to_bytes()
 
@@ -254,8 +282,8 @@ class TestFrame(unittest.TestCase):
 
 	def test_to_bytes_LEAVE(self):
 		print("""[to_bytes] for 0x6 type messages""")
-		expected = b"\x60\x01\x01"
-		frame = Frame(6,0,1)
+		expected = b"\x60\x01\x02\x01\x00\x01\x01"
+		frame = Frame(6,0,2,1)
 
 		result = frame.to_bytes()
 
@@ -263,8 +291,8 @@ class TestFrame(unittest.TestCase):
 
 	def test_to_bytes_BVECT(self):
 		print("""[to_bytes] for 0x7 type messages""")
-		expected = b"\x71\x09\x01\x40\x02\x04\x00\x01\x0c\x01\x69"
-		frame = Frame(7,1,[64, 1024, 12, 105])
+		expected = b"\x71\x01\x01\x01\x00\x09\x01\x40\x02\x04\x00\x01\x0c\x01\x69"
+		frame = Frame(7,1,1,[64, 1024, 12, 105])
 
 		result = frame.to_bytes()
 
@@ -272,27 +300,174 @@ class TestFrame(unittest.TestCase):
 
 	def test_to_bytes_MALICIOUS(self):
 		print("""[to_bytes] for 0x8 type messages""")
-		expected = b"\x81\x09\x01\x40\x02\x04\x00\x01\x0c\x01\x69"
-		frame = Frame(8,1,[64, 1024, 12, 105])
+		expected = b"\x81\x01\x01\x01\x00\x09\x01\x40\x02\x04\x00\x01\x0c\x01\x69"
+		frame = Frame(8,1,1,[64, 1024, 12, 105])
+
+		result = frame.to_bytes()
+
+		self.assertEqual(result, expected)
+
+	def test_from_bytes_session(self):
+		print("""[from_bytes] with a session id""")
+		frame = b"\x10\x01\x02\x01\x05\x01\x01"
+		expected = Frame(1,0,2,1,session = 5)
+
+		result = Frame.from_bytes(frame)
+
+		self.assertEqual(result, expected)
+
+	def test_to_bytes_session(self):
+		print("""[to_bytes] with a session id""")
+		expected = b"\x10\x01\x02\x01\x05\x01\x01"
+		frame = Frame(1,0,2,1,session = 5)
 
 		result = frame.to_bytes()
 
 		self.assertEqual(result, expected)
 
+	def test_to_bytes_network_order(self):
+		print("""[to_bytes] with multi-byte values in network byte order""")
+		expected = b"\x10\x02\x01\x02\x01\x05\x04\xb2\xd0\x5d\xff"
+		frame = Frame(1,0,258,2999999999,session = 5)
+
+		result = frame.to_bytes()
+
+		self.assertEqual(result, expected)
+		self.assertEqual(Frame.from_bytes(result), frame)
+
 	def test_to_bytes_UnknownVersion(self):
 		print("""[to_bytes] Unknown Version Exception""")
-		frame = Frame(6,2,1)
+		frame = Frame(6,2,1,1)
 		result = lambda: frame.to_bytes()
 		expected = UnknownVersionException
 		self.assertRaises(expected, result)
 
 	def test_to_bytes_UnknownType(self):
 		print("""[to_bytes] Unknown Type Exception""")
-		frame = Frame(7,0,1)
+		frame = Frame(7,0,1,1)
 		result = lambda: frame.to_bytes()
 		expected = UnknownTypeException
 		self.assertRaises(expected, result)
 
+	def test_get_str_type(self):
+		print("""[get_str_type]""")
+		result = Frame.get_str_type(Frame.MALICIOUS)
+
+		self.assertEqual(result, "MALICIOUS")
+
+	def test_register_codec(self):
+		print("""[register_codec] with a new frame type""")
+		Frame.register_codec(15, 0, lambda payload: payload.encode(), lambda b: b.decode(), name = "TEXT")
+		frame = Frame(15,0,2,"test")
+
+		try:
+			result = Frame.from_bytes(frame.to_bytes())
+		finally:
+			FrameModule.CODECS[15*16] = None
+			del FrameModule.TYPE_NAMES[15]
+
+		self.assertEqual(result, frame)
+
+	def test_from_bytes_truncated(self):
+		print("""[from_bytes] Malformed Frame Exception on truncated payload""")
+		frame = b"\x10\x01\x02\x01\x00\x04\x01"
+		result = lambda: Frame.from_bytes(frame)
+		expected = MalformedFrameException
+		self.assertRaises(expected, result)
+
+	def test_container(self):
+		print("""[to_bytes] and [from_bytes] with a container frame""")
+		frames = [Frame(1,0,2,1,session = 5), Frame(7,1,2,[3,4],session = 5)]
+		expected = b"\x90\x01\x02\x01\x00\x13\x07\x10\x01\x02\x01\x05\x01\x01\x0a\x71\x01\x02\x01\x05\x04\x01\x03\x01\x04"
+		frame = Frame(Frame.CONTAINER,0,2,frames)
+
+		result = frame.to_bytes()
+
+		self.assertEqual(result, expected)
+		self.assertEqual(Frame.from_bytes(result), frame)
+
+	def test_ping(self):
+		print("""[to_bytes] and [from_bytes] with a heartbeat frame""")
+		expected = b"\xc0\x01\x02\x01\x00\x01\x05"
+		frame = Frame(Frame.PING,0,2,5)
+
+		result = frame.to_bytes()
+
+		self.assertEqual(result, expected)
+		self.assertEqual(Frame.from_bytes(result), frame)
+
+	def test_resync(self):
+		print("""[to_bytes] and [from_bytes] with a delta SYNC frame""")
+		expected = b"\xd1\x01\x02\x01\x05\x04\x01\x06\x01\x07"
+		frame = Frame(Frame.RESYNC,1,2,[6,7],session=5)
+
+		result = frame.to_bytes()
+
+		self.assertEqual(result, expected)
+		self.assertEqual(Frame.from_bytes(result), frame)
+
+	def test_container_nested(self):
+		print("""[from_bytes] Malformed Frame Exception on nested container""")
+		inner = Frame(Frame.CONTAINER,0,2,[Frame(1,0,2,1)]).to_bytes()
+		frame = Frame(Frame.CONTAINER,0,2,[inner]).to_bytes()
+		result = lambda: Frame.from_bytes(frame)
+		expected = MalformedFrameException
+		self.assertRaises(expected, result)
+
+	def test_container_reliable(self):
+		print("""[from_bytes] Malformed Frame Exception on reliable frames nested in containers""")
+		frame = Frame(1,0,2,1).to_bytes()
+		for _ in range(5000):
+			frame = Frame(Frame.RELIABLE,0,2,(9,3,2,Frame(Frame.CONTAINER,0,2,[frame]).to_bytes())).to_bytes()
+		result = lambda: Frame.from_bytes(frame)
+		expected = MalformedFrameException
+		self.assertRaises(expected, result)
+
+	def test_reliable(self):
+		print("""[to_bytes] and [from_bytes] with a reliable frame""")
+		expected = b"\xa0\x01\x02\x01\x05\x0d\x01\x09\x01\x03\x01\x02\x10\x01\x02\x01\x05\x01\x01"
+		frame = Frame(Frame.RELIABLE,0,2,(9,3,2,Frame(1,0,2,1,session = 5)),session = 5)
+
+		result = frame.to_bytes()
+
+		self.assertEqual(result, expected)
+		self.assertEqual(Frame.from_bytes(result), frame)
+
+	def test_reliable_base(self):
+		print("""[to_bytes] and [from_bytes] with a reliable frame announcing its base only""")
+		expected = b"\xa0\x01\x02\x01\x00\x06\x01\x09\x01\x00\x01\x04"
+		frame = Frame(Frame.RELIABLE,0,2,(9,0,4,None))
+
+		result = frame.to_bytes()
+
+		self.assertEqual(result, expected)
+		self.assertEqual(Frame.from_bytes(result), frame)
+
+	def test_reliable_nested(self):
+		print("""[from_bytes] Malformed Frame Exception on nested reliable frame""")
+		inner = Frame(Frame.ACK,0,2,[1,1]).to_bytes()
+		frame = Frame(Frame.RELIABLE,0,2,(9,3,2,inner)).to_bytes()
+		result = lambda: Frame.from_bytes(frame)
+		expected = MalformedFrameException
+		self.assertRaises(expected, result)
+
+
+class TestFrameFuzz(unittest.TestCase):
+	@classmethod
+	def setUpClass(self):
+		print("""Launching Frame decoder fuzzing...""")
+
+	@classmethod
+	def tearDownClass(self):
+		print("""Frame decoder fuzzing done.\n""")
+
+	def test_fuzz_corpus(self):
+		corpus = benchmark.make_fuzz_corpus()
+
+		result = benchmark.run_fuzz(corpus, max_duration = 0.5)
+
+		self.assertEqual(result, [])
+
 
 if __name__ == '__main__':
 	unittest.main()
\ No newline at end of file
@@ -0,0 +1,212 @@
+#!/bin/bash/python3
+#encoding: utf-8
+
+"""
+Throughput benchmark of the frame and circuit codecs, and fuzzing of the frame decoder.
+
+Usage:
+	python3 benchmark.py          # encode/decode ops/s and bytes/frame for every frame type and circuit size
+	python3 benchmark.py -quick   # same with fewer iterations
+	python3 benchmark.py -fuzz    # feed the fuzz corpus to the decoder
+"""
+
+from core import Crypto, Frame
+from core.Frame import Frame as F
+
+import random
+import sys
+import time
+
+CIRCUIT_SIZES = (2, 10, 100, 1000)
+
+# exceptions the decoder is allowed to raise on malformed frames
+DECODER_EXCEPTIONS = (Frame.UnknownVersionException, Frame.UnknownTypeException, Frame.MalformedFrameException)
+
+def make_circuit(n, first_pid = 2):
+	"""
+	Build the aggregation circuit used by the Master: the sum of the inputs of n parties.
+
+	Arguments:
+		n (int): number of inputs (at least 2).
+		first_pid (int): id of the first input party. (Optional, default: 2)
+
+	Returns:
+		The circuit.
+	"""
+	circuit = Crypto.Circuit()
+	previous_gate = Crypto.Gate(Crypto.Gate.SHARE, value = first_pid)
+	for pid in range(first_pid+1, first_pid+n):
+		gate = Crypto.Gate(Crypto.Gate.ADD)
+		gate.set_inputs([previous_gate, Crypto.Gate(Crypto.Gate.SHARE, value = pid)])
+		circuit.add_gate(gate)
+		previous_gate = gate
+
+	return circuit
+
+def make_frames():
+	"""
+	Build realistic frames of every type and version.
+
+	Returns:
+		List of (name, frame).
+	"""
+	p = 2147483659 # 32 bits primes, as chosen by the Master
+	g = 2147483693
+	share = 1843021337
+	frames = []
+	for version, v_name in ((F.PCEPS, "PCEPS"), (F.PCEAS, "PCEAS")):
+		for t in (F.ADVERT, F.SHARE, F.MUL, F.RESULT, F.LEAVE, F.PING):
+			payload = share if t in (F.SHARE, F.MUL, F.RESULT) else 12
+			frames.append((f"{F.get_str_type(t)}/{v_name}", F(t, version, 12, payload, session = 42)))
+		for n in CIRCUIT_SIZES:
+			payload = (p, make_circuit(n)) if version == F.PCEPS else (p, g, make_circuit(n))
+			frames.append((f"REQUEST/{v_name} n={n}", F(F.REQUEST, version, 1, payload, session = 42)))
+
+	for n in (2, 10, 100):
+		vector = [random.randint(2**30, 2**31) for _ in range(n)]
+		frames.append((f"BVECT/PCEAS k={n}", F(F.BVECT, F.PCEAS, 12, vector, session = 42)))
+	frames.append(("MALICIOUS/PCEAS", F(F.MALICIOUS, F.PCEAS, 12, [3, 7, 9], session = 42)))
+	frames.append(("RESYNC", F(F.RESYNC, F.PCEPS, 1, [43, 7, 9], session = 42)))
+	shares = [F(F.SHARE, F.PCEAS, 12, share, session = 42) for _ in range(8)]
+	frames.append(("CONTAINER 8 SHARE", F(F.CONTAINER, F.PCEAS, 12, shares)))
+	frames.append(("RELIABLE SHARE", F(F.RELIABLE, F.PCEAS, 12, (2**31, 17, 15, shares[0]), session = 42)))
+	frames.append(("ACK", F(F.ACK, F.PCEAS, 12, [2**31, 17, 19, 20])))
+
+	return frames
+
+def measure(function, duration):
+	"""
+	Call a function repeatedly for a given duration.
+
+	Arguments:
+		function (function): the function to call.
+		duration (float): measurement duration in seconds.
+
+	Returns:
+		The number of calls per second.
+	"""
+	count = 0
+	batch = 1
+	begin = time.perf_counter()
+	elapsed = 0
+	while elapsed < duration:
+		for _ in range(batch):
+			function()
+		count += batch
+		batch *= 2
+		elapsed = time.perf_counter() - begin
+
+	return count / elapsed
+
+def run_benchmark(duration = 0.5):
+	"""
+	Measure encoding and decoding throughput of frames and circuits, and print the results.
+
+	Arguments:
+		duration (float): measurement duration of each operation in seconds. (Optional, default: 0.5)
+
+	Returns:
+		List of (name, bytes, encode ops/s, decode ops/s).
+	"""
+	results = []
+	print(f"{'frame':<24}{'bytes':>8}{'encode/s':>14}{'decode/s':>14}")
+	for name, frame in make_frames():
+		encoded = frame.to_bytes()
+		encode = measure(frame.to_bytes, duration)
+		decode = measure(lambda: F.from_bytes(encoded), duration)
+		results.append((name, len(encoded), encode, decode))
+		print(f"{name:<24}{len(encoded):>8}{encode:>14.0f}{decode:>14.0f}")
+
+	print(f"\n{'circuit':<24}{'bytes':>8}{'encode/s':>14}{'decode/s':>14}")
+	for n in CIRCUIT_SIZES:
+		circuit = make_circuit(n)
+		for name, to_bytes, from_bytes in (("tree", circuit.to_bytes, Crypto.Circuit.from_bytes), ("compact", circuit.to_compact_bytes, Crypto.Circuit.from_compact_bytes)):
+			encoded = to_bytes()
+			encode = measure(to_bytes, duration)
+			decode = measure(lambda: from_bytes(encoded), duration)
+			results.append((f"{name} n={n}", len(encoded), encode, decode))
+			print(f"{name + ' n=' + str(n):<24}{len(encoded):>8}{encode:>14.0f}{decode:>14.0f}")
+
+	return results
+
+def make_fuzz_corpus(seed = 0, mutations = 20):
+	"""
+	Build malformed frames from valid ones: truncations, bit flips, oversized length fields,
+	invalid type and version nibbles, random bytes and decompression bombs.
+
+	Arguments:
+		seed (int): seed of the random generator, the corpus is deterministic for a given seed. (Optional, default: 0)
+		mutations (int): number of random mutations per valid frame. (Optional, default: 20)
+
+	Returns:
+		List of bytes.
+	"""
+	rand = random.Random(seed)
+	corpus = [b"", b"\x00", b"\xff" * 64, b"\x10\xff", b"\x10\x01\x01\x01\x00\xff\xff\xff\xff\xff\xff\xff\xff\xff\xff\x01"]
+
+	# the requests carrying the largest circuits are left out: every truncation and mutation of them is decoded
+	valid = [frame.to_bytes() for _, frame in make_frames() if not (frame.get_type() == F.REQUEST and len(frame.get_payload()[-1]) > 100)]
+	for b in valid:
+		for i in range(len(b)):
+			corpus.append(b[:i])
+		for _ in range(mutations):
+			mutated = bytearray(b)
+			position = rand.randrange(len(mutated))
+			mutated[position] ^= 1 << rand.randrange(8)
+			corpus.append(bytes(mutated))
+			mutated = bytearray(b)
+			mutated[rand.randrange(len(mutated))] = rand.choice((0x00, 0x7f, 0x80, 0xc0, 0xc1, 0xff))
+			corpus.append(bytes(mutated))
+		corpus.append(b + bytes(rand.randrange(256) for _ in range(16)))
+		corpus.append(bytes((b[0] & 0xf0) | 0x0f,) + b[1:])
+
+	for _ in range(mutations * 10):
+		corpus.append(bytes(rand.randrange(256) for _ in range(rand.randrange(1, 64))))
+
+	if Frame.zlib:
+		# decompression bomb: a small SYNC frame expanding to several megabytes
+		bomb = bytes((Frame.CIRCUIT_COMPACT_ZLIB,)) + Frame.zlib.compress(b"\x00" * (8 * 2**20), 9)
+		payload = b"\x04\x80\x00\x00\x0b" + bomb
+		corpus.append(b"\x40\x01\x01\x01\x00" + Frame.Octets.encode_varint(len(payload)) + payload)
+
+	return corpus
+
+def run_fuzz(corpus, max_duration = 0.05):
+	"""
+	Feed every entry of the corpus to the frame decoder.
+
+	Arguments:
+		corpus (list): the malformed frames.
+		max_duration (float): maximum decoding time of an entry in seconds. (Optional, default: 0.05)
+
+	Returns:
+		List of (entry, problem) for entries that raised an unexpected exception or were too slow to decode.
+	"""
+	problems = []
+	for b in corpus:
+		begin = time.perf_counter()
+		try:
+			F.from_bytes(b)
+		except DECODER_EXCEPTIONS:
+			pass
+		except Exception as e:
+			problems.append((b, f"{type(e).__name__}: {e}"))
+			continue
+
+		duration = time.perf_counter() - begin
+		if duration > max_duration:
+			problems.append((b, f"decoding took {duration:.3f}s"))
+
+	return problems
+
+
+if __name__ == '__main__':
+	if "-fuzz" in sys.argv:
+		corpus = make_fuzz_corpus()
+		problems = run_fuzz(corpus)
+		for b, problem in problems:
+			print(f"{b.hex()}: {problem}")
+		print(f"{len(corpus)} entries, {len(problems)} problems")
+		sys.exit(1 if problems else 0)
+
+	run_benchmark(0.1 if "-quick" in sys.argv else 0.5)
@@ -0,0 +1,59 @@
+#!/bin/bash/python3
+#encoding: utf-8
+
+import asyncio
+from . import Link
+
+class AsyncNetworkInterface(Link.Interface, asyncio.DatagramProtocol):
+	"""
+	UDP transport running on an asyncio event loop. Same contract as Link.NetworkInterface,
+	without a receiving thread: datagrams are delivered by the event loop.
+	"""
+	def __init__(self, ip = '0.0.0.0', port = Link.MPC_PORT, broadcast_ip = "255.255.255.255"):
+		Link.Interface.__init__(self, ip, port)
+		self.broadcast_ip = broadcast_ip
+		self.transport = None
+
+	async def start(self):
+		"""
+		Bind the socket on the running event loop.
+		"""
+		loop = asyncio.get_running_loop()
+		await loop.create_datagram_endpoint(lambda: self, local_addr = (self.ip, self.port), allow_broadcast = True)
+
+	def connection_made(self, transport):
+		self.transport = transport
+		if self.port == 0:
+			# port chosen by the system
+			self.port = transport.get_extra_info("sockname")[1]
+
+	def datagram_received(self, data, addr):
+		if data:
+			self.deliver(data, addr)
+
+	def error_received(self, exc):
+		pass
+
+	def stop(self):
+		if self.transport is not None:
+			self.transport.close()
+			self.transport = None
+
+	def broadcast(self, message):
+		"""
+		Allows broadcasting of messages.
+
+		Arguments:
+			message (Message): the message to be sent.
+		"""
+		self.transport.sendto(message.to_bytes(), (self.broadcast_ip, self.port))
+
+	def send_to(self, to_pid, message):
+		"""
+		Allows a network interface to send a message to another party.
+
+		Arguments:
+			to_pid (int): pid of the party to whom the message is destinated to.
+			message (Message): the message to be sent.
+		"""
+		self.transport.sendto(message.to_bytes(), self.parties_addr[to_pid])
@@ -0,0 +1,206 @@
+#!/bin/bash/python3
+#encoding: utf-8
+
+import asyncio
+from . import AsyncLink, Frame, Link, Log, Party
+
+class AsyncParty(Party.Party):
+	"""
+	Party driven by an asyncio event loop. Frames are received by the loop, and each phase of a computation
+	awaits a future resolved when the shares, B vectors or results it expects have arrived, or times out.
+	Several parties can share the same loop.
+	"""
+	threaded = False
+
+	def __init__(self, party_id, master = False, version = Frame.Frame.PCEPS, networkInterface = None):
+		if networkInterface is None:
+			networkInterface = AsyncLink.AsyncNetworkInterface()
+		super(AsyncParty, self).__init__(party_id, master = master, version = version, networkInterface = networkInterface)
+		self.loop = None
+		self.stopped = None
+		self.waiters = [] # (predicate, future) pairs waiting for received frames
+		self.advert_interval = self.timeout
+
+	async def start(self):
+		"""
+		Start the network interface on the running event loop.
+		"""
+		self.loop = asyncio.get_running_loop()
+		self.stopped = asyncio.Event()
+		# flush deadlines are handled by the event loop instead of timer threads
+		self.outbound.schedule = self.loop.call_later
+		if isinstance(self.networkInterface, Link.ReliableInterface):
+			self.networkInterface.schedule = self.loop.call_later
+		await self.networkInterface.start()
+
+	def stop(self):
+		"""
+		Make the run coroutine return.
+		"""
+		self.stopped.set()
+
+	def receive(self, message):
+		# already called by the event loop, no need to queue
+		self.on_recv(message)
+		self.notify()
+
+	def receive_batch(self, messages):
+		for message in messages:
+			self.on_recv(message)
+		self.notify()
+
+	def notify(self):
+		"""
+		Resolve the futures whose condition has been fulfilled by the last received frame.
+		"""
+		waiters = []
+		for predicate, future in self.waiters:
+			if future.done():
+				continue
+			if predicate():
+				future.set_result(True)
+			else:
+				waiters.append((predicate, future))
+		self.waiters = waiters
+
+	def expect(self, predicate):
+		"""
+		Get a future resolved as soon as a condition is fulfilled.
+
+		Arguments:
+			predicate (function): the condition, checked each time a frame is received.
+
+		Returns:
+			The future.
+		"""
+		future = self.loop.create_future()
+		if predicate():
+			future.set_result(True)
+		else:
+			self.waiters.append((predicate, future))
+
+		return future
+
+	async def wait(self, predicate, timeout):
+		"""
+		Wait until a condition is fulfilled.
+
+		Arguments:
+			predicate (function): the condition, checked each time a frame is received.
+			timeout (float): maximum waiting time in seconds.
+
+		Returns:
+			True if the condition is fulfilled, False on timeout.
+		"""
+		try:
+			await asyncio.wait_for(self.expect(predicate), max(timeout, 0))
+			return True
+		except asyncio.TimeoutError:
+			return False
+
+	def start_session(self, session):
+		self.loop.create_task(self.run_session(session))
+
+	async def run_session(self, session):
+		"""
+		Run the protocol of a computation, awaiting the conditions it waits for.
+
+		Arguments:
+			session (Session): the computation to run.
+
+		Returns:
+			The final result for the party that requested the computation, None otherwize.
+		"""
+		steps = self.protocol(session)
+		try:
+			condition = next(steps)
+			while True:
+				condition = steps.send(await self.wait(*condition))
+		except StopIteration as e:
+			return e.value
+
+	async def heartbeat(self):
+		"""
+		Ping the other parties periodically, until the party is stopped.
+		"""
+		while not self.stopped.is_set():
+			try:
+				await asyncio.wait_for(self.stopped.wait(), self.heartbeat_interval)
+			except asyncio.TimeoutError:
+				self.ping()
+
+	async def run(self):
+		await self.start()
+		self.log("starts")
+		self.log("My ip is %s", self.networkInterface.get_addr())
+
+		self.machine.move(self, Party.Party.AWAITING)
+		self.loop.create_task(self.heartbeat())
+
+		while self.advert_start_count < self.advert_count_threshold and not self.stopped.is_set():
+			try:
+				await asyncio.wait_for(self.stopped.wait(), self.advert_interval)
+			except asyncio.TimeoutError:
+				frame = Frame.Frame(Frame.Frame.ADVERT, self.version, self.party_id, self.party_id)
+				self.send(Link.Message(Link.Message.FRAME, self.networkInterface.get_addr(), frame))
+				self.advert_start_count += 1
+
+		await self.stopped.wait()
+
+		#leave the network
+		self.leave()
+		self.networkInterface.stop()
+		self.log("FINISH")
+
+class AsyncMaster(AsyncParty):
+	"""
+	Master node driven by an asyncio event loop.
+	"""
+	new_session_id = Party.Master.new_session_id
+	makeCircuit = Party.Master.makeCircuit
+	prepare_session = Party.Master.prepare_session
+	send_request = Party.Master.send_request
+
+	def __init__(self, pid, version = Frame.Frame.PCEPS, networkInterface = None):
+		super(AsyncMaster, self).__init__(pid, master = True, version = version, networkInterface = networkInterface)
+		self.session_ids = Party.Master.make_session_ids()
+		self.parallel_sessions = 1 # computations run at the same time by each round of run
+		self.request_interval = 30
+
+	async def compute(self):
+		"""
+		Run one computation over the known parties.
+
+		Returns:
+			The final result, or None if the computation failed.
+		"""
+		if not await self.wait(lambda: len(self.known_parties) >= 3, self.timeout):
+			self.log("Not enough parties connected to run the protocol.", level = Log.WARNING)
+			return None
+
+		session = self.prepare_session()
+		if session is None:
+			self.log("Not enough live parties or too many computations running.", level = Log.WARNING)
+			return None
+		self.send_request(session)
+
+		#P6: compute the circuit
+		return await self.run_session(session)
+
+	async def run(self):
+		await self.start()
+		self.log("starts")
+		self.log("My ip is %s", self.networkInterface.get_addr())
+
+		self.machine.move(self, Party.Party.AWAITING)
+		self.loop.create_task(self.heartbeat())
+
+		while not self.stopped.is_set():
+			try:
+				await asyncio.wait_for(self.stopped.wait(), self.request_interval)
+			except asyncio.TimeoutError:
+				await asyncio.gather(*(self.compute() for _ in range(self.parallel_sessions)))
+
+		self.leave()
+		self.networkInterface.stop()
+		self.log("FINISH")
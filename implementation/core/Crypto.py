@@ -3,9 +3,7 @@
 
 import random
 
-import sys
-
-BYTEORDER = sys.byteorder
+BYTEORDER = "big" # network byte order, as every integer of the protocol (see Octets.BYTEORDER)
 
 if __name__ != '__main__':
 	from . import Octets
@@ -158,31 +156,17 @@ class Gate:
 		Returns:
 			The gate as bytes.
 		"""
-		s = b""
-		if self.type == Gate.ADD:
-			s += b"\x10"
-		elif self.type == Gate.MUL:
-			s += b"\x11"
-		elif self.type == Gate.CMUL:
-			s += b"\x12"
-			val_len = Octets.get_len(self.value)
-			s += val_len.to_bytes(1, BYTEORDER)
-			s += self.value.to_bytes(val_len)
-		elif self.type == Gate.SHARE:
-			s += b"\x00"
-			val_len = Octets.get_len(self.value)
-			s += val_len.to_bytes(1, BYTEORDER)
-			s += self.value.to_bytes(val_len)
-		elif self.type == Gate.CONST:
-			s += b"\x01"
-			val_len = Octets.get_len(self.value)
-			s += val_len.to_bytes(1, BYTEORDER)
-			s += self.value.to_bytes(val_len)
-
-		for i in self.inputs:
-			s += i.to_bytes()
-
-		return s
+		# pre-order walk of the gate tree, without recursion so that deep circuits can be encoded
+		s = []
+		stack = [self]
+		while stack:
+			gate = stack.pop()
+			s.append(GATE_CODES[gate.type])
+			if gate.type in VALUED_GATES:
+				s.append(Octets.encode_uint(gate.value))
+			stack.extend(reversed(gate.inputs))
+
+		return b"".join(s)
 
 	def from_bytes(b):
 		"""
@@ -194,34 +178,24 @@ class Gate:
 		Returns:
 			The gate built and the remaining bytes.
 		"""
-		gate = None
-		rest = None
-		g_type = b[0:1]
-		if g_type == b"\x10":
-			gate = Gate(Gate.ADD)
-			rest = b[1::]
-		elif g_type == b"\x11":
-			gate = Gate(Gate.MUL)
-			rest = b[1::]
-		elif g_type == b"\x12":
-			value_len = b[1]
-			value = int.from_bytes(b[2:2+value_len], BYTEORDER)
-			gate = Gate(Gate.CMUL, value = value)
-			rest = b[2+value_len::]
-		elif g_type == b"\x00":
-			value_len = b[1]
-			value = int.from_bytes(b[2:2+value_len], BYTEORDER)
-			gate = Gate(Gate.SHARE, value = value)
-			rest = b[2+value_len::]
-		elif g_type == b"\x01":
-			value_len = b[1]
-			value = int.from_bytes(b[2:2+value_len], BYTEORDER)
-			gate = Gate(Gate.CONST, value = value)
-			rest = b[2+value_len::]
-		else:
-			raise UnknownGateException(f"Unknown gate type {int.from_bytes(g_type, BYTEORDER)}.")
+		g_type = GATE_TYPES[b[0]]
+		if g_type is None:
+			raise UnknownGateException(f"Unknown gate type {b[0]}.")
+
+		if g_type in VALUED_GATES:
+			value, i = Octets.decode_uint(b, 1)
+			return (Gate(g_type, value = value), b[i::])
+
+		return (Gate(g_type), b[1::])
 
-		return (gate, rest)
+# encoding of each gate type, and gate type of each encoding (indexed by the encoded byte)
+GATE_CODES = {Gate.ADD: b"\x10", Gate.MUL: b"\x11", Gate.CMUL: b"\x12", Gate.SHARE: b"\x00", Gate.CONST: b"\x01"}
+GATE_TYPES = [None] * 256
+for g_type, code in GATE_CODES.items():
+	GATE_TYPES[code[0]] = g_type
+
+# gates carrying a value (pid for SHARE, constant for CMUL and CONST)
+VALUED_GATES = (Gate.CMUL, Gate.SHARE, Gate.CONST)
 
 class Circuit:
 	def __init__(self):
@@ -330,8 +304,8 @@ class Circuit:
 		circuit = Circuit()
 		temp = []
 		counts = []
-		previous_node = None
-		while b != b"":
+		b = memoryview(b) # slicing a memoryview does not copy the remaining bytes
+		while len(b) > 0:
 			gate, b = Gate.from_bytes(b)
 			
 			if len(temp) > 0:
@@ -362,15 +336,130 @@ class Circuit:
 			The list of ids.
 		"""
 		ids = []
+		seen = set()
 		for gate in self.gates:
 			for input_gate in gate.get_inputs():
 				if input_gate.get_type() == Gate.SHARE:
 					id = input_gate.get_result()
-					if not id in ids:
+					if not id in seen:
+						seen.add(id)
 						ids.append(id)
 
 		return ids
 
+	def to_compact_bytes(self):
+		"""
+		Builds a compact string of bytes representing the circuit.
+		Input party ids are stored once as a sorted delta-coded list, then every gate is stored as its type
+		followed by references to its input wires. The first wires are the inputs, then each gate adds one wire.
+		Every integer is a varint. A reference to a gate is its distance to the wire being built, a reference to
+		an input is its offset from the input following the last referenced one, so both stay small.
+
+		Returns:
+			The circuit as compact bytes.
+		"""
+		if len(self.gates) == 0:
+			raise ValueError("Circuit is empty.")
+
+		ids = sorted(self.get_input_ids())
+		wires = {}
+		s = [Octets.encode_varint(len(ids))]
+		previous = 0
+		for i, party in enumerate(ids):
+			s.append(Octets.encode_varint(party - previous))
+			previous = party
+			wires[("share", party)] = i
+
+		records = []
+		next_input = [0]
+		def encode_ref(wire, ref):
+			if ref < len(ids):
+				offset = ref - next_input[0]
+				next_input[0] = ref + 1
+				return Octets.encode_varint(((offset << 1) if offset >= 0 else (-offset << 1) - 1) << 1)
+			return Octets.encode_varint(((wire - ref - 1) << 1) | 1)
+
+		def emit(gate):
+			if gate.get_type() == Gate.SHARE:
+				return wires[("share", gate.get_result())]
+			if id(gate) in wires:
+				return wires[id(gate)]
+			refs = [emit(i) for i in gate.get_inputs()]
+			wire = len(ids) + len(records)
+			record = [gate.get_type().to_bytes(1, BYTEORDER)]
+			if gate.get_type() in VALUED_GATES:
+				record.append(Octets.encode_varint(gate.get_result()))
+			for ref in refs:
+				record.append(encode_ref(wire, ref))
+			records.append(b"".join(record))
+			wires[id(gate)] = wire
+			return wire
+
+		for gate in self.gates:
+			emit(gate)
+
+		s.append(Octets.encode_varint(len(records)))
+		s += records
+
+		return b"".join(s)
+
+	def from_compact_bytes(b):
+		"""
+		Builds a circuit from compact bytes.
+
+		Arguments:
+			b (bytes): compact bytes representing the circuit.
+
+		Returns:
+			The circuit.
+		"""
+		circuit = Circuit()
+		inputs_number, i = Octets.decode_varint(b)
+		ids = []
+		party = 0
+		for _ in range(inputs_number):
+			delta, i = Octets.decode_varint(b, i)
+			party += delta
+			ids.append(party)
+
+		gates_number, i = Octets.decode_varint(b, i)
+		wires = []
+		next_input = 0
+		for _ in range(gates_number):
+			g_type = b[i]
+			i += 1
+			if g_type not in GATE_CODES or g_type == Gate.SHARE:
+				raise UnknownGateException(f"Unknown gate type {g_type}.")
+			value = None
+			if g_type in VALUED_GATES:
+				value, i = Octets.decode_varint(b, i)
+			gate = Gate(g_type, value = value)
+			inputs = []
+			for _ in range(gate.get_input_number()):
+				ref, i = Octets.decode_varint(b, i)
+				if ref & 1:
+					ref = len(wires) - 1 - (ref >> 1)
+					if ref < 0:
+						raise CircuitTranslationError(f"Gate references unknown wire {ref}.")
+					inputs.append(wires[ref])
+				else:
+					offset = ref >> 1
+					ref = next_input + ((offset >> 1) if not offset & 1 else -((offset + 1) >> 1))
+					if ref < 0 or ref >= inputs_number:
+						raise CircuitTranslationError(f"Gate references unknown input {ref}.")
+					next_input = ref + 1
+					# every reference to an input gets its own SHARE gate, it receives the share during the computation
+					inputs.append(Gate(Gate.SHARE, value = ids[ref]))
+			gate.set_inputs(inputs)
+			wires.append(gate)
+			if gate.get_input_number() > 0:
+				circuit.add_gate(gate)
+
+		if i != len(b):
+			raise CircuitTranslationError("Trailing bytes after the circuit.")
+
+		return circuit
+
 
 def generateRandomPrime(a, b):
 	"""
@@ -428,7 +517,6 @@ def create_shares(secret, ids, k, p, pceas_prime = None):
 	d = k-1
 	coeff = [secret] + list(random.randint(0, p) for _ in range(d))
 	#f = secret + c1*x + c2*x**2 + ... + cd*x**d
-	print("coeff", coeff)
 
 	shares = {}
 
@@ -443,18 +531,30 @@ def create_shares(secret, ids, k, p, pceas_prime = None):
 
 	return shares
 
-def compute_recombination_vector(parties_id, modulo):
+def compute_recombination_vector(parties_id, modulo, x = 0):
 	"""
+	Compute the Lagrange coefficients interpolating the shares of the given parties at x (0: the secret),
+	in the field of the given prime (exact for any number of parties).
+
+	Arguments:
+		parties_id (list): ids of the parties whose shares are recombined.
+		modulo (int): prime of the field.
+		x (int): point the polynomial is evaluated at. (Optional, default: 0)
+
+	Returns:
+		The coefficients, by party id. (dict)
 	"""
 	vector = {}
 
 	for i in parties_id:
-		delta_i = 1
+		numerator = 1
+		denominator = 1
 		for j in parties_id:
 			if i == j:
 				continue
-			delta_i *= -j/(i-j)
-		vector[i] = int(delta_i)%modulo
+			numerator = (numerator * (x-j)) % modulo
+			denominator = (denominator * (i-j)) % modulo
+		vector[i] = (numerator * pow(denominator, -1, modulo)) % modulo
 
 	return vector
 
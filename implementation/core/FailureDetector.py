@@ -0,0 +1,120 @@
+#!/bin/bash/python3
+#encoding: utf-8
+
+import collections
+import math
+import sys
+import threading
+import time
+
+class History:
+	"""
+	Arrival times of the last pings received from a party.
+	"""
+	def __init__(self, window):
+		self.last = None # arrival time of the last ping
+		self.seen = None # arrival time of the last frame of any type
+		self.intervals = collections.deque(maxlen = window)
+		self.total = 0 # sum of the intervals
+		self.squares = 0 # sum of the squared intervals
+
+class PhiAccrualDetector:
+	"""
+	Phi accrual failure detector (Hayashibara et al.). The intervals between the pings received from a party
+	are assumed to follow a normal distribution, and phi = -log10(probability that the next ping arrives even later
+	than now, less an acceptable pause). Only pings are heartbeats, as the other frames come in bursts which would
+	shrink the expected interval, but any frame received tells that the party is alive: the time is counted from the last one.
+	Parties never heard from are considered alive.
+	"""
+	def __init__(self, threshold = 8, window = 100, min_std = 1, acceptable_pause = 1, first_interval = 1):
+		self.threshold = threshold # phi above which a party is suspected
+		self.window = window # number of intervals kept for each party
+		self.min_std = min_std # lower bound of the standard deviation in seconds, about the ping interval as regular pings would make it 0
+		self.acceptable_pause = acceptable_pause # silence in seconds not counted, so that a lost ping is not suspected
+		self.first_interval = first_interval # interval assumed after the first heartbeat, in seconds
+		self.histories = {} # by party id
+		self.lock = threading.Lock()
+
+	def heartbeat(self, pid, now = None):
+		"""
+		Record that a ping has been received from a party.
+
+		Arguments:
+			pid (int): id of the party.
+			now (float): arrival time (time.monotonic). (Optional, default: now)
+		"""
+		if now is None:
+			now = time.monotonic()
+		with self.lock:
+			history = self.histories.get(pid)
+			if history is None:
+				history = self.histories[pid] = History(self.window)
+			elif now > history.last:
+				interval = now - history.last
+				if len(history.intervals) == history.intervals.maxlen:
+					oldest = history.intervals[0]
+					history.total -= oldest
+					history.squares -= oldest * oldest
+				history.intervals.append(interval)
+				history.total += interval
+				history.squares += interval * interval
+			history.last = now
+			history.seen = now if history.seen is None else max(history.seen, now)
+
+	def seen(self, pid, now = None):
+		"""
+		Record that a frame other than a ping has been received from a party.
+
+		Arguments:
+			pid (int): id of the party.
+			now (float): arrival time (time.monotonic). (Optional, default: now)
+		"""
+		if now is None:
+			now = time.monotonic()
+		with self.lock:
+			history = self.histories.get(pid)
+			# parties never pinged are considered alive anyway
+			if history is not None and now > history.seen:
+				history.seen = now
+
+	def phi(self, pid, now = None):
+		"""
+		Get the suspicion level of a party.
+
+		Arguments:
+			pid (int): id of the party.
+			now (float): current time (time.monotonic). (Optional, default: now)
+
+		Returns:
+			Phi, 0 if nothing has been received from the party yet.
+		"""
+		if now is None:
+			now = time.monotonic()
+		with self.lock:
+			history = self.histories.get(pid)
+			if history is None:
+				return 0
+			n = len(history.intervals)
+			if n == 0:
+				mean, variance = self.first_interval, (self.first_interval / 4) ** 2
+			else:
+				mean = history.total / n
+				variance = max(history.squares / n - mean * mean, 0)
+			elapsed = now - history.seen - self.acceptable_pause
+
+		std = max(math.sqrt(variance), self.min_std)
+		later = 0.5 * math.erfc((elapsed - mean) / (std * math.sqrt(2)))
+		return -math.log10(max(later, sys.float_info.min))
+
+	def is_alive(self, pid, now = None):
+		return self.phi(pid, now) < self.threshold
+
+	def forget(self, pid):
+		"""
+		Drop the history of a party, that left the network for instance.
+
+		Arguments:
+			pid (int): id of the party.
+		"""
+		with self.lock:
+			self.histories.pop(pid, None)
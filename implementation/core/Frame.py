@@ -2,16 +2,34 @@
 #encoding: utf-8
 
 """
+Every integer is encoded in network byte order (big endian).
+
+Header:
+- 1 byte: type (high nibble) and version (low nibble)
+- origin length (1 byte) followed by the origin party id
+- session length (1 byte) followed by the session id (computation the frame belongs to)
+- payload length (varint, 1 byte below 128) followed by the payload
+
+REQUEST and SYNC payload: primes (length byte + value each) then the circuit section, whose first byte tells its encoding:
+- 0xc0 compact circuit (see Crypto.Circuit.to_compact_bytes)
+- 0xc1 compact circuit compressed with zlib (only used when it is smaller)
+- otherwise the serialized circuit tree (see Crypto.Circuit.to_bytes)
+
 Types:
 - 0x0 List of known parties exchange (if empty: party just entered the network)
 - 0x1 Share
 - 0x2 MUL gate result
 - 0x3 Final Result (only the party who requested it must receive)
-- 0x4 Sync parties on how to compute the gates (circuit)
-- 0x5 Request the computation
+- 0x4 Sync parties on how to compute the gates (circuit), no longer sent since the request carries it
+- 0x5 Request the computation, with its parameters and circuit
 - 0x6 Party leaves the Network
 - 0x7 (PCEAS) Vector of coefficients B
 - 0x8 (PCEAS) Malicious behavior alert
+- 0x9 Container of several frames sent in one datagram (each prefixed by its length as a varint), neither containers nor reliable frames
+- 0xa Reliable delivery: epoch of the sender, sequence number, base (oldest sequence number still retransmitted), then the enclosed frame, which may be a container but not a reliable frame (none when only the base is announced)
+- 0xb Acknowledgement: epoch of the acknowledged sender, cumulative sequence number, then selectively acknowledged ones
+- 0xc Heartbeat: number of pings sent so far by the party
+- 0xd Delta SYNC: new session id of the computation, then the input parties dropped from its circuit
 
 Versions:
 - 0x0 PCEPS
@@ -21,9 +39,12 @@ Versions:
 from . import Octets
 from . import Crypto
 
-import sys
+try:
+	import zlib
+except ImportError:
+	zlib = None
 
-BYTEORDER = sys.byteorder
+BYTEORDER = Octets.BYTEORDER
 
 class UnknownVersionException(Exception):
 	pass
@@ -31,6 +52,9 @@ class UnknownVersionException(Exception):
 class UnknownTypeException(Exception):
 	pass
 
+class MalformedFrameException(Exception):
+	pass
+
 class Frame:
 	ADVERT = 0
 	SHARE = 1
@@ -41,23 +65,29 @@ class Frame:
 	LEAVE = 6
 	BVECT = 7
 	MALICIOUS = 8
+	CONTAINER = 9
+	RELIABLE = 10
+	ACK = 11
+	PING = 12
+	RESYNC = 13
 
 	PCEPS = 0
 	PCEAS = 1
-	def __init__(self, type, version, origin, payload):
+	def __init__(self, type, version, origin, payload, session = 0):
 		self.type = type
 		self.version = version
 		self.origin = origin
 		self.payload = payload
+		self.session = session # identifier of the computation the frame belongs to
 
 	def __repr__(self):
-		return f"({Frame.get_str_type(self.type)}, {'PCEPS' if self.version == 0 else 'PCEAS'}, {self.origin}, {self.payload})"
+		return f"({Frame.get_str_type(self.type)}, {'PCEPS' if self.version == 0 else 'PCEAS'}, {self.origin}, {self.session}, {self.payload})"
 
 	def __eq__(self, o):
 		if type(o) != type(self):
 			return False
 
-		if self.type != o.type or self.version != o.version or self.payload != o.payload or self.origin != o.origin:
+		if self.type != o.type or self.version != o.version or self.payload != o.payload or self.origin != o.origin or self.session != o.session:
 			return False
 
 		return True
@@ -65,6 +95,9 @@ class Frame:
 	def get_origin(self):
 		return self.origin
 
+	def get_session(self):
+		return self.session
+
 	def get_payload(self):
 		return self.payload
 
@@ -72,28 +105,28 @@ class Frame:
 		return self.type
 
 	def get_str_type(t):
-		if t == Frame.ADVERT:
-			return "ADVERT"
-		elif t == Frame.SHARE:
-			return "SHARE"
-		elif t == Frame.MUL:
-			return "MUL"
-		elif t == Frame.RESULT:
-			return "RESULT"
-		elif t == Frame.SYNC:
-			return "SYNC"
-		elif t == Frame.REQUEST:
-			return "REQUEST"
-		elif t == Frame.LEAVE:
-			return "LEAVE"
-		elif t == Frame.BVECT:
-			return "BVECT"
-		elif t == Frame.MALICIOUS:
-			return "MALICIOUS"
+		return TYPE_NAMES.get(t)
 
 	def get_version(self):
 		return self.version
 
+	def register_codec(t, v, encoder, decoder, name = None):
+		"""
+		Register how the payload of a (type, version) pair of frames is encoded and decoded.
+
+		Arguments:
+			t (int): type of the frame.
+			v (int): version of the frame.
+			encoder (function): builds the payload bytes from the payload object.
+			decoder (function): builds the payload object from the payload bytes.
+			name (str): readable name of the type. (Optional, default: None)
+		"""
+		if not 0 <= t < 16 or not 0 <= v < 16:
+			raise ValueError(f"Type and version must fit in a nibble, got 0x{t} and 0x{v}.")
+		CODECS[t*16 + v] = (encoder, decoder)
+		if name:
+			TYPE_NAMES[t] = name
+
 	def from_bytes(b):
 		"""
 		Builds a Frame object from bytes.
@@ -107,58 +140,32 @@ class Frame:
 		Raises:
 			UnknownVersionException: Version is invalid.
 			UnknownTypeException: Type is invalid.
+			MalformedFrameException: Frame is truncated or its content can not be decoded.
 		"""
-		type_version = int(b[0])
-		t,v = type_version, 0
-		if type_version % 16 == 1:
-			t = (t-1)//16
-			v = 1
-		elif type_version % 16 == 0:
-			t = t//16
-		else:
-			raise UnknownVersionException(f"Unknown version {type_version%16}.")
-
-		origin_len = b[1]
-		origin_pid = int.from_bytes(b[2:2+origin_len], BYTEORDER)
-
-		payload_len = b[2+origin_len]
-
-		payload = None
-
-		start_payload = 2+origin_len+1
-
-		if 0 <= t < 4 or 4 < t <= 6:
-			payload = int.from_bytes(b[start_payload:start_payload+payload_len], BYTEORDER)
-		elif t == 4 and v == 0:
-			p_len = int.from_bytes(b[start_payload:start_payload+1], BYTEORDER)
-			p = int.from_bytes(b[start_payload+1:start_payload+1+p_len], BYTEORDER)
-			circuit = Crypto.Circuit.from_bytes(b[start_payload+1+p_len:start_payload+1+p_len+payload_len-1])
-			circuit.set_prime(p)
-			payload = (p, circuit)
-		elif t == 4 and v == 1:
-			p_len = int.from_bytes(b[start_payload:start_payload+1], BYTEORDER)
-			p = int.from_bytes(b[start_payload+1:start_payload+1+p_len], BYTEORDER)
-			g_len =  int.from_bytes(b[start_payload+1+p_len:start_payload+2+p_len], BYTEORDER)
-			g = int.from_bytes(b[start_payload+2+p_len:start_payload+2+p_len+g_len], BYTEORDER)
-			circuit = Crypto.Circuit.from_bytes(b[start_payload+2+p_len+g_len:start_payload+payload_len])
-			circuit.set_prime(p)
-			payload = (p, g, circuit)
-		elif (t == 7 or t == 8) and v == 1:
-			payload = []
-			b_array = b[start_payload:start_payload+payload_len]
-			next_len = None
-			i = 0
-			while i < payload_len:
-				next_len = b_array[i]
-				i += 1
-				payload.append(int.from_bytes(b_array[i:i+next_len], BYTEORDER))
-				i += next_len
-		elif (t == 7 or t == 8) and v == 0:
-			raise UnknownTypeException(f"Unknown Frame type 0x{t} for the PCEPS version (0x{0}).")
-		else:
+		if len(b) == 0:
+			raise MalformedFrameException("Empty frame.")
+
+		type_version = b[0]
+		codec = CODECS[type_version]
+		if codec is None:
+			t, v = type_version//16, type_version%16
+			if v not in VERSIONS:
+				raise UnknownVersionException(f"Unknown version {v}.")
 			raise UnknownTypeException(f"Unknown Frame type 0x{t} for the given version 0x{v}.")
 
-		return Frame(t, v, origin_pid, payload)
+		try:
+			origin_pid, i = Octets.decode_uint(b, 1)
+			session, header_len = Octets.decode_uint(b, i)
+
+			payload_len, start_payload = Octets.decode_varint(b, header_len)
+			if start_payload+payload_len > len(b):
+				raise MalformedFrameException(f"Payload of {payload_len} bytes truncated to {len(b)-start_payload} bytes.")
+
+			payload = codec[1](b[start_payload:start_payload+payload_len])
+		except DECODING_ERRORS as e:
+			raise MalformedFrameException(f"Can not decode {Frame.get_str_type(type_version//16)} frame: {e}") from e
+
+		return Frame(type_version//16, type_version%16, origin_pid, payload, session = session)
 
 	def to_bytes(self):
 		"""
@@ -171,62 +178,156 @@ class Frame:
 			UnknownVersionException: Version is invalid.
 			UnknownTypeException: Type is invalid.
 		"""
-		if self.version > 1:
+		if self.version not in VERSIONS:
 			raise UnknownVersionException(f"Unknown version {self.version}.")
 
-		s = b""
-
-		s += (self.type*16 + self.version).to_bytes(1, BYTEORDER)
-
-		origin_len = Octets.get_len(self.origin)
-		s += origin_len.to_bytes(1, BYTEORDER)
-		s += self.origin.to_bytes(origin_len, BYTEORDER)
-
-		if 0 <= self.type < 4 or 4 < self.type <= 6:
-			payload_len = Octets.get_len(self.payload)
-			s += payload_len.to_bytes(1, BYTEORDER)
-			s += self.payload.to_bytes(payload_len, BYTEORDER)
-
-		elif self.type == 4 and self.version == 0:
-			p, circuit = self.payload
-			encoded_circuit = circuit.to_bytes()
-			p_len = Octets.get_len(p)
-			payload_len = len(encoded_circuit) + 1 + p_len
-
-			s += payload_len.to_bytes(1, BYTEORDER)
-
-			s += p_len.to_bytes(1, BYTEORDER)
-			s += p.to_bytes(p_len, BYTEORDER)
-
-			s += encoded_circuit
-
-		elif self.type == 4 and self.version == 1:
-			p, g, circuit = self.payload
-			encoded_circuit = circuit.to_bytes()
-			p_len = Octets.get_len(p)
-			g_len = Octets.get_len(g)
-			payload_len = len(encoded_circuit) + 2 + p_len + g_len
-
-			s += payload_len.to_bytes(1, BYTEORDER)
-
-			s += p_len.to_bytes(1, BYTEORDER)
-			s += p.to_bytes(p_len, BYTEORDER)
-			s += g_len.to_bytes(1, BYTEORDER)
-			s += g.to_bytes(g_len, BYTEORDER)
-
-			s += encoded_circuit
-
-		elif (self.type == 7 or self.type == 8) and self.version == 1:
-			encoded_payload = b""
-			for p in self.payload:
-				p_len = Octets.get_len(p)
-				encoded_payload += p_len.to_bytes(1, BYTEORDER)
-				encoded_payload += p.to_bytes(p_len, BYTEORDER)
-
-			s += len(encoded_payload).to_bytes(1, BYTEORDER)
-			s += encoded_payload
-
-		else:
+		codec = CODECS[self.type*16 + self.version] if 0 <= self.type < 16 else None
+		if codec is None:
 			raise UnknownTypeException(f"Unknown Frame type 0x{self.type} for the given version 0x{self.version}.")
 
-		return s
\ No newline at end of file
+		encoded_payload = codec[0](self.payload)
+
+		return b"".join((
+			(self.type*16 + self.version).to_bytes(1, BYTEORDER),
+			Octets.encode_uint(self.origin),
+			Octets.encode_uint(self.session),
+			Octets.encode_varint(len(encoded_payload)),
+			encoded_payload
+		))
+
+
+VERSIONS = (Frame.PCEPS, Frame.PCEAS)
+
+# codecs indexed by the first header byte (type*16 + version): (encoder, decoder)
+CODECS = [None] * 256
+
+TYPE_NAMES = {}
+
+# errors raised by codecs on inconsistent payloads
+DECODING_ERRORS = (IndexError, ValueError, Crypto.GateCreationException, Crypto.UnknownGateException, Crypto.CircuitTranslationError) + ((zlib.error,) if zlib else ())
+
+
+def encode_int(value):
+	return Octets.uint_to_bytes(value, Octets.get_len(value))
+
+def decode_int(b):
+	return Octets.uint_from_bytes(b)
+
+def encode_int_list(values):
+	return b"".join(Octets.encode_uint(value) for value in values)
+
+def decode_int_list(b):
+	values = []
+	i = 0
+	while i < len(b):
+		value, i = Octets.decode_uint(b, i)
+		values.append(value)
+
+	return values
+
+CIRCUIT_COMPACT = 0xc0
+CIRCUIT_COMPACT_ZLIB = 0xc1
+
+SYNC_COMPRESSION = zlib is not None # try to compress the circuit of SYNC frames
+MAX_CIRCUIT_SIZE = 65536 # maximum size of a decompressed circuit
+
+def encode_circuit(circuit):
+	compact = circuit.to_compact_bytes()
+	if SYNC_COMPRESSION:
+		compressed = zlib.compress(compact, 9)
+		if len(compressed) < len(compact):
+			return bytes((CIRCUIT_COMPACT_ZLIB,)) + compressed
+
+	return bytes((CIRCUIT_COMPACT,)) + compact
+
+def decode_circuit(b):
+	if b[0] == CIRCUIT_COMPACT:
+		return Crypto.Circuit.from_compact_bytes(b[1:])
+	elif b[0] == CIRCUIT_COMPACT_ZLIB:
+		if zlib is None:
+			raise Crypto.CircuitTranslationError("Circuit is compressed but zlib is not available.")
+		decompressor = zlib.decompressobj()
+		compact = decompressor.decompress(b[1:], MAX_CIRCUIT_SIZE)
+		if decompressor.unconsumed_tail:
+			raise Crypto.CircuitTranslationError(f"Decompressed circuit is larger than {MAX_CIRCUIT_SIZE} bytes.")
+		return Crypto.Circuit.from_compact_bytes(compact)
+
+	return Crypto.Circuit.from_bytes(b)
+
+def encode_sync(payload):
+	# (p, circuit) for PCEPS, (p, g, circuit) for PCEAS
+	*primes, circuit = payload
+	return encode_int_list(primes) + encode_circuit(circuit)
+
+def make_sync_decoder(primes_number):
+	def decode_sync(b):
+		primes = []
+		i = 0
+		for _ in range(primes_number):
+			prime, i = Octets.decode_uint(b, i)
+			primes.append(prime)
+		circuit = decode_circuit(b[i:])
+		circuit.set_prime(primes[0])
+		return (*primes, circuit)
+
+	return decode_sync
+
+
+def encode_container(frames):
+	# frames already encoded by the sender are accepted as bytes
+	parts = []
+	for frame in frames:
+		b = frame if isinstance(frame, (bytes, bytearray)) else frame.to_bytes()
+		parts.append(Octets.encode_varint(len(b)))
+		parts.append(b)
+
+	return b"".join(parts)
+
+def decode_container(b):
+	frames = []
+	i = 0
+	while i < len(b):
+		length, i = Octets.decode_varint(b, i)
+		if i+length > len(b):
+			raise ValueError(f"Contained frame of {length} bytes truncated to {len(b)-i} bytes.")
+		# a container only holds frames of the party (reliable frames hold containers, not the other way round),
+		# which bounds the nesting of received frames
+		if length and b[i]//16 in (Frame.CONTAINER, Frame.RELIABLE, Frame.ACK):
+			raise ValueError("Nested container or reliable frame.")
+		frames.append(Frame.from_bytes(b[i:i+length]))
+		i += length
+
+	return frames
+
+def encode_reliable(payload):
+	# (epoch, sequence number, base, frame), the frame may already be encoded, or None to announce the base only
+	epoch, seq, base, frame = payload
+	b = b"" if frame is None else frame if isinstance(frame, (bytes, bytearray)) else frame.to_bytes()
+	return Octets.encode_uint(epoch) + Octets.encode_uint(seq) + Octets.encode_uint(base) + b
+
+def decode_reliable(b):
+	epoch, i = Octets.decode_uint(b, 0)
+	seq, i = Octets.decode_uint(b, i)
+	base, i = Octets.decode_uint(b, i)
+	if i == len(b):
+		return (epoch, seq, base, None)
+	if b[i]//16 in (Frame.RELIABLE, Frame.ACK):
+		raise ValueError("Nested reliable frame.")
+
+	return (epoch, seq, base, Frame.from_bytes(b[i:]))
+
+for t, name in ((Frame.ADVERT, "ADVERT"), (Frame.SHARE, "SHARE"), (Frame.MUL, "MUL"), (Frame.RESULT, "RESULT"), (Frame.LEAVE, "LEAVE"), (Frame.PING, "PING")):
+	for v in VERSIONS:
+		Frame.register_codec(t, v, encode_int, decode_int, name = name)
+
+Frame.register_codec(Frame.SYNC, Frame.PCEPS, encode_sync, make_sync_decoder(1), name = "SYNC")
+Frame.register_codec(Frame.SYNC, Frame.PCEAS, encode_sync, make_sync_decoder(2), name = "SYNC")
+Frame.register_codec(Frame.REQUEST, Frame.PCEPS, encode_sync, make_sync_decoder(1), name = "REQUEST")
+Frame.register_codec(Frame.REQUEST, Frame.PCEAS, encode_sync, make_sync_decoder(2), name = "REQUEST")
+Frame.register_codec(Frame.BVECT, Frame.PCEAS, encode_int_list, decode_int_list, name = "BVECT")
+Frame.register_codec(Frame.MALICIOUS, Frame.PCEAS, encode_int_list, decode_int_list, name = "MALICIOUS")
+for v in VERSIONS:
+	Frame.register_codec(Frame.CONTAINER, v, encode_container, decode_container, name = "CONTAINER")
+	Frame.register_codec(Frame.RELIABLE, v, encode_reliable, decode_reliable, name = "RELIABLE")
+	Frame.register_codec(Frame.ACK, v, encode_int_list, decode_int_list, name = "ACK")
+	Frame.register_codec(Frame.RESYNC, v, encode_int_list, decode_int_list, name = "RESYNC")
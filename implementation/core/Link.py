@@ -1,14 +1,24 @@
 #!/bin/bash/python3
 #encoding: utf-8
 
+import abc
+import asyncio
+import queue
+import random
+import select
 import socket
-import threading
-from . import Frame, Octets
-
 import sys
+import threading
+import time
+from . import Frame, Log, Membership, Octets
 
-BYTEORDER = sys.byteorder
+BYTEORDER = Octets.BYTEORDER
 MPC_PORT = 5005
+MPC_GROUP_PORT = 5006 # port of the multicast group, bound by every party of a host besides its own port
+MAX_DATAGRAM_SIZE = 1 << 16 # larger than any UDP payload, so that a datagram fills a buffer only if truncated
+
+# socket option adding the number of datagrams dropped by the kernel to every received datagram (Linux only)
+SO_RXQ_OVFL = getattr(socket, "SO_RXQ_OVFL", 40 if sys.platform.startswith("linux") else None)
 
 SUCCESS = 1
 FAILED = 0
@@ -64,22 +74,258 @@ class Message:
 	def from_bytes(b):
 		frame = Frame.Frame.from_bytes(b[:])
 
-		return Message(Message.FRAME, None, frame)
+		return Message.of_frame(None, frame)
 
-class NetworkInterface(threading.Thread):
-	def __init__(self):
-		super(NetworkInterface, self).__init__()
-		self.parties_addr = {}
-		self.quit = False
+	def of_frame(origin, frame):
+		"""
+		Wrap a received frame, heartbeats are PING messages.
+
+		Arguments:
+			origin (tuple): address the frame was received from.
+			frame (Frame): the frame.
+
+		Returns:
+			The message.
+		"""
+		return Message(Message.PING if frame.get_type() == Frame.Frame.PING else Message.FRAME, origin, frame)
+
+class MessageQueue:
+	"""
+	Bounded queue of received messages, between the receiving thread and the protocol execution.
+	Messages are dropped when it is full so that the receiver never blocks.
+	"""
+	def __init__(self, maxsize = 256):
+		self.queue = queue.Queue(maxsize)
+		self.lock = threading.Lock()
+		self.received = 0 # number of messages offered to the queue
+		self.dropped = 0 # number of messages dropped because the queue was full
+		self.high_water = 0 # maximum depth reached
+
+	def put(self, message):
+		"""
+		Append a message to the queue without blocking.
+
+		Arguments:
+			message (Message): the message to append.
+
+		Returns:
+			True if the message has been queued, False if it has been dropped.
+		"""
+		with self.lock:
+			self.received += 1
+			try:
+				self.queue.put_nowait(message)
+			except queue.Full:
+				self.dropped += 1
+				return False
+
+			depth = self.queue.qsize()
+			if depth > self.high_water:
+				self.high_water = depth
+
+		return True
+
+	def put_batch(self, messages):
+		"""
+		Append several messages to the queue without blocking.
+
+		Arguments:
+			messages (list): the messages to append.
+
+		Returns:
+			The number of messages dropped.
+		"""
+		dropped = 0
+		with self.lock:
+			self.received += len(messages)
+			for message in messages:
+				try:
+					self.queue.put_nowait(message)
+				except queue.Full:
+					dropped += 1
+
+			self.dropped += dropped
+			depth = self.queue.qsize()
+			if depth > self.high_water:
+				self.high_water = depth
+
+		return dropped
+
+	def get(self, timeout = None):
+		"""
+		Get the oldest message of the queue.
+
+		Arguments:
+			timeout (float): maximum waiting time in seconds. (Optional, default: None = wait forever)
+
+		Returns:
+			The message, or None if the queue stayed empty until the timeout.
+		"""
+		try:
+			return self.queue.get(timeout = timeout)
+		except queue.Empty:
+			return None
+
+	def depth(self):
+		return self.queue.qsize()
+
+	def get_stats(self):
+		"""
+		Get the statistics of the queue.
+
+		Returns:
+			Dictionary with the current depth, the high-water mark and the received and dropped counts.
+		"""
+		with self.lock:
+			return {"depth": self.queue.qsize(), "high_water": self.high_water, "received": self.received, "dropped": self.dropped}
+
+def get_frame_type(frame):
+	"""
+	Get the type of a frame held by a container, the frames packed by the Coalescer are already encoded.
+
+	Arguments:
+		frame (Frame or bytes): the frame.
+
+	Returns:
+		The type, None for an empty encoded frame.
+	"""
+	if isinstance(frame, (bytes, bytearray)):
+		# high nibble of the first byte
+		return frame[0]//16 if frame else None
+	return frame.get_type()
+
+def start_timer(delay, callback):
+	"""
+	Call a function after a delay, on a timer thread.
+
+	Arguments:
+		delay (float): the delay in seconds.
+		callback (function): the function to call.
+	"""
+	timer = threading.Timer(delay, callback)
+	timer.daemon = True
+	timer.start()
+
+class Coalescer:
+	"""
+	Outbound scheduler of a party: the frames sent to a destination are queued and packed into container frames
+	of at most mtu bytes, so that several frames are sent in one datagram. A queue is flushed when its datagram
+	is full, delay seconds after the first queued frame, or when flush is called.
+	"""
+	HEADER_SIZE = 16 # upper bound of the header of a container frame
+
+	def __init__(self, interface, mtu = 1400, delay = 0.002, schedule = start_timer):
+		self.interface = interface
+		self.mtu = mtu # maximum size of a datagram, 0 to send every frame on its own
+		self.delay = delay
+		self.schedule = schedule # function(delay, callback) used to arm the flush deadline
+		self.lock = threading.Lock()
+		self.pending = {} # by destination (pid, None for broadcast): [messages, encoded frames, size]
+		self.armed = False # a flush is scheduled
+		self.frames = 0 # number of frames sent
+		self.datagrams = 0 # number of datagrams sent
+
+	def broadcast(self, message):
+		"""
+		Queue a message for every party.
+
+		Arguments:
+			message (Message): the message to be sent.
+		"""
+		self.enqueue(None, message)
+
+	def send_to(self, to_pid, message):
+		"""
+		Queue a message for a party.
+
+		Arguments:
+			to_pid (int): pid of the party to whom the message is destinated to.
+			message (Message): the message to be sent.
+		"""
+		self.enqueue(to_pid, message)
+
+	def enqueue(self, destination, message):
+		if not self.mtu:
+			self.transmit(destination, [message], None)
+			return
+
+		data = message.content.to_bytes()
+		size = len(data) + len(Octets.encode_varint(len(data)))
+		budget = self.mtu - Coalescer.HEADER_SIZE
+		ready = []
+		with self.lock:
+			queued = self.pending.get(destination)
+			if queued is not None and queued[2] + size > budget:
+				# no room left in the datagram of this destination
+				ready.append((destination, *self.pending.pop(destination)[:2]))
+				queued = None
+			if queued is None:
+				queued = self.pending[destination] = [[], [], 0]
+			queued[0].append(message)
+			queued[1].append(data)
+			queued[2] += size
+			if queued[2] >= budget:
+				ready.append((destination, *self.pending.pop(destination)[:2]))
+			arm = bool(self.pending) and not self.armed
+			if arm:
+				self.armed = True
+
+		for destination, messages, frames in ready:
+			self.transmit(destination, messages, frames)
+		if arm:
+			self.schedule(self.delay, self.flush)
+
+	def flush(self):
+		"""
+		Send every queued frame now.
+		"""
+		with self.lock:
+			ready = [(destination, *queued[:2]) for destination, queued in self.pending.items()]
+			self.pending = {}
+			self.armed = False
+
+		for destination, messages, frames in ready:
+			self.transmit(destination, messages, frames)
+
+	def transmit(self, destination, messages, frames):
+		if len(messages) == 1:
+			message = messages[0]
+		else:
+			first = messages[0].content
+			container = Frame.Frame(Frame.Frame.CONTAINER, first.get_version(), first.get_origin(), frames)
+			message = Message(Message.FRAME, messages[0].get_origin(), container)
+
+		self.frames += len(messages)
+		self.datagrams += 1
+		if destination is None:
+			self.interface.broadcast(message)
+		else:
+			self.interface.send_to(destination, message)
+
+	def get_stats(self):
+		"""
+		Get the statistics of the scheduler.
+
+		Returns:
+			Dictionary with the number of frames and datagrams sent.
+		"""
+		return {"frames": self.frames, "datagrams": self.datagrams}
+
+class Interface(abc.ABC):
+	"""
+	Contract shared by every transport used by a party: address book of the known parties,
+	receive handler, send_to and broadcast.
+	"""
+	mtu = 1400 # size up to which the frames sent to a party are packed together
 
+	def __init__(self, ip, port):
+		self.membership = Membership.Membership() # address book, shared with the party
+		self.parties_addr = self.membership.addrs
 		self.on_recv_callback = None
-		self.ip = '0.0.0.0' #socket.gethostbyname(socket.gethostname())
-		print("My IP is:", self.ip)
-		self.port = MPC_PORT
-		self.s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-		self.s.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
-		with open("/tmp/log.log", "a") as f:
-			f.write(f"port = {self.port}\n")
+		self.on_recv_batch_callback = None
+		self.ip = ip
+		self.port = port
+		self.decode_errors = 0 # number of received frames that could not be decoded
 
 	def get_ip(self):
 		return self.ip
@@ -99,20 +345,72 @@ class NetworkInterface(threading.Thread):
 		"""
 		self.on_recv_callback = callback
 
-	def stop(self):
-		self.quit = True
+	def set_batch_handler(self, callback):
+		"""
+		Set the callback to use when receiving several messages at once. If not set, the receive handler
+		is called for each message.
 
-	def run(self):
+		Arguments:
+			callback (function): the callback to use, called with a list of messages.
 		"""
+		self.on_recv_batch_callback = callback
+
+	def decode(self, data, addr):
 		"""
-		print("binding")
-		self.s.bind((self.ip, self.port))
+		Decode received bytes, unpacking container frames. Undecodable frames are dropped.
 
-		while not self.quit:
-			data, (addr, port) = self.s.recvfrom(1024)
-			if data:
-				message = Message.from_bytes(data)
-				message.set_origin((addr, port))
+		Arguments:
+			data (bytes): the received bytes.
+			addr (tuple): address the bytes were received from.
+
+		Returns:
+			List of messages, empty if the bytes could not be decoded.
+		"""
+		try:
+			message = Message.from_bytes(data)
+		except (Frame.UnknownVersionException, Frame.UnknownTypeException, Frame.MalformedFrameException):
+			self.decode_errors += 1
+			return []
+
+		if message.content.get_type() == Frame.Frame.CONTAINER:
+			return [Message.of_frame(addr, frame) for frame in message.content.get_payload()]
+
+		message.set_origin(addr)
+		return [message]
+
+	def deliver(self, data, addr):
+		"""
+		Decode received bytes and hand the messages to the receive handler.
+
+		Arguments:
+			data (bytes): the received bytes.
+			addr (tuple): address the bytes were received from.
+		"""
+		messages = self.decode(data, addr)
+		if len(messages) == 1:
+			self.on_recv_callback(messages[0])
+		elif messages:
+			self.hand_over(messages)
+
+	def deliver_batch(self, datagrams):
+		"""
+		Decode several received datagrams and hand the messages to the batch handler at once.
+
+		Arguments:
+			datagrams (list): (bytes, address) pairs.
+		"""
+		messages = []
+		for data, addr in datagrams:
+			messages.extend(self.decode(data, addr))
+
+		if messages:
+			self.hand_over(messages)
+
+	def hand_over(self, messages):
+		if self.on_recv_batch_callback is not None:
+			self.on_recv_batch_callback(messages)
+		else:
+			for message in messages:
 				self.on_recv_callback(message)
 
 	def set_party(self, id, addr):
@@ -123,10 +421,7 @@ class NetworkInterface(threading.Thread):
 			id (int): Identifier of a party.
 			addr (str): String representing an IPv4 address.
 		"""
-		if id in self.parties_addr.keys():
-			return False
-		
-		self.parties_addr[id] = addr
+		return self.membership.set_addr(id, addr)
 
 	def get_party_id_by_addr(self, addr):
 		"""
@@ -138,11 +433,264 @@ class NetworkInterface(threading.Thread):
 		Returns:
 			The party id whom the address belongs to, if known. None otherwize.
 		"""
-		for party_id, party_addr in self.parties_addr.items():
-			if party_addr == addr:
-				return party_id
+		return self.membership.get_id(addr)
+
+	def stop(self):
+		pass
+
+	@abc.abstractmethod
+	def broadcast(self, message):
+		"""
+		Allows broadcasting of messages.
+
+		Arguments:
+			message (Message): the message to be sent.
+
+		Returns:
+			Sending status.
+		"""
+
+	@abc.abstractmethod
+	def send_to(self, to_pid, message):
+		"""
+		Allows a network interface to send a message to another party.
+
+		Arguments:
+			to_pid (int): pid of the party to whom the message is destinated to.
+			message (Message): the message to be sent.
+
+		Returns:
+			Sending status.
+		"""
+
+class Loopback:
+	"""
+	In-memory medium shared by the loopback interfaces of the parties running in a process.
+	Frames are handed over without sockets and, unless serialize is set, without being encoded:
+	only the payloads modified by their receivers (REQUEST and SYNC circuits) are copied through their codec.
+	"""
+	COPIED_TYPES = (Frame.Frame.SYNC, Frame.Frame.REQUEST, Frame.Frame.CONTAINER) # containers hold encoded frames
+
+	def __init__(self, serialize = False):
+		self.serialize = serialize
+		self.interfaces = {} # by address
+		self.frames = 0 # number of frames handed over
+
+	def transfer(self, message, origin, targets):
+		"""
+		Hand a message over to interfaces.
+
+		Arguments:
+			message (Message): the message.
+			origin (tuple): address of the sender.
+			targets (list): the receiving interfaces.
+		"""
+		frame = message.content
+		encoded = frame.to_bytes() if self.serialize or frame.get_type() in Loopback.COPIED_TYPES else None
+		for target in targets:
+			if encoded is None:
+				messages = [Message.of_frame(origin, frame)]
+			else:
+				messages = target.decode(encoded, origin)
+			self.frames += len(messages)
+			target.post(messages)
+
+class LoopbackInterface(Interface):
+	"""
+	Interface of a party on a loopback medium, its address is ("loopback", pid).
+	Messages are posted to the receive handler of the destination, on its event loop for asyncio parties.
+	"""
+	mtu = 0 # no datagram to fill, frames are not coalesced
 
-		return None
+	def __init__(self, loopback, pid):
+		super(LoopbackInterface, self).__init__("loopback", pid)
+		self.loopback = loopback
+		self.loop = None # event loop of an asyncio party
+		loopback.interfaces[self.get_addr()] = self
+
+	async def start(self):
+		self.loop = asyncio.get_running_loop()
+
+	def stop(self):
+		self.loopback.interfaces.pop(self.get_addr(), None)
+
+	def post(self, messages):
+		if self.loop is not None:
+			self.loop.call_soon_threadsafe(self.hand_over, messages)
+		else:
+			self.hand_over(messages)
+
+	def broadcast(self, message):
+		"""
+		Allows broadcasting of messages.
+
+		Arguments:
+			message (Message): the message to be sent.
+		"""
+		targets = [interface for addr, interface in list(self.loopback.interfaces.items()) if addr != self.get_addr()]
+		self.loopback.transfer(message, self.get_addr(), targets)
+
+	def send_to(self, to_pid, message):
+		"""
+		Allows a network interface to send a message to another party.
+
+		Arguments:
+			to_pid (int): pid of the party to whom the message is destinated to.
+			message (Message): the message to be sent.
+		"""
+		target = self.loopback.interfaces.get(self.parties_addr[to_pid])
+		if target is not None:
+			self.loopback.transfer(message, self.get_addr(), [target])
+
+class NetworkInterface(Interface, threading.Thread):
+	"""
+	UDP transport. Frames are sent from, and received on, the address of the party. Broadcast frames are sent
+	to the broadcast address, or to an IP multicast group if one is given: only the hosts that joined the
+	group receive them, and several parties of a host can share it (over the loopback interface for tests).
+	"""
+	def __init__(self, ip = '0.0.0.0', port = MPC_PORT, broadcast_addr = None, multicast_group = None, multicast_interface = '0.0.0.0', multicast_ttl = 1, rcvbuf = 1 << 20, batch_size = 64, buffer_size = MAX_DATAGRAM_SIZE):
+		"""
+		Arguments:
+			ip (str): address the party is bound to. (Optional, default: every address)
+			port (int): port the party is bound to, 0 to let the system choose. (Optional, default: MPC_PORT)
+			broadcast_addr (tuple): destination of broadcast frames. (Optional, default: 255.255.255.255 on the port of the party)
+			multicast_group (tuple): (group address, port) used instead of broadcast, the port must differ from the port of the party, MPC_GROUP_PORT for instance. (Optional, default: None)
+			multicast_interface (str): address of the local interface used for multicast. (Optional, default: chosen by the system)
+			multicast_ttl (int): number of routers multicast frames may cross. (Optional, default: 1 = local network)
+			rcvbuf (int): size requested for the kernel receive buffer in bytes. (Optional, default: 1 MiB)
+			batch_size (int): maximum number of datagrams read before handing them to the handler. (Optional, default: 64)
+			buffer_size (int): size of the buffer of each datagram in bytes, larger datagrams are truncated and dropped. (Optional, default: 64 KiB)
+		"""
+		if multicast_group is not None and port == multicast_group[1]:
+			# the party would receive the frames of the group twice, if it could bind its port at all
+			raise ValueError(f"Port {port} of the party is the port of the multicast group.")
+
+		threading.Thread.__init__(self, daemon = True)
+		Interface.__init__(self, ip, port)
+		self.quit = False
+		self.broadcast_addr = broadcast_addr
+		self.multicast_group = multicast_group
+		self.bound = False
+		self.ancillary_size = 0 # set if the kernel drop counter is available
+
+		self.logger = Log.get_logger(f"Link: {self.ip}")
+		self.s = self.make_socket(rcvbuf)
+		self.s.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+		self.rcvbuf = self.s.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF) # the kernel may grant another size
+		self.m = None # socket receiving the multicast frames
+		if multicast_group is not None:
+			self.s.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, multicast_ttl)
+			self.s.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1) # for the parties of this host
+			self.s.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_IF, socket.inet_aton(multicast_interface))
+			self.m = self.make_socket(rcvbuf)
+			# every party of the host binds the group port
+			self.m.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+			if hasattr(socket, "SO_REUSEPORT"):
+				self.m.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+			self.m.bind(multicast_group)
+			self.m.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, socket.inet_aton(multicast_group[0]) + socket.inet_aton(multicast_interface))
+
+		# buffers are allocated once and reused by every batch
+		self.buffers = [memoryview(bytearray(buffer_size)) for _ in range(batch_size)]
+		self.kernel_drops = 0 # datagrams dropped by the kernel because the receive buffer was full
+		self.truncated = 0 # datagrams dropped because they were larger than their buffer
+		self.socket_drops = {} # kernel drop counter of each socket
+		self.batches = 0
+		self.datagrams = 0
+		self.max_batch = 0
+
+	def make_socket(self, rcvbuf):
+		s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+		if rcvbuf:
+			s.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+		if SO_RXQ_OVFL is not None:
+			try:
+				s.setsockopt(socket.SOL_SOCKET, SO_RXQ_OVFL, 1)
+				self.ancillary_size = socket.CMSG_SPACE(4)
+			except (OSError, AttributeError):
+				pass
+		s.setblocking(False)
+
+		return s
+
+	def bind(self):
+		"""
+		Bind the socket of the party, done when the interface starts if not done before.
+		"""
+		self.s.bind((self.ip, self.port))
+		if self.port == 0:
+			# port chosen by the system
+			self.port = self.s.getsockname()[1]
+		self.bound = True
+		self.logger.debug("bound to port %d", self.port)
+
+	def stop(self):
+		self.quit = True
+
+	def run(self):
+		"""
+		"""
+		if not self.bound:
+			self.bind()
+
+		while not self.quit:
+			batch = self.drain(timeout = 1)
+			if batch:
+				self.deliver_batch(batch)
+
+	def drain(self, timeout = None):
+		"""
+		Wait for datagrams, then read every pending datagram without blocking, up to the batch size.
+
+		Arguments:
+			timeout (float): maximum waiting time for the first datagram in seconds. (Optional, default: None = wait forever)
+
+		Returns:
+			List of (bytes, address) pairs.
+		"""
+		readable, _, _ = select.select([self.s] if self.m is None else [self.s, self.m], [], [], timeout)
+		if not readable:
+			return []
+
+		batch = []
+		buffers = iter(self.buffers)
+		for s in readable:
+			for buffer in buffers:
+				try:
+					if self.ancillary_size:
+						n, ancillary, flags, addr = s.recvmsg_into([buffer], self.ancillary_size)
+						truncated = flags & socket.MSG_TRUNC
+						for level, c_type, c_data in ancillary:
+							if level == socket.SOL_SOCKET and c_type == SO_RXQ_OVFL:
+								# cumulative count since the creation of the socket
+								self.socket_drops[s] = int.from_bytes(c_data[:4], sys.byteorder)
+								self.kernel_drops = sum(self.socket_drops.values())
+					else:
+						n, addr = s.recvfrom_into(buffer)
+						truncated = n == len(buffer)
+				except (BlockingIOError, InterruptedError):
+					break
+
+				if truncated:
+					# the rest of the datagram is lost, it could not be decoded
+					self.truncated += 1
+				elif n:
+					batch.append((bytes(buffer[:n]), addr))
+
+		self.batches += 1
+		self.datagrams += len(batch)
+		self.max_batch = max(self.max_batch, len(batch))
+
+		return batch
+
+	def get_stats(self):
+		"""
+		Get the statistics of the receiving loop.
+
+		Returns:
+			Dictionary with the kernel drops, the truncated datagrams, the number of batches and datagrams, the largest batch and the receive buffer size.
+		"""
+		return {"kernel_drops": self.kernel_drops, "truncated": self.truncated, "batches": self.batches, "datagrams": self.datagrams, "max_batch": self.max_batch, "rcvbuf": self.rcvbuf, "decode_errors": self.decode_errors}
 
 	def broadcast(self, message):
 		"""
@@ -154,7 +702,9 @@ class NetworkInterface(threading.Thread):
 		Returns:
 			Sending status.
 		"""
-		return self.s.sendto(message.to_bytes(), ("255.255.255.255", 5005))
+		if self.multicast_group is not None:
+			return self.sendto(message.to_bytes(), self.multicast_group)
+		return self.sendto(message.to_bytes(), self.broadcast_addr or ("255.255.255.255", self.port))
 
 	def send_to(self, to_pid, message):
 		"""
@@ -167,4 +717,316 @@ class NetworkInterface(threading.Thread):
 		Returns:
 			Sending status.
 		"""
-		return self.s.sendto(message.to_bytes(), (self.parties_addr[to_pid]))
\ No newline at end of file
+		return self.sendto(message.to_bytes(), (self.parties_addr[to_pid]))
+
+	def sendto(self, data, addr):
+		"""
+		Send a datagram, waiting for room in the send buffer of the non-blocking socket if needed.
+
+		Arguments:
+			data (bytes): the datagram.
+			addr (tuple): the destination address.
+
+		Returns:
+			The number of bytes sent.
+		"""
+		while True:
+			try:
+				return self.s.sendto(data, addr)
+			except BlockingIOError:
+				select.select([], [self.s], [], 1)
+
+class ReliablePeer:
+	"""
+	Reliable delivery state of a remote party.
+	"""
+	def __init__(self, rto):
+		# sending
+		self.next_seq = 1
+		self.unacked = {} # by sequence number, in sending order: [message, deadline, transmissions, first sending time]
+		self.forward = None # [deadline, transmissions, version] of the announcement of a base moved by frames given up
+		self.srtt = None # smoothed round-trip time
+		self.rttvar = None # round-trip time variation
+		self.rto = rto # retransmission timeout
+		# receiving
+		self.epoch = None # epoch of the remote party
+		self.delivered = 0 # every frame up to this sequence number has been delivered
+		self.out_of_order = {} # frames received after a gap, by sequence number
+
+	def get_base(self):
+		"""
+		Get the oldest sequence number still retransmitted to the party: every frame before it has been acknowledged or given up.
+
+		Returns:
+			The sequence number.
+		"""
+		# frames are numbered in sending order
+		return next(iter(self.unacked), self.next_seq)
+
+class ReliableInterface(Interface):
+	"""
+	Optional reliability layer on top of another interface. Frames sent to a party are numbered per peer,
+	acknowledged by cumulative and selective ACK frames, and retransmitted after a timeout derived from
+	the measured round-trip time. Received frames are delivered once and in order for each peer.
+	Every frame also carries the oldest sequence number the sender still retransmits (its base): a receiver never waits
+	for frames before it, neither those given up after max_transmissions nor those acknowledged before it restarted.
+
+	Broadcast frames of the types in reliable_broadcast, and containers holding one of them, are sent to each known party instead,
+	other broadcast frames (ADVERT, LEAVE) are sent as is.
+	"""
+	MAX_SACK = 32 # maximum number of selectively acknowledged sequence numbers in an ACK frame
+	WINDOW = 1024 # frames further than this from the last delivered one are dropped
+
+	def __init__(self, interface, party_id, rto = 0.1, min_rto = 0.01, max_rto = 2, max_transmissions = 8, schedule = start_timer):
+		super(ReliableInterface, self).__init__(interface.get_ip(), interface.get_port())
+		self.interface = interface
+		self.membership = interface.membership # shared address book
+		self.parties_addr = interface.parties_addr
+		self.mtu = interface.mtu
+		self.party_id = party_id
+		self.epoch = random.getrandbits(32) # distinguishes this instance from a previous run of the same party
+		self.initial_rto = rto
+		self.min_rto = min_rto
+		self.max_rto = max_rto
+		self.max_transmissions = max_transmissions
+		self.schedule = schedule # function(delay, callback) used to arm the retransmission timer
+		self.reliable_broadcast = (Frame.Frame.SYNC, Frame.Frame.REQUEST, Frame.Frame.BVECT, Frame.Frame.MALICIOUS, Frame.Frame.RESYNC)
+		self.peers = {}
+		self.lock = threading.RLock()
+		self.armed = False # a retransmission check is scheduled
+		self.stopped = False
+		self.retransmissions = 0
+		self.duplicates = 0
+		self.lost = 0 # frames given up after max_transmissions
+		interface.set_recv_handler(lambda message: self.on_frames([message]))
+		interface.set_batch_handler(lambda messages: self.on_frames(messages))
+
+	def get_ip(self):
+		return self.interface.get_ip()
+
+	def get_port(self):
+		return self.interface.get_port()
+
+	def get_addr(self):
+		return self.interface.get_addr()
+
+	def start(self):
+		return self.interface.start()
+
+	def stop(self):
+		self.stopped = True
+		self.interface.stop()
+
+	def get_peer(self, pid):
+		peer = self.peers.get(pid)
+		if peer is None:
+			peer = self.peers[pid] = ReliablePeer(self.initial_rto)
+
+		return peer
+
+	def broadcast(self, message):
+		"""
+		Allows broadcasting of messages.
+
+		Arguments:
+			message (Message): the message to be sent.
+		"""
+		if self.is_reliable(message.content):
+			for pid in list(self.parties_addr):
+				if pid != self.party_id:
+					self.send_to(pid, message)
+		else:
+			self.interface.broadcast(message)
+
+	def is_reliable(self, frame):
+		"""
+		Check whether a broadcast frame must be delivered reliably.
+
+		Arguments:
+			frame (Frame): the frame.
+
+		Returns:
+			True if its type is in reliable_broadcast, or if it is a container holding such a frame.
+		"""
+		if frame.get_type() == Frame.Frame.CONTAINER:
+			return any(get_frame_type(f) in self.reliable_broadcast for f in frame.get_payload())
+		return frame.get_type() in self.reliable_broadcast
+
+	def send_to(self, to_pid, message):
+		"""
+		Send a message to another party, and retransmit it until it is acknowledged.
+
+		Arguments:
+			to_pid (int): pid of the party to whom the message is destinated to.
+			message (Message): the message to be sent.
+		"""
+		frame = message.content
+		with self.lock:
+			peer = self.get_peer(to_pid)
+			seq = peer.next_seq
+			payload = (self.epoch, seq, peer.get_base(), frame.to_bytes())
+			peer.next_seq += 1
+			reliable = Message(Message.FRAME, message.get_origin(), Frame.Frame(Frame.Frame.RELIABLE, frame.get_version(), self.party_id, payload, session = frame.get_session()))
+			now = time.monotonic()
+			peer.unacked[seq] = [reliable, now + peer.rto, 1, now]
+			arm = not self.armed
+			self.armed = True
+
+		self.interface.send_to(to_pid, reliable)
+		if arm:
+			self.schedule(peer.rto, self.retransmit)
+
+	def retransmit(self):
+		"""
+		Resend the frames whose acknowledgement is late, then rearm the timer.
+		"""
+		resend = []
+		with self.lock:
+			if self.stopped:
+				self.armed = False
+				return
+			now = time.monotonic()
+			next_deadline = None
+			for pid, peer in self.peers.items():
+				for seq, entry in list(peer.unacked.items()):
+					if entry[1] <= now:
+						if entry[2] >= self.max_transmissions:
+							del peer.unacked[seq]
+							self.lost += 1
+							# the party must not wait for it any more
+							peer.forward = [now, 0, entry[0].content.get_version()]
+							continue
+						# exponential backoff
+						entry[2] += 1
+						entry[1] = now + min(peer.rto * 2**(entry[2]-1), self.max_rto)
+						resend.append((pid, entry[0]))
+					if next_deadline is None or entry[1] < next_deadline:
+						next_deadline = entry[1]
+				if peer.forward is not None and peer.forward[0] <= now:
+					if peer.forward[1] >= self.max_transmissions:
+						peer.forward = None
+					else:
+						peer.forward[1] += 1
+						peer.forward[0] = now + min(peer.rto * 2**(peer.forward[1]-1), self.max_rto)
+						forward = Frame.Frame(Frame.Frame.RELIABLE, peer.forward[2], self.party_id, (self.epoch, 0, peer.get_base(), None))
+						resend.append((pid, Message(Message.FRAME, self.get_addr(), forward)))
+				if peer.forward is not None and (next_deadline is None or peer.forward[0] < next_deadline):
+					next_deadline = peer.forward[0]
+			self.armed = next_deadline is not None
+
+		self.retransmissions += len(resend)
+		for pid, message in resend:
+			self.interface.send_to(pid, message)
+		if next_deadline is not None:
+			self.schedule(max(next_deadline - now, 0), self.retransmit)
+
+	def on_ack(self, pid, values):
+		if len(values) < 2 or values[0] != self.epoch:
+			return
+		cumulative, selective = values[1], values[2:]
+		now = time.monotonic()
+		with self.lock:
+			peer = self.peers.get(pid)
+			if peer is None:
+				return
+			acked = [seq for seq in peer.unacked if seq <= cumulative]
+			acked.extend(seq for seq in selective if seq in peer.unacked and seq > cumulative)
+			for seq in acked:
+				_, _, transmissions, sent = peer.unacked.pop(seq)
+				if transmissions == 1:
+					# Karn: only frames sent once give a meaningful sample
+					self.update_rtt(peer, now - sent)
+			if peer.forward is not None and cumulative >= peer.get_base() - 1:
+				# the party no longer waits for the frames given up
+				peer.forward = None
+
+	def update_rtt(self, peer, sample):
+		if peer.srtt is None:
+			peer.srtt = sample
+			peer.rttvar = sample / 2
+		else:
+			peer.rttvar = 0.75 * peer.rttvar + 0.25 * abs(peer.srtt - sample)
+			peer.srtt = 0.875 * peer.srtt + 0.125 * sample
+		peer.rto = min(max(peer.srtt + 4 * peer.rttvar, self.min_rto), self.max_rto)
+
+	def on_reliable(self, pid, addr, payload, delivered):
+		epoch, seq, base, frame = payload
+		peer = self.get_peer(pid)
+		if peer.epoch != epoch:
+			# first frame of the party or of a new run of it, or first frame since this party restarted
+			peer.epoch = epoch
+			peer.delivered = base - 1
+			peer.out_of_order = {}
+		elif base - 1 > peer.delivered:
+			# the party gave up frames: deliver the ones received after them
+			for s in sorted(s for s in peer.out_of_order if s < base):
+				self.unpack(addr, peer.out_of_order.pop(s), delivered)
+			peer.delivered = base - 1
+
+		if frame is not None:
+			if seq <= peer.delivered or seq in peer.out_of_order:
+				self.duplicates += 1
+			elif seq <= peer.delivered + ReliableInterface.WINDOW:
+				peer.out_of_order[seq] = frame
+
+		while peer.delivered + 1 in peer.out_of_order:
+			peer.delivered += 1
+			self.unpack(addr, peer.out_of_order.pop(peer.delivered), delivered)
+
+	def unpack(self, addr, frame, delivered):
+		if frame.get_type() == Frame.Frame.CONTAINER:
+			delivered.extend(Message.of_frame(addr, f) for f in frame.get_payload())
+		else:
+			delivered.append(Message.of_frame(addr, frame))
+
+	def on_frames(self, messages):
+		"""
+		Handle the messages received by the underlying interface: process the ACK frames, deliver the
+		reliable frames in order and acknowledge them, and pass the other frames through.
+
+		Arguments:
+			messages (list): the received messages.
+		"""
+		delivered = []
+		to_ack = {}
+		for message in messages:
+			frame = message.content
+			f_type = frame.get_type()
+			pid = frame.get_origin()
+			if f_type == Frame.Frame.ACK:
+				self.on_ack(pid, frame.get_payload())
+			elif f_type == Frame.Frame.RELIABLE:
+				with self.lock:
+					self.on_reliable(pid, message.get_origin(), frame.get_payload(), delivered)
+				to_ack[pid] = (message.get_origin(), frame.get_version())
+			else:
+				delivered.append(message)
+
+		for pid, (addr, version) in to_ack.items():
+			# frames may be acknowledged before the party is adverted
+			self.set_party(pid, addr)
+			with self.lock:
+				peer = self.peers[pid]
+				payload = [peer.epoch, peer.delivered] + sorted(peer.out_of_order)[:ReliableInterface.MAX_SACK]
+			ack = Frame.Frame(Frame.Frame.ACK, version, self.party_id, payload)
+			self.interface.send_to(pid, Message(Message.FRAME, self.get_addr(), ack))
+
+		if delivered:
+			self.hand_over(delivered)
+
+	def get_stats(self):
+		"""
+		Get the statistics of the reliability layer.
+
+		Returns:
+			Dictionary with the number of retransmitted, duplicate and lost frames, the frames waiting for an acknowledgement
+			and the retransmission timeout of each peer.
+		"""
+		with self.lock:
+			return {
+				"retransmissions": self.retransmissions,
+				"duplicates": self.duplicates,
+				"lost": self.lost,
+				"unacked": sum(len(peer.unacked) for peer in self.peers.values()),
+				"rto": {pid: peer.rto for pid, peer in self.peers.items()}
+			}
@@ -0,0 +1,123 @@
+#!/bin/bash/python3
+#encoding: utf-8
+
+"""
+Logging of the parties. Records are created only for enabled levels and queued unformatted,
+a background thread formats them and writes them by batches to a buffered file (and to the standard output).
+"""
+
+import logging
+import os
+import queue
+import sys
+import threading
+
+DEBUG = logging.DEBUG # every received and sent frame, shares and intermediate values
+INFO = logging.INFO # progress of the computations
+WARNING = logging.WARNING # failed computations, dropped frames, blacklisted parties
+
+LOG_PATH = "/tmp/log.log"
+
+class BufferedHandler(logging.Handler):
+	"""
+	Handler queuing the records for a writer thread, which formats every record waiting in the queue
+	and flushes the file once per batch.
+	"""
+	def __init__(self, path = LOG_PATH, stdout = True, buffer_size = 1 << 16):
+		super(BufferedHandler, self).__init__()
+		self.file = open(path, "a", buffering = buffer_size)
+		self.stdout = stdout
+		self.start()
+
+	def start(self):
+		self.records = queue.SimpleQueue()
+		self.writer = threading.Thread(target = self.write, daemon = True)
+		self.writer.start()
+
+	def emit(self, record):
+		# formatted by the writer thread
+		self.records.put(record)
+
+	def write(self):
+		while True:
+			batch = [self.records.get()]
+			try:
+				while True:
+					batch.append(self.records.get_nowait())
+			except queue.Empty:
+				pass
+
+			closing = None in batch
+			lines = []
+			for record in batch:
+				if record is not None:
+					try:
+						lines.append(self.format(record) + "\n")
+					except Exception:
+						self.handleError(record)
+			text = "".join(lines)
+			self.file.write(text)
+			self.file.flush()
+			if self.stdout:
+				sys.stdout.write(text)
+			if closing:
+				return
+
+	def close(self):
+		"""
+		Write the queued records and close the file.
+		"""
+		if self.writer.is_alive():
+			self.records.put(None)
+			self.writer.join()
+		self.file.close()
+		super(BufferedHandler, self).close()
+
+logger = logging.getLogger("mpc")
+handler = None
+setup_lock = threading.RLock()
+
+def setup(level = INFO, path = LOG_PATH, stdout = True):
+	"""
+	Configure the logging of the parties, replacing the previous configuration.
+
+	Arguments:
+		level (int): records below this level are not created. (Optional, default: INFO)
+		path (str): file the records are appended to. (Optional, default: /tmp/log.log)
+		stdout (bool): also write the records to the standard output. (Optional, default: True)
+	"""
+	global handler
+	with setup_lock:
+		if handler is not None:
+			logger.removeHandler(handler)
+			handler.close()
+		handler = BufferedHandler(path, stdout)
+		handler.setFormatter(logging.Formatter("[%(party)s] %(message)s"))
+		logger.addHandler(handler)
+		logger.setLevel(level)
+		logger.propagate = False
+
+def restart_writer():
+	# a forked process only inherits the thread that forked, not the writer
+	if handler is not None:
+		handler.start()
+
+if hasattr(os, "register_at_fork"):
+	os.register_at_fork(after_in_child = restart_writer)
+
+def get_logger(party = None):
+	"""
+	Get the logger of the parties, configured with the default settings on first use.
+
+	Arguments:
+		party (str): name written before the messages, the records must then give it in extra otherwise. (Optional, default: None)
+
+	Returns:
+		The logger, or an adapter of the logger adding the name of the party to the records.
+	"""
+	with setup_lock:
+		if handler is None:
+			setup()
+	if party is not None:
+		return logging.LoggerAdapter(logger, {"party": party})
+	return logger
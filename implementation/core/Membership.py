@@ -0,0 +1,154 @@
+#!/bin/bash/python3
+#encoding: utf-8
+
+import threading
+
+class Membership:
+	"""
+	Registry of the parties of the network, shared by a party and its network interface:
+	addresses by id and ids by address, known and blacklisted parties, and a dense index
+	for every party ever registered, usable to store per-party values in arrays.
+	Every lookup is a hash map access, whatever the size of the network.
+	"""
+	def __init__(self):
+		self.lock = threading.RLock()
+		self.addrs = {} # addresses by party id
+		self.ids = {} # party ids by address
+		self.known = set()
+		self.banned = set()
+		self.indexes = {} # dense index by party id, never reused
+		self.known_list = [] # known parties sorted by id, rebuilt when the set changes
+
+	def set_addr(self, pid, addr):
+		"""
+		Bind a party id to an address, unless the party already has one.
+
+		Arguments:
+			pid (int): identifier of the party.
+			addr (tuple): address of the party.
+
+		Returns:
+			True if the address has been set, False if the party already had one.
+		"""
+		with self.lock:
+			if pid in self.addrs:
+				return False
+			self.addrs[pid] = addr
+			self.ids[addr] = pid
+			self.index(pid)
+			return True
+
+	def forget(self, pid):
+		"""
+		Unbind a party from its address, so that a new one can be set.
+
+		Arguments:
+			pid (int): identifier of the party.
+		"""
+		with self.lock:
+			addr = self.addrs.pop(pid, None)
+			if addr is not None and self.ids.get(addr) == pid:
+				del self.ids[addr]
+
+	def get_addr(self, pid):
+		return self.addrs.get(pid)
+
+	def get_id(self, addr):
+		return self.ids.get(addr)
+
+	def index(self, pid):
+		"""
+		Get the dense index of a party, assigning the next one on first use.
+
+		Arguments:
+			pid (int): identifier of the party.
+
+		Returns:
+			The index, between 0 and the number of registered parties - 1.
+		"""
+		i = self.indexes.get(pid)
+		if i is None:
+			with self.lock:
+				i = self.indexes.setdefault(pid, len(self.indexes))
+
+		return i
+
+	def add(self, pid):
+		"""
+		Add a party to the known parties, unless it is blacklisted.
+
+		Arguments:
+			pid (int): identifier of the party.
+
+		Returns:
+			True if the party has been added, False if it was already known or is blacklisted.
+		"""
+		with self.lock:
+			if pid in self.known or pid in self.banned:
+				return False
+			self.known.add(pid)
+			self.index(pid)
+			self.known_list = sorted(self.known)
+			return True
+
+	def remove(self, pid):
+		"""
+		Remove a party from the known parties.
+
+		Arguments:
+			pid (int): identifier of the party.
+
+		Returns:
+			True if the party was known.
+		"""
+		with self.lock:
+			if pid not in self.known:
+				return False
+			self.known.discard(pid)
+			self.known_list = sorted(self.known)
+			return True
+
+	def set_known(self, pids):
+		"""
+		Replace the known parties.
+
+		Arguments:
+			pids (iterable): identifiers of the parties.
+		"""
+		with self.lock:
+			self.known = set(pids)
+			for pid in sorted(self.known):
+				self.index(pid)
+			self.known_list = sorted(self.known)
+
+	def ban(self, pid):
+		"""
+		Blacklist a party and remove it from the known parties.
+
+		Arguments:
+			pid (int): identifier of the party.
+
+		Returns:
+			True if the party was not blacklisted yet.
+		"""
+		with self.lock:
+			self.remove(pid)
+			if pid in self.banned:
+				return False
+			self.banned.add(pid)
+			return True
+
+	def is_known(self, pid):
+		return pid in self.known
+
+	def is_banned(self, pid):
+		return pid in self.banned
+
+	def get_known(self):
+		"""
+		Get the known parties, sorted by id so that every party iterates them in the same order.
+
+		Returns:
+			List of party ids, not to be modified.
+		"""
+		return self.known_list
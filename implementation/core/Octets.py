@@ -1,6 +1,15 @@
 #!/bin/bash/python3
 #encoding: utf-8
 
+import struct
+
+# every integer of the protocol is encoded in network byte order, whatever the host is
+BYTEORDER = "big"
+
+# fixed-width headers of the stream and shared-memory transports
+UINT32 = struct.Struct(">I")
+UINT64 = struct.Struct(">Q")
+
 def get_len(val):
 		"""
 		Get the minimum bytes number required to represent an integer value.
@@ -11,8 +20,107 @@ def get_len(val):
 		Returns:
 			The minimum number of bytes required.
 		"""
-		i = 1
+		return (val.bit_length() + 7) // 8 or 1
+
+def uint_to_bytes(val, length):
+		"""
+		Encode a positive integer on a given number of bytes, in network byte order.
+
+		Arguments:
+			val (int): The value to encode.
+			length (int): The number of bytes to use.
+
+		Returns:
+			The encoded value.
+		"""
+		return val.to_bytes(length, BYTEORDER)
+
+def uint_from_bytes(b):
+		"""
+		Decode a positive integer encoded by uint_to_bytes.
+
+		Arguments:
+			b (bytes): The bytes holding the value, and only it.
+
+		Returns:
+			The value.
+		"""
+		return int.from_bytes(b, BYTEORDER)
+
+def encode_uint(val):
+		"""
+		Encode a positive integer on the minimum number of bytes, prefixed by that number.
+
+		Arguments:
+			val (int): The value to encode.
+
+		Returns:
+			The encoded value.
+		"""
+		length = get_len(val)
+		return bytes((length,)) + uint_to_bytes(val, length)
+
+def decode_uint(b, i = 0):
+		"""
+		Decode a positive integer encoded by encode_uint.
+
+		Arguments:
+			b (bytes): The bytes holding the value.
+			i (int): Index of the length byte of the value. (Optional, default: 0)
+
+		Returns:
+			The value and the index of the byte following it.
+
+		Raises:
+			IndexError: The value is truncated.
+		"""
+		length = b[i]
+		if i+1+length > len(b):
+			raise IndexError(f"Integer of {length} bytes truncated.")
+		return (uint_from_bytes(b[i+1:i+1+length]), i+1+length)
+
+
+def encode_varint(val):
+		"""
+		Encode a positive integer on a variable number of bytes (7 bits per byte, low bits first).
+
+		Arguments:
+			val (int): The value to encode.
+
+		Returns:
+			The encoded value.
+		"""
+		s = bytearray()
+		while val >= 0x80:
+			s.append((val & 0x7f) | 0x80)
+			val >>= 7
+		s.append(val)
+
+		return bytes(s)
+
+def decode_varint(b, i = 0):
+		"""
+		Decode a positive integer encoded by encode_varint.
+
+		Arguments:
+			b (bytes): The bytes holding the value.
+			i (int): Index of the first byte of the value. (Optional, default: 0)
+
+		Returns:
+			The value and the index of the byte following it.
+
+		Raises:
+			IndexError: The value is truncated.
+			ValueError: The value is longer than 64 bits.
+		"""
+		val = 0
+		shift = 0
 		while True:
-			if val < 2**(8*i):
-				return i
-			i += 1
\ No newline at end of file
+			byte = b[i]
+			i += 1
+			val |= (byte & 0x7f) << shift
+			if byte < 0x80:
+				return (val, i)
+			shift += 7
+			if shift > 63:
+				raise ValueError("Varint longer than 64 bits.")
@@ -1,20 +1,58 @@
 #!/bin/bash/python3
 #encoding: utf-8
 
+import concurrent.futures
+import itertools
 import random
 import threading
 import time
-from . import Link, Crypto, Frame
+from . import Link, Crypto, FailureDetector, Frame, Log, Scheduler, SessionManager, StateMachine, Timeout
 
 class PCEPSException(Exception):
 	pass
 
 class Party():
+	threaded = True # received messages and computations are handled by threads, see AsyncParty otherwize
 	START = 0
 	AWAITING = 1
 	SYNC = 2
 	COMP = 3
 	RES = 4
+	SESSION_TYPES = [Frame.Frame.SHARE, Frame.Frame.MUL, Frame.Frame.RESULT, Frame.Frame.BVECT, Frame.Frame.MALICIOUS, Frame.Frame.RESYNC] # frames routed to a session
+
+	def make_sum_circuit(parties, prime):
+		"""
+		Build the circuit summing the inputs of the given parties.
+
+		Arguments:
+			parties (list): ids of the input parties, at least 2.
+			prime (int): modulo of the computation.
+
+		Returns:
+			The circuit.
+		"""
+		input_gates = []
+		for party in parties:
+			gate = Crypto.Gate(Crypto.Gate.SHARE, value = party)
+			gate.set_prime(prime)
+			input_gates.append(gate)
+
+		circuit = Crypto.Circuit()
+
+		gate = Crypto.Gate(Crypto.Gate.ADD)
+		gate.set_prime(prime)
+		gate.set_inputs(input_gates[0:2])
+		circuit.add_gate(gate)
+		previous_gate = gate
+
+		for i in range(len(input_gates)-2):
+			gate = Crypto.Gate(Crypto.Gate.ADD)
+			gate.set_prime(prime)
+			gate.set_inputs([previous_gate, input_gates[2+i]])
+			circuit.add_gate(gate)
+			previous_gate = gate
+
+		return circuit
 
 	def get_str_state(s):
 		if s == Party.START:
@@ -28,374 +66,683 @@ class Party():
 		if s == Party.RES:
 			return "RES"
 
-	def __init__(self, party_id, master = False, version = Frame.Frame.PCEPS):
+	def __init__(self, party_id, master = False, version = Frame.Frame.PCEPS, networkInterface = None):
 		self.master = master
-		self.isProvider = False
 		self.state = Party.START # current state of the party
 		self.party_id = party_id # party identifier
-		self.networkInterface = Link.NetworkInterface() # link to Network Interface
-		self.networkInterface.set_recv_handler(lambda message: self.on_recv(message))
-		self.networkInterface.start()
-		self.known_parties = [self.party_id] # list of known parties by the party
-		self.blacklist = []
-		self.shares = {} # set of shares received from every party
-		self.B_vectors = {}
-		self.circuit = None # circuit to be computed by the parties
-		self.applicant = None # id of the party who sent a request
-		self.timeout = 10 # timeout in seconds used by the party to not block itself
-		self.k = 0 # number of parties that must participate to the computation
-		self.prime_p = 0 # prime number used as modulo during computation
-		self.prime_g = 0 # prime number used by VSS
-		self.results = {}
-		self.r_vect = {}
-		self.final_result = None
+		self.logger = Log.get_logger()
+		self.log_extra = {"party": f"Master: {party_id}" if master else f"PARTY: {party_id}"}
+		self.inbox = Link.MessageQueue(256) # received messages waiting to be handled
+		# an interface provided by the caller is started by the caller
+		start = networkInterface is None
+		self.networkInterface = Link.NetworkInterface() if start else networkInterface # link to Network Interface
+		self.outbound = Link.Coalescer(self.networkInterface, mtu = self.networkInterface.mtu) # packs the frames sent to a same destination
+		self.membership = self.networkInterface.membership # known and blacklisted parties, shared with the network interface
+		self.membership.add(self.party_id)
+		self.sessions = SessionManager.SessionManager() # computations in flight and recently finished, by session id
+		if self.threaded:
+			# the receiving thread only queues messages, they are handled by the dispatcher
+			# and computations run on the workers (one per session at most), so that receiving never waits for a computation
+			self.dispatcher = threading.Thread(target = self.dispatch, daemon = True)
+			self.dispatcher.start()
+			self.workers = concurrent.futures.ThreadPoolExecutor(max_workers = self.sessions.max_sessions)
+		self.timeout = 10 # timeout in seconds used by the party to not block itself, upper bound of the phase timeouts
+		self.min_timeout = 0.5 # lower bound of the phase timeouts in seconds
+		self.timeouts = Timeout.TimeoutEstimator() # durations of the phases observed for each party
+		self.detector = FailureDetector.PhiAccrualDetector() # liveness of the other parties
+		self.heartbeat_interval = 1 # time in seconds between two pings
+		self.ping_count = 0
 		self.advert_start_count = 0
 		self.advert_count_threshold = 3
 		self.version = version
-		self.stop_prot = False
+		self.check_results = True # check the results received beyond the k needed for the reconstruction
+		self.changed = threading.Condition() # notified each time a received frame has been handled
+		self.stopped = threading.Event()
+		self.make_machines()
+
+		# the interface may already be receiving: frames are handed to the party once it is ready
+		self.networkInterface.set_recv_handler(lambda message: self.receive(message))
+		self.networkInterface.set_batch_handler(lambda messages: self.receive_batch(messages))
+		if start:
+			self.networkInterface.start()
+
+	@property
+	def known_parties(self):
+		"""
+		Known parties (itself included), sorted by id. Replaced as a whole when assigned.
+		"""
+		return self.membership.get_known()
 
-	def log(self, message):
-		with open("/tmp/log.log", "a") as f:
-			if self.master:
-				text = f"[Master: {self.party_id}] {message}"
-			else:
-				text = f"[PARTY: {self.party_id}] {message}"
-			print(text)
-			f.write(text + "\n")
+	@known_parties.setter
+	def known_parties(self, parties):
+		self.membership.set_known(parties)
 
-	def clean(self):
-		self.state = Party.AWAITING
-		self.shares = {} # set of shares received from every party
-		self.B_vectors = {}
-		self.circuit = None # circuit to be computed by the parties
-		self.applicant = None # id of the party who sent a request
-		self.k = 0 # number of parties that must participate to the computation
-		self.prime_p = 0 # prime number used as modulo during computation
-		self.results = {}
-		self.r_vect = {}
-		self.final_result = None
-		self.advert_start_count = 0
-		# self.version = Frame.Frame.PCEPS
-		self.stop_prot = False
+	@property
+	def blacklist(self):
+		return self.membership.banned
 
-		self.log("cleaning")
+	def log(self, message, *args, level = Log.INFO):
+		"""
+		Log a message of the party. Nothing is done if the level is disabled,
+		otherwise the message is formatted with its arguments by the writer thread.
 
-	def sanity_check(self):
+		Arguments:
+			message (str): the message, with %-style placeholders for the arguments.
+			args: values of the placeholders.
+			level (int): Log.DEBUG, Log.INFO or Log.WARNING. (Optional, default: INFO)
 		"""
-		Perform the sanity check of the MPC protocol. It checks if all the parameters are pertinent in order to perform the computation.
+		if self.logger.isEnabledFor(level):
+			self.logger.log(level, message, *args, extra = self.log_extra)
+
+	def receive(self, message):
 		"""
-		if self.k < 2:
-			return False
+		Handler used by the network interface when a message is received.
 
-		begin = time.time()
-		n = len(self.known_parties) # every known party (itself in it)
-		while n < self.k:
-			if time.time() - begin > self.timeout:
-				self.clean()
-				return False
+		Arguments:
+			message (Message): the received message
+		"""
+		if not self.inbox.put(message):
+			self.log("inbox full, dropped %s", message, level = Log.WARNING)
 
-			n = len(self.known_parties) # every known party + itself
+	def receive_batch(self, messages):
+		"""
+		Handler used by the network interface when several messages are received at once.
 
-		if Crypto.isPrime(self.prime_p):
-			return True
+		Arguments:
+			messages (list): the received messages
+		"""
+		dropped = self.inbox.put_batch(messages)
+		if dropped:
+			self.log("inbox full, dropped %d messages", dropped, level = Log.WARNING)
 
-		return False
+	def dispatch(self):
+		"""
+		Handle the received messages one after the other, as long as the party lives.
+		"""
+		while True:
+			message = self.inbox.get()
+			try:
+				self.on_recv(message)
+			except Exception as e:
+				self.log("failed to handle %s: %s", message, e, level = Log.WARNING)
+			self.notify()
+
+	def notify(self):
+		"""
+		Wake up the computations waiting for a condition, after a received frame has been handled.
+		"""
+		with self.changed:
+			self.changed.notify_all()
 
-	def runPCEPS(self):
-		self.log("run PCEPS")
-		begin = time.time()
+	def wait(self, predicate, timeout):
+		"""
+		Block until a condition is fulfilled, without polling.
 
-		while self.state == Party.SYNC:
-			if time.time() - begin >= self.timeout:
-				#never received the SYNC frames => clear data in preparation of new request
-				self.clean()
-				self.log("Never received the SYNC frames before timeout.")
-				return
+		Arguments:
+			predicate (function): the condition, checked each time a frame is received.
+			timeout (float): maximum waiting time in seconds.
 
-			continue
+		Returns:
+			True if the condition is fulfilled, False on timeout.
+		"""
+		with self.changed:
+			return self.changed.wait_for(predicate, max(timeout, 0))
 
-		#Phase 1/4: OFFLINE
-		if not self.sanity_check():
-			self.clean()
-			self.log("Sanity Check didn't pass.")
-			return 
+	def stop(self):
+		"""
+		Make the run method return.
+		"""
+		self.stopped.set()
 
-		self.r_vect = Crypto.compute_recombination_vector(self.known_parties, self.prime_p)
+	def open_session(self, session_id, version, applicant = None):
+		"""
+		Create the state of a new computation.
 
-		#Phase 2/4: INPUT SHARING
-		if self.isProvider:
-			#send shares
-			secret = random.randint(15, 25)
-			self.log(f"secret = {secret}")
-			shares = Crypto.create_shares(secret, self.known_parties, self.k, self.prime_p)
-			self.log(f"shares = {shares}")
-
-			for s_id in shares.keys():
-				if s_id == self.party_id:
-					self.shares[s_id] = shares[s_id]
-				else:
-					frame = Frame.Frame(Frame.Frame.SHARE, self.version, self.party_id, shares[s_id])
-					message = Link.Message(Link.Message.FRAME, self.networkInterface.get_addr(), frame)
-					self.send(message, s_id)
-
-		begin = time.time()
+		Arguments:
+			session_id (int): identifier of the computation.
+			version (int): protocol version used by the computation.
+			applicant (int): id of the party who requested the computation. (Optional, default: None)
 
-		#Phase 3/4: COMPUTATION
-		#expect shares
-		while not all(e in list(self.shares.keys()) for e in self.circuit.get_input_ids()):
-			if time.time() - begin >= self.timeout:
-				#not enough shares received before timeout => stop computation and clear data in preparation of new request
-				self.log(f"{len(self.shares.keys())}, {len(self.known_parties)}")
-				self.log("A party failed to participate.")
-				self.clean()
-				return
+		Returns:
+			The new session, or None if the session is already running or finished, or too many sessions are running.
+		"""
+		return self.sessions.open(session_id, lambda: Session(session_id, version, applicant))
 
-			continue
+	def get_session(self, session_id):
+		"""
+		Get the state of a running computation.
 
-		#we received the shares
-		gate = None
-		for _ in range(len(self.circuit)):
-			gate = self.circuit.get_next_gate()
-			self.log(f"computing {gate}")
-			for i in gate.get_inputs():
-				if i.get_type() == Crypto.Gate.SHARE:
-					self.log(f"i.p_id = {i.get_result()}; share = {self.shares}")
-					#assign share value to the share input
-					i.add_inputs([self.shares[i.get_result()]])
-					i.compute()
+		Arguments:
+			session_id (int): identifier of the computation.
 
-			gate.compute()
-			if gate.get_type() == Crypto.Gate.MUL:
-				#behavior is different with MUL gates
-				self.log(f"cannot compute MUL gate for now. WIP")
-
-		#Phase 4/4: Result sharing and reconstruction
-		#all the gates have been processed
-		self.log(f"got a result")
-		result = gate.get_result()
-		self.results[self.party_id] = result
-		if not self.master:
-			#we can send the result to the party that sent the request
-			frame = Frame.Frame(Frame.Frame.RESULT, self.version, self.party_id, result)
-			message = Link.Message(Link.Message.FRAME, self.networkInterface.get_addr(), frame)
-			self.log(f"sending result {result} to {self.applicant}")
-			self.send(message, self.applicant)
-			self.state = Party.RES
-		else:
-			self.log(f"its mine, waiting for the others")
-			begin = time.time()
-			# wait for results
-			while len(self.results) < len(self.known_parties):
-				if time.time() - begin > self.timeout:
-					self.log(f"{len(self.results)}, {len(self.known_parties)-1}")
-					self.clean()
-					self.log(f"Parties failed to run the protocol.")
-					return
+		Returns:
+			The session if it is running, None otherwize.
+		"""
+		return self.sessions.get(session_id)
 
-			self.state = Party.RES
+	def clean(self, session):
+		"""
+		Close a computation and drop its state. Frames received later for this session are discarded.
 
-			r_number = len(self.results)
-			self.log(f"r_vect = {self.r_vect}, results = {self.results}")
-			self.final_result = Crypto.compute_MPC_result(self.r_vect, self.results, self.prime_p)/self.k
+		Arguments:
+			session (Session): the computation to close.
+		"""
+		self.sessions.close(session)
+		self.log("cleaning session %d", session.session_id)
 
-			self.log(f"result = {self.final_result}")
+	def check_parameters(self, session):
+		"""
+		Check the parameters received for a computation.
 
-		self.clean()
+		Arguments:
+			session (Session): the computation to check.
 
-	def runPCEAS(self):
-		self.log("run PCEAS")
-		begin = time.time()
+		Returns:
+			True if the computation can be run.
+		"""
+		return session.k >= 2 and len(self.known_parties) >= session.k and Crypto.isPrime(session.prime_p)
 
-		self.r_vect = Crypto.compute_recombination_vector(self.known_parties, self.prime_p)
+	def has_inputs(self, session, received):
+		"""
+		Check that every input party of the circuit has sent its contribution.
 
-		while self.state == Party.SYNC:
-			if time.time() - begin >= self.timeout:
-				#never received the SYNC frames => clear data in preparation of new request
-				self.clean()
-				self.log("Never received the SYNC frames before timeout.")
-				return
+		Arguments:
+			session (Session): the computation.
+			received (dict): contributions received, by party id (shares or B vectors).
+
+		Returns:
+			True if nothing is missing.
+		"""
+		return all(e in received for e in session.circuit.get_input_ids())
 
-			continue
+	def has_results(self, session):
+		"""
+		Check that enough results have been received to reconstruct the final result:
+		the result polynomial has degree k-1, any k of its points determine it.
 
-		#Phase 1/4: OFFLINE
-		if not self.sanity_check():
-			self.clean()
-			self.log("Sanity Check didn't pass.")
-			return
+		Arguments:
+			session (Session): the computation.
 
-		#Phase 2/4: INPUT SHARING
-		if self.isProvider:
-			#send shares
-			secret = random.randint(15, 25)
-			self.log(f"secret = {secret}")
-			shares, b_vect = Crypto.create_shares(secret, self.known_parties, self.k, self.prime_p, pceas_prime = self.prime_g)
-			self.log(f"shares = {shares}")
-
-			frame = Frame.Frame(Frame.Frame.BVECT, self.version, self.party_id, b_vect)
+		Returns:
+			True if the final result can be reconstructed.
+		"""
+		return len(session.results) >= session.k
+
+	def get_phase(self, session, phase):
+		"""
+		Get what a phase of a computation waits for.
+
+		Arguments:
+			session (Session): the computation.
+			phase (int): Timeout.INPUT or RESULT.
+
+		Returns:
+			The time the phase started (time.monotonic), the ids of the parties waited for, and how many of them are needed (None = all).
+		"""
+		start = session.synced if session.synced is not None else time.monotonic()
+		if phase == Timeout.INPUT:
+			return start, [p for p in session.circuit.get_input_ids() if p != self.party_id], None
+		# the Master has its own result
+		return start, [p for p in self.known_parties if p != self.party_id], session.k - 1
+
+	def get_deadline(self, session, phase):
+		"""
+		Get the deadline of a phase of a computation, derived from the durations observed for the parties waited for
+		and bounded by min_timeout and timeout.
+
+		Arguments:
+			session (Session): the computation.
+			phase (int): Timeout.INPUT or RESULT.
+
+		Returns:
+			The deadline, comparable to time.monotonic(), no later than the deadline of the session.
+		"""
+		start, peers, needed = self.get_phase(session, phase)
+		deadline = start + self.timeouts.get_timeout(phase, peers, self.min_timeout, self.timeout, needed)
+		if session.deadline is not None:
+			# the computation may be needed sooner
+			deadline = min(deadline, session.deadline)
+		return deadline
+
+	def report_late(self, session, phase, received):
+		"""
+		Back off the estimates of the parties that missed the deadline of a phase.
+
+		Arguments:
+			session (Session): the computation.
+			phase (int): Timeout.INPUT or RESULT.
+			received (dict): contributions received, by party id.
+		"""
+		_, peers, needed = self.get_phase(session, phase)
+		timeout = self.timeouts.get_timeout(phase, peers, self.min_timeout, self.timeout, needed)
+		self.timeouts.backoff(phase, [p for p in peers if p not in received], timeout)
+
+	def resume(self, session, received):
+		"""
+		Try to go on with a computation whose input parties did not all send their contribution before the deadline.
+		The applicant drops the late parties from the circuit (see send_resync), the other parties wait for its delta SYNC.
+		Step of the protocol generator, yielding the condition to wait for.
+
+		Arguments:
+			session (Session): the computation.
+			received (dict): contributions received, by party id (shares or B vectors).
+
+		Returns:
+			True if every input party left in the circuit has sent its contribution.
+		"""
+		if session.applicant == self.party_id:
+			return self.send_resync(session, received)
+		return (yield (lambda: self.has_inputs(session, received) or session.stop_prot, self.timeout))
+
+	def send_resync(self, session, received):
+		"""
+		(Applicant) Drop the input parties that did not send their contribution from the circuit, and send the change
+		to the other parties (delta SYNC), which keep the shares already received. The computation goes on under a new
+		session id, so that the results computed with the former circuit are discarded.
+
+		Arguments:
+			session (Session): the computation.
+			received (dict): contributions received, by party id (shares or B vectors).
+
+		Returns:
+			True if the computation goes on, False if fewer than 2 input parties are left (the average of a single input
+			would disclose it) or the circuit is not an average.
+		"""
+		dropped = [p for p in session.inputs if p not in received]
+		if not session.average or len(session.inputs) - len(dropped) < 2:
+			return False
+
+		session_id = self.new_session_id()
+		frame = Frame.Frame(Frame.Frame.RESYNC, session.version, self.party_id, [session_id] + dropped, session = session.session_id)
+		message = Link.Message(Link.Message.FRAME, self.networkInterface.get_addr(), frame)
+		self.send(message)
+		self.outbound.flush()
+		self.apply_resync(session, session_id, dropped)
+		return True
+
+	def apply_resync(self, session, session_id, dropped):
+		"""
+		Move a computation to a new session id and drop input parties from its circuit.
+		A party that already sent its result computes it again with the new circuit.
+
+		Arguments:
+			session (Session): the computation, running or finished.
+			session_id (int): the new identifier of the computation.
+			dropped (list): ids of the input parties to drop.
+		"""
+		with session.lock:
+			self.log("session %d resumed as %d without %s", session.session_id, session_id, dropped, level = Log.WARNING)
+			self.sessions.rename(session, session_id)
+
+			session.inputs = [p for p in session.inputs if p not in dropped]
+			session.circuit = Party.make_sum_circuit(session.inputs, session.prime_p)
+			for p in dropped:
+				session.shares.pop(p, None)
+				session.B_vectors.pop(p, None)
+			session.dropped.extend(dropped)
+			session.results = {}
+			session.synced = time.monotonic()
+
+			if session.state == Party.RES and session.applicant != self.party_id:
+				result = self.compute_circuit(session)
+				if result is not None:
+					self.send_result(session, result)
+					self.outbound.flush()
+
+	def share_inputs(self, session):
+		"""
+		Phase 2/4: INPUT SHARING. Create the shares of the secret of the party and send them to the other parties.
+		With PCEAS, the B vector used by VSS is broadcast first.
+
+		Arguments:
+			session (Session): the computation.
+		"""
+		secret = random.randint(15, 25)
+		self.log("secret = %s", secret, level = Log.DEBUG)
+		if session.version == Frame.Frame.PCEAS:
+			shares, b_vect = Crypto.create_shares(secret, self.known_parties, session.k, session.prime_p, pceas_prime = session.prime_g)
+			session.B_vectors[self.party_id] = b_vect
+
+			frame = Frame.Frame(Frame.Frame.BVECT, session.version, self.party_id, b_vect, session = session.session_id)
 			message = Link.Message(Link.Message.FRAME, self.networkInterface.get_addr(), frame)
 			self.send(message)
+		else:
+			shares = Crypto.create_shares(secret, self.known_parties, session.k, session.prime_p)
+		self.log("shares = %s", shares, level = Log.DEBUG)
 
-			for s_id in shares.keys():
-				if s_id == self.party_id:
-					self.shares[s_id] = shares[s_id]
-				else:
-					frame = Frame.Frame(Frame.Frame.SHARE, self.version, self.party_id, shares[s_id])
-					message = Link.Message(Link.Message.FRAME, self.networkInterface.get_addr(), frame)
-					self.send(message, s_id)
+		for s_id in shares.keys():
+			if s_id == self.party_id:
+				session.shares[s_id] = shares[s_id]
+			else:
+				frame = Frame.Frame(Frame.Frame.SHARE, session.version, self.party_id, shares[s_id], session = session.session_id)
+				message = Link.Message(Link.Message.FRAME, self.networkInterface.get_addr(), frame)
+				self.send(message, s_id)
+		self.outbound.flush()
 
-		begin = time.time()
+	def report_missing(self, session, received):
+		"""
+		(PCEAS) Blacklist the parties that did not send their contribution before the timeout, and advert the network.
 
-		#Phase 3/4: COMPUTATION
-		#expect shares
-		while not all(e in list(self.B_vectors.keys()) for e in self.circuit.get_input_ids()) and not self.stop_prot:
-			if time.time() - begin >= self.timeout:
-				#not enough B vectors received before timeout => stop computation and clear data in preparation of new request
-				party_copy = self.known_parties.copy()
-				party_copy.remove(self.party_id)
-				for party in self.B_vectors.keys():
-					party_copy.remove(party)
-
-				if len(party_copy) > 0:
-					frame = Frame.Frame(Frame.Frame.MALICIOUS, self.version, self.party_id, party_copy)
-					for e in party_copy:
-						if e == self.party_id:
-							continue
-						if e not in self.blacklist:
-							self.blacklist.append(e)
-							self.log(f"Blacklisted {e}")
-
-						if e in self.known_parties:
-							self.known_parties.remove(e)
-
-					message = Link.Message(Link.Message.FRAME, self.networkInterface.get_addr(), frame)
-					self.send(message)
-				self.clean()
-				self.log("A party failed to participate.")
-				return
+		Arguments:
+			session (Session): the computation.
+			received (dict): contributions received, by party id (shares or B vectors).
+		"""
+		party_copy = self.known_parties.copy()
+		party_copy.remove(self.party_id)
+		for party in received.keys():
+			if party in party_copy:
+				party_copy.remove(party)
+
+		if len(party_copy) > 0:
+			frame = Frame.Frame(Frame.Frame.MALICIOUS, session.version, self.party_id, party_copy, session = session.session_id)
+			for e in party_copy:
+				if self.membership.ban(e):
+					self.log("Blacklisted %s", e, level = Log.WARNING)
 
-			continue
-
-		while not all(e in list(self.shares.keys()) for e in self.circuit.get_input_ids()) and not self.stop_prot:
-			if time.time() - begin >= self.timeout:
-				#not enough shares received before timeout => stop computation and clear data in preparation of new request
-				party_copy = self.known_parties.copy()
-				party_copy.remove(self.party_id)
-				for party in self.shares.keys():
-					party_copy.remove(party)
-
-				if len(party_copy) > 0:
-					frame = Frame.Frame(Frame.Frame.MALICIOUS, self.version, self.party_id, party_copy)
-					for e in party_copy:
-						if e not in self.blacklist:
-							self.blacklist.append(e)
-							self.log(f"Blacklisted {e}")
-
-						if e in self.known_parties:
-							self.known_parties.remove(e)
-
-					message = Link.Message(Link.Message.FRAME, self.networkInterface.get_addr(), frame)
-					self.send(message)
-				self.clean()
-				self.log("A party failed to participate.")
-				return
+			message = Link.Message(Link.Message.FRAME, self.networkInterface.get_addr(), frame)
+			self.send(message)
+			self.outbound.flush()
 
-			continue
+	def verify_shares(self, session):
+		"""
+		(PCEAS) Check with the B vectors that the shares received have not been modified (Feldman VSS).
+		Suspected parties are blacklisted and the network is adverted.
 
-		if self.stop_prot:
-			self.clean()
-			self.log("Stop the protocol due to VSS")
-			return
+		Arguments:
+			session (Session): the computation.
 
-		#we received the shares
-		#check that shares have not been modified
+		Returns:
+			True if every share is valid.
+		"""
 		suspected = []
-		for party, share in self.shares.items():
+		for party, share in session.shares.items():
 			if not party == self.party_id:
 				tot = 0
-				for i in range(self.k):
-					tot = (tot + self.B_vectors[party][i]*(self.party_id**i))%self.prime_p
-				if (share * self.prime_g)%self.prime_p != tot%self.prime_p:
+				for i in range(session.k):
+					tot = (tot + session.B_vectors[party][i]*(self.party_id**i))%session.prime_p
+				if (share * session.prime_g)%session.prime_p != tot%session.prime_p:
 					# there has been a modification somewhere from party. Suspect malicious behavior
-					self.log(f"{(share * self.prime_g)%self.prime_p} != {tot}, {self.prime_p}")
-					if party not in self.blacklist:
-						self.blacklist.append(party)
-						self.log(f"Blacklisted {party}")
-					if party in self.known_parties:
-						self.known_parties.remove(party)
+					self.log("%s != %s, %s", (share * session.prime_g)%session.prime_p, tot, session.prime_p, level = Log.DEBUG)
+					if self.membership.ban(party):
+						self.log("Blacklisted %s", party, level = Log.WARNING)
 					suspected.append(party)
 
 		if len(suspected) > 0:
-			frame = Frame.Frame(Frame.Frame.MALICIOUS, self.version, self.party_id, suspected)
+			frame = Frame.Frame(Frame.Frame.MALICIOUS, session.version, self.party_id, suspected, session = session.session_id)
 			message = Link.Message(Link.Message.FRAME, self.networkInterface.get_addr(), frame)
 			self.send(message)
+			return False
 
-			self.clean()
-			self.log("VSS did not pass")
-			return
+		return True
 
-		#compute gates
+	def compute_circuit(self, session):
+		"""
+		Phase 3/4: COMPUTATION. Evaluate the circuit on the shares received.
+
+		Arguments:
+			session (Session): the computation.
+
+		Returns:
+			The share of the result, or None if the protocol has been stopped.
+		"""
 		gate = None
-		for _ in range(len(self.circuit)):
-			if self.stop_prot:
-				self.clean()
-				self.log("Stop the protocol due to VSS")
-				return
-			gate = self.circuit.get_next_gate()
-			self.log(f"computing {gate}")
+		for _ in range(len(session.circuit)):
+			if session.stop_prot:
+				return None
+			gate = session.circuit.get_next_gate()
+			self.log("computing %s", gate, level = Log.DEBUG)
 			for i in gate.get_inputs():
 				if i.get_type() == Crypto.Gate.SHARE:
-					self.log(f"i.p_id = {i.get_result()}; share = {self.shares}")
+					self.log("i.p_id = %s; share = %s", i.get_result(), session.shares, level = Log.DEBUG)
 					#assign share value to the share input
-					i.add_inputs([self.shares[i.get_result()]])
+					i.add_inputs([session.shares[i.get_result()]])
 					i.compute()
 
 			gate.compute()
 			if gate.get_type() == Crypto.Gate.MUL:
 				#behavior is different with MUL gates
-				self.log(f"cannot compute MUL gate for now. WIP")
+				self.log("cannot compute MUL gate for now. WIP", level = Log.WARNING)
+
+		if session.stop_prot:
+			return None
+
+		session.computed = time.monotonic()
+		self.log("got a result", level = Log.DEBUG)
+		return gate.get_result()
+
+	def send_result(self, session, result):
+		"""
+		Phase 4/4: Result sharing. Send the share of the result to the party that sent the request.
+
+		Arguments:
+			session (Session): the computation.
+			result (int): share of the result.
+		"""
+		frame = Frame.Frame(Frame.Frame.RESULT, session.version, self.party_id, result, session = session.session_id)
+		message = Link.Message(Link.Message.FRAME, self.networkInterface.get_addr(), frame)
+		self.log("sending result %s to %s", result, session.applicant, level = Log.DEBUG)
+		self.send(message, session.applicant)
+		session.state = Party.RES
+
+	def reconstruct(self, session):
+		"""
+		Phase 4/4: Reconstruction. Compute the final result from the first k shares of the result received,
+		and check the other ones against it if check_results is set, including those received later.
 
-		if self.stop_prot:
-			self.clean()
-			self.log("Stop the protocol due to VSS")
+		Arguments:
+			session (Session): the computation.
+
+		Returns:
+			The final result.
+		"""
+		session.state = Party.RES
+
+		received = dict(session.results)
+		parties = list(received)[:session.k]
+		subset = {pid: received[pid] for pid in parties}
+		session.r_vect = Crypto.compute_recombination_vector(parties, session.prime_p)
+		self.log("r_vect = %s, results = %s", session.r_vect, subset, level = Log.DEBUG)
+		session.final_result = Crypto.compute_MPC_result(session.r_vect, subset, session.prime_p)
+		if session.average:
+			# average of the inputs, fewer than k if some have been dropped by a delta SYNC
+			session.final_result /= len(session.inputs) if session.inputs else session.k
+
+		session.checked = set(parties)
+		# set last: results received from now on are checked by on_result
+		session.subset = subset
+		if self.check_results:
+			for pid in list(session.results):
+				self.check_result(session, pid)
+
+		self.log("result = %s", session.final_result)
+		return session.final_result
+
+	def check_result(self, session, pid):
+		"""
+		Check that the share of the result of a party lies on the polynomial interpolated by the reconstruction,
+		session.consistent is unset otherwize. Every party is checked once.
+
+		Arguments:
+			session (Session): the reconstructed computation.
+			pid (int): id of the party whose result is checked.
+		"""
+		if pid in session.checked:
 			return
+		session.checked.add(pid)
+		parties = list(session.subset)
+		expected = Crypto.compute_MPC_result(Crypto.compute_recombination_vector(parties, session.prime_p, x = pid), session.subset, session.prime_p)
+		if expected != session.results[pid]:
+			session.consistent = False
+			self.log("Result of %s is not consistent with the others: %s != %s", pid, session.results[pid], expected, level = Log.WARNING)
+
+	def abort(self, session, reason):
+		"""
+		Give up a computation and drop its state.
 
-		#Phase 4/4: Result sharing and reconstruction
-		#all the gates have been processed
-		self.log(f"got a result")
-		result = gate.get_result()
-		self.results[self.party_id] = result
-		if not self.master:
-			#we can send the result to the party that sent the request
-			frame = Frame.Frame(Frame.Frame.RESULT, self.version, self.party_id, result)
-			message = Link.Message(Link.Message.FRAME, self.networkInterface.get_addr(), frame)
-			self.log(f"sending result {result} to {self.applicant}")
-			self.send(message, self.applicant)
-			self.state = Party.RES
-		else:
-			self.log(f"its mine, waiting for the others")
-			begin = time.time()
-			# wait for results
-			while len(self.results) < len(self.known_parties) and not self.stop_prot:
-				if time.time() - begin > self.timeout:
-					self.clean()
-					self.log(f"Parties failed to run the protocol.")
-					return
-
-			if self.stop_prot:
-				self.clean()
-				self.log("Stop the protocol due to VSS")
-				return
+		Arguments:
+			session (Session): the computation.
+			reason (str): why, for the log.
+		"""
+		self.clean(session)
+		self.log(reason, level = Log.WARNING)
+
+	def protocol(self, session):
+		"""
+		Steps of a computation (PCEPS or PCEAS, depending on its version), shared by the threaded and asyncio runtimes.
+		The generator yields the conditions to wait for as (predicate, timeout) pairs, and is sent back whether each one
+		has been fulfilled: waiting is left to run_session.
+
+		Arguments:
+			session (Session): the computation to run.
+
+		Returns:
+			The final result for the party that requested the computation, None otherwize.
+		"""
+		pceas = session.version == Frame.Frame.PCEAS
+		self.log("run %s for session %d", "PCEAS" if pceas else "PCEPS", session.session_id)
 
-			self.state = Party.RES
+		#Phase 1/4: OFFLINE
+		# every known party (itself in it)
+		if session.k < 2 or not (yield (lambda: len(self.known_parties) >= session.k, self.timeout)) or not self.check_parameters(session):
+			return self.abort(session, "Sanity Check didn't pass.")
 
-			r_number = len(self.results)
-			self.log(f"r_vect = {self.r_vect}, results = {self.results}")
-			self.final_result = Crypto.compute_MPC_result(self.r_vect, self.results, self.prime_p)/self.k
+		#Phase 2/4: INPUT SHARING
+		if session.isProvider:
+			self.share_inputs(session)
 
-			self.log(f"result = {self.final_result}")
+		#Phase 3/4: COMPUTATION
+		#expect B vectors then shares
+		deadline = self.get_deadline(session, Timeout.INPUT)
+		for received in ([session.B_vectors, session.shares] if pceas else [session.shares]):
+			if not (yield (lambda: self.has_inputs(session, received) or session.stop_prot, deadline - time.monotonic())):
+				#not enough contributions received before timeout => go on without the late parties, or stop computation and clear data in preparation of new request
+				self.report_late(session, Timeout.INPUT, received)
+				if not (yield from self.resume(session, received)):
+					if pceas:
+						self.report_missing(session, received)
+					return self.abort(session, "A party failed to participate.")
+				deadline = self.get_deadline(session, Timeout.INPUT)
+
+		if session.stop_prot:
+			return self.abort(session, "Stop the protocol due to VSS")
+
+		# a delta SYNC is applied either before the result is computed or after it has been sent
+		with session.lock:
+			#check that shares have not been modified
+			if pceas and not self.verify_shares(session):
+				return self.abort(session, "VSS did not pass")
+
+			result = self.compute_circuit(session)
+			if result is None:
+				return self.abort(session, "Stop the protocol due to VSS")
+
+			#Phase 4/4: Result sharing and reconstruction
+			session.results[self.party_id] = result
+			if not self.master:
+				#we can send the result to the party that sent the request
+				self.send_result(session, result)
+
+		if self.master:
+			self.log("its mine, waiting for the others")
+			if not (yield (lambda: self.has_results(session) or session.stop_prot, self.get_deadline(session, Timeout.RESULT) - time.monotonic())):
+				self.report_late(session, Timeout.RESULT, session.results)
+				return self.abort(session, "Parties failed to run the protocol.")
+
+			if session.stop_prot:
+				return self.abort(session, "Stop the protocol due to VSS")
+
+			self.reconstruct(session)
+
+		self.clean(session)
+		return session.final_result
+
+	def run_session(self, session):
+		"""
+		Run the protocol of a computation, blocking on the conditions it waits for.
 
-		self.clean()
+		Arguments:
+			session (Session): the computation to run.
 
+		Returns:
+			The final result for the party that requested the computation, None otherwize.
+		"""
+		steps = self.protocol(session)
+		try:
+			condition = next(steps)
+			while True:
+				condition = steps.send(self.wait(*condition))
+		except StopIteration as e:
+			return e.value
+
+	def start_session(self, session):
+		"""
+		Start running a computation in the background, so that the party keeps receiving frames meanwhile.
+
+		Arguments:
+			session (Session): the computation to run.
+		"""
+		self.workers.submit(self.run_session, session)
+
+	def on_advert(self, m_origin, frame, answer = True):
+		"""
+		Handle a party joining the network.
+
+		Arguments:
+			m_origin (tuple): address the frame was received from.
+			frame (Frame): the ADVERT frame.
+			answer (bool): advert the new party in return. (Optional, default: True)
+		"""
+		party = frame.get_payload()
+		if self.membership.add(party):
+			self.networkInterface.set_party(party, m_origin)
+			self.log("%s", self.known_parties)
+			if answer:
+				# advert the party
+				frame = Frame.Frame(Frame.Frame.ADVERT, self.version, self.party_id, self.party_id)
+				message = Link.Message(Link.Message.FRAME, self.networkInterface.get_addr(), frame)
+				self.send(message)
+		elif party != self.party_id and not self.membership.is_banned(party):
+			self.networkInterface.set_party(party, m_origin)
+			self.log("%s updated (%s != %s)", party, party, self.party_id, level = Log.DEBUG)
+		elif self.membership.is_banned(party):
+			self.log("%s is blacklisted.", party, level = Log.DEBUG)
+
+	def make_machines(self):
+		"""
+		Build the transition tables of the party (START, AWAITING) and of its sessions (COMP, RES).
+		"""
+		every = Frame.VERSIONS
+		self.machine = StateMachine.StateMachine("party")
+		self.machine.add_entry(Party.AWAITING, lambda party: self.log("AWAITING"))
+		#expect only to receive other parties joining info
+		self.machine.add([Party.START], [Frame.Frame.ADVERT], every, lambda m_origin, frame: self.on_advert(m_origin, frame, answer = False))
+		#expect new parties to enter or leave the network, and requests from the master node
+		self.machine.add([Party.AWAITING], [Frame.Frame.ADVERT], every, self.on_advert)
+		self.machine.add([Party.AWAITING], [Frame.Frame.LEAVE], every, self.on_leave)
+		self.machine.add([Party.AWAITING], [Frame.Frame.REQUEST], every, self.on_request, guard = lambda m_origin, frame: frame.get_origin() != self.party_id)
+		self.machine.add([Party.AWAITING], Party.SESSION_TYPES, every, self.on_session_frame)
+
+		# sessions are opened with the parameters of their request, then computed
+		self.session_machine = StateMachine.StateMachine("session")
+		self.session_machine.add_entry(Party.COMP, lambda session: self.log("COMPUTE"))
+		self.session_machine.add([Party.COMP], [Frame.Frame.SHARE], every, self.on_share)
+		# results received after the reconstruction are still checked
+		self.session_machine.add([Party.COMP, Party.RES], [Frame.Frame.RESULT], every, self.on_result)
+		# TODO: expect MUL gate results
+		# B vectors and suspicions only exist with VSS
+		self.session_machine.add([Party.COMP], [Frame.Frame.BVECT], [Frame.Frame.PCEAS], self.on_bvect, guard = lambda session, frame: self.membership.is_known(frame.get_origin()))
+		self.session_machine.add([Party.COMP], [Frame.Frame.MALICIOUS], [Frame.Frame.PCEAS], self.on_malicious)
+		# the result may already have been sent with the former circuit
+		self.session_machine.add([Party.COMP, Party.RES], [Frame.Frame.RESYNC], every, self.on_resync, guard = lambda session, frame: frame.get_origin() == session.applicant != self.party_id)
+
+	def get_stats(self):
+		"""
+		Get the counters and handling times of the transitions of the party and of its sessions.
+
+		Returns:
+			Dictionary with the statistics of both state machines.
+		"""
+		return {"party": self.machine.get_stats(), "session": self.session_machine.get_stats()}
 
 	def on_recv(self, message):
 		"""
@@ -406,213 +753,137 @@ class Party():
 		"""
 		m_type, m_origin, m_content = message.get()
 
-		if m_type == Link.Message.FRAME:
-			self.log(f"received Message of type {'PING' if m_type == 0 else 'FRAME'} from {m_origin} with payload {m_content} in state {Party.get_str_state(self.state)}")
+		if m_type == Link.Message.PING:
+			self.detector.heartbeat(m_content.get_origin())
 
-			if m_origin in self.blacklist:
-				self.log(f"rejected because {m_origin} is blacklisted")
+		elif m_type == Link.Message.FRAME:
+			self.log("received Message of type FRAME from %s with payload %s in state %s", m_origin, m_content, Party.get_str_state(self.state), level = Log.DEBUG)
+
+			if self.membership.is_banned(self.membership.get_id(m_origin)):
+				self.log("rejected because %s is blacklisted", m_origin, level = Log.DEBUG)
 				return
-			
-			if self.state == Party.START:
-				if m_content.get_type() == Frame.Frame.ADVERT:
-					#expect only to receive other parties joining info
-					party = m_content.get_payload()
-					if not party in self.known_parties and not party in self.blacklist:
-						self.known_parties.append(party)
-						self.networkInterface.set_party(party, m_origin)
-						self.log(f"{self.known_parties}")
-					elif party != self.party_id and not party in self.blacklist:
-						self.networkInterface.set_party(party, m_origin)
-						self.log(f"{party} updated ({party} != {self.party_id})")
-					elif party in self.blacklist:
-						self.log(f"{party} is blacklisted.")
-
-			elif self.state == Party.AWAITING:
-				if m_content.get_type() == Frame.Frame.ADVERT:
-					#expect new parties to enter the network
-					party = m_content.get_payload()
-					if not party in self.known_parties and not party in self.blacklist:
-						self.known_parties.append(party)
-						self.networkInterface.set_party(party, m_origin)
-						self.log(f"{self.known_parties}")
-						# advert the party
-						frame = Frame.Frame(Frame.Frame.ADVERT, self.version, self.party_id, self.party_id)
-						message = Link.Message(Link.Message.FRAME, self.networkInterface.get_addr(), frame)
-						self.send(message)
-					elif party != self.party_id and not party in self.blacklist:
-						self.networkInterface.set_party(party, m_origin)
-						self.log(f"{party} updated ({party} != {self.party_id})")
-					elif party in self.blacklist:
-						self.log(f"{party} is blacklisted.")
-
-				elif m_content.get_type() == Frame.Frame.LEAVE:
-					#expect parties to leave the network
-					party = m_content.get_payload()
-					if party in self.known_parties:
-						self.known_parties.remove(party)
-
-				elif m_content.get_type() == Frame.Frame.REQUEST:
-					#expect request messages from the master node
-					party = m_content.get_payload()
-					if party != self.party_id:
-						self.version = m_content.get_version()
-						self.state = Party.SYNC
-						self.log(f"waiting for Sync")
-						if self.version == Frame.Frame.PCEPS:
-							self.runPCEPS()
-						elif self.version == Frame.Frame.PCEAS:
-							self.runPCEAS()
-
-			elif self.state == Party.SYNC:
-				"""
-				if m_content.get_type() == Frame.Frame.ADVERT:
-					#expect new parties to enter the network
-					party = m_content.get_payload()
-					if not party in self.known_parties:
-						self.known_parties.append(party)
-						self.networkInterface.set_party(party, m_origin)
-						self.log(f"{self.known_parties}")
-						self.log(f"received advertisement from {party}")
-						# advert the party
-						frame = Frame.Frame(Frame.Frame.ADVERT, m_content.get_version(), self.party_id, self.party_id)
-						message = Link.Message(Link.Message.FRAME, self.networkInterface.get_addr(), frame)
-						self.send(message)
-					elif party != self.party_id:
-						self.networkInterface.set_party(party, m_origin)
-						self.log(f"{party} updated")
-				"""
-
-				if m_content.get_type() == Frame.Frame.LEAVE:
-					#expect parties to leave the network
-					party = m_content.get_payload()
-					if party in self.known_parties:
-						self.log(f"{party} left the network")
-						self.known_parties.remove(party)
-
-				elif m_content.get_type() == Frame.Frame.SYNC:
-					# expect sync messages
-					party = m_content.get_origin()
-					version = m_content.get_version()
-					if version == self.version:
-						if version == Frame.Frame.PCEPS:
-							self.prime_p, self.circuit = m_content.get_payload()
-							self.k = len(self.circuit.get_input_ids())
-						elif version == Frame.Frame.PCEAS:
-							self.prime_p, self.prime_g, self.circuit = m_content.get_payload()
-							self.k = len(self.circuit.get_input_ids())
-
-						if party != self.party_id:
-							if self.party_id in self.circuit.get_input_ids():
-								self.isProvider = True
-							self.log(f"COMPUTE")
-							self.state = Party.COMP
-
-					else:
-						self.log(f"Received SYNC frame from {party} but versions do not match. Expected {self.version} but received {version}.")
-
-			elif self.state == Party.COMP:
-				"""if m_content.get_type() == Frame.Frame.ADVERT:
-					#expect new parties to enter the network
-					party = m_content.get_payload()
-					if not party in self.known_parties:
-						self.known_parties.append(party)
-						self.networkInterface.set_party(party, m_origin)
-						self.log(f"{self.known_parties}")
-						# advert the party
-						frame = Frame.Frame(Frame.Frame.ADVERT, m_content.get_version(), self.party_id, self.party_id)
-						message = Link.Message(Link.Message.FRAME, self.networkInterface.get_addr(), frame)
-						self.send(message)
-					elif party != self.party_id:
-						self.networkInterface.set_party(party, m_origin)
-						self.log(f"{party} updated")"""
-
-				if m_content.get_type() == Frame.Frame.LEAVE:
-					#expect parties to leave the network
-					party = m_content.get_payload()
-					if party in self.known_parties:
-						self.known_parties.remove(party)
-
-				elif m_content.get_type() == Frame.Frame.SHARE:
-					#expect share from a party
-					share = m_content.get_payload()
-					p_id = m_content.get_origin()
-					version = m_content.get_version()
-					if version == self.version:
-						if not p_id in self.shares.keys():
-							#only if no share already received from this party
-							self.log(f"Received share from {p_id}: {share}")
-							self.shares[p_id] = share
-							#self.log(f"self.shares = {self.shares}")
-					else:
-						self.log(f"Received SHARE frame from {p_id} but versions do not match. Expected {self.version} but received {version}.")
-
-				elif m_content.get_type() == Frame.Frame.BVECT:
-					if self.version == Frame.Frame.PCEAS:
-						vect = m_content.get_payload()
-						party = m_content.get_origin()
-						if party in self.known_parties and party != self.B_vectors.keys():
-							self.log(f"Received B vector from {party}: {vect}")
-							self.B_vectors[party] = vect
-					else:
-						self.log(f"Received BVECT frame but not running PCEAS")
-
-				elif m_content.get_type() == Frame.Frame.MUL:
-					# TODO: expect MUL gate results
-					pass
-
-				elif m_content.get_type() == Frame.Frame.RESULT:
-					# expect Results to be shared
-					result = m_content.get_payload()
-					p_id = m_content.get_origin()
-					version = m_content.get_version()
-					if version == self.version:
-						self.results[p_id] = result
-						self.log(f"Result received from {p_id}: {result}")
-						if len(list(self.results.keys())) == len(list(self.known_parties)):
-							self.state = Party.RES
-					else:
-						self.log(f"Received RESULT frame from {p_id} but versions do not match. Expected {self.version} but received {version}.")
-
-				elif m_content.get_type() == Frame.Frame.MALICIOUS:
-					# expect Malicious behavior to be suspected
-					suspected = m_content.get_payload()
-					origin = m_content.get_origin()
-					if self.version == Frame.Frame.PCEAS:
-						self.stop_prot = True
-						#propagate the information in case a packet is lost
-						if not all(e in self.blacklist for e in suspected):
-							for e in suspected:
-								if not e in self.blacklist:
-									self.blacklist.append(e)
-									self.log(f"Blacklisted {e} by {origin}")
-								if e in self.known_parties:
-									self.known_parties.remove(e)
-							frame = Frame.Frame(Frame.Frame.MALICIOUS, self.version, self.party_id, suspected)
-							message = Link.Message(Link.Message.FRAME, self.networkInterface.get_addr(), frame)
-							self.send(message)
-
-
-			elif self.state == Party.RES:
-				"""if m_content.get_type() == Frame.Frame.ADVERT:
-					#expect new parties to enter the network
-					party = m_content.get_payload()
-					if not party in self.known_parties:
-						self.known_parties.append(party)
-						self.networkInterface.set_party(party, m_origin)
-						self.log(f"{self.known_parties}")
-						# advert the party
-						frame = Frame.Frame(Frame.Frame.ADVERT, m_content.get_version(), self.party_id, self.party_id)
-						message = Link.Message(Link.Message.FRAME, self.networkInterface.get_addr(), frame)
-						self.send(message)
-					elif party != self.party_id:
-						self.networkInterface.set_party(party, m_origin)
-						self.log(f"{party} updated")"""
-
-				if m_content.get_type() == Frame.Frame.LEAVE:
-					#expect parties to leave the network
-					party = m_content.get_payload()
-					if party in self.known_parties:
-						self.known_parties.remove(party)
+
+			# every frame tells that its sender is alive, only pings are heartbeats
+			self.detector.seen(m_content.get_origin())
+			self.machine.dispatch(self, m_content.get_type(), m_content.get_version(), m_origin, m_content)
+
+	def on_leave(self, m_origin, frame):
+		party = frame.get_payload()
+		self.detector.forget(party)
+		if self.membership.remove(party):
+			self.log("%s left the network", party)
+
+	def on_request(self, m_origin, frame):
+		session = self.open_session(frame.get_session(), frame.get_version(), applicant = frame.get_origin())
+		if session is None:
+			self.log("Request for session %s already handled or too many sessions running", frame.get_session(), level = Log.DEBUG)
+			return
+		self.set_parameters(session, frame.get_payload())
+		self.session_machine.move(session, Party.COMP)
+		# shares sent by the parties that got the request first
+		for early in self.sessions.take_held(session.session_id):
+			self.on_session_recv(session, early)
+		self.start_session(session)
+
+	def on_session_frame(self, m_origin, frame):
+		session = self.get_session(frame.get_session())
+		if session is None and frame.get_type() == Frame.Frame.RESYNC:
+			# the result may already have been sent
+			session = self.sessions.get_finished(frame.get_session())
+		elif session is None and frame.get_type() == Frame.Frame.RESULT:
+			# late results of a reconstructed computation, not of the circuit it had before a delta SYNC
+			session = self.sessions.get_finished(frame.get_session())
+			if session is not None and (session.subset is None or session.session_id != frame.get_session()):
+				session = None
+		if session is None:
+			if self.sessions.is_finished(frame.get_session()):
+				self.log("Discarded late frame for finished session %s", frame.get_session(), level = Log.DEBUG)
+			elif self.sessions.hold(frame):
+				self.log("Held frame until the request of session %s", frame.get_session(), level = Log.DEBUG)
+			else:
+				self.log("Discarded frame for unknown session %s", frame.get_session(), level = Log.DEBUG)
+			return
+
+		self.on_session_recv(session, frame)
+
+	def on_session_recv(self, session, frame):
+		"""
+		Handler used when a party receives a frame belonging to a running computation.
+
+		Arguments:
+			session (Session): the computation the frame belongs to.
+			frame (Frame): the received frame.
+		"""
+		if frame.get_version() != session.version:
+			self.log("Received %s frame from %s but versions do not match. Expected %s but received %s.", Frame.Frame.get_str_type(frame.get_type()), frame.get_origin(), session.version, frame.get_version(), level = Log.WARNING)
+			return
+
+		self.session_machine.dispatch(session, frame.get_type(), frame.get_version(), session, frame)
+
+	def set_parameters(self, session, parameters):
+		"""
+		Apply the parameters of a computation, received with its request.
+
+		Arguments:
+			session (Session): the computation.
+			parameters (tuple): (p, circuit) with PCEPS, (p, g, circuit) with PCEAS.
+		"""
+		if session.version == Frame.Frame.PCEPS:
+			session.prime_p, session.circuit = parameters
+		elif session.version == Frame.Frame.PCEAS:
+			session.prime_p, session.prime_g, session.circuit = parameters
+		session.inputs = session.circuit.get_input_ids()
+		session.k = len(session.inputs)
+		if self.party_id in session.inputs:
+			session.isProvider = True
+		session.synced = time.monotonic()
+
+	def on_share(self, session, frame):
+		p_id = frame.get_origin()
+		#only if no share already received from this party
+		if not p_id in session.shares:
+			share = frame.get_payload()
+			self.log("Received share from %s: %s", p_id, share, level = Log.DEBUG)
+			session.shares[p_id] = share
+			if session.synced is not None:
+				self.timeouts.observe(Timeout.INPUT, p_id, time.monotonic() - session.synced)
+
+	def on_bvect(self, session, frame):
+		p_id = frame.get_origin()
+		if p_id not in session.B_vectors:
+			vect = frame.get_payload()
+			self.log("Received B vector from %s: %s", p_id, vect, level = Log.DEBUG)
+			session.B_vectors[p_id] = vect
+
+	def on_result(self, session, frame):
+		p_id = frame.get_origin()
+		result = frame.get_payload()
+		session.results[p_id] = result
+		self.log("Result received from %s: %s", p_id, result, level = Log.DEBUG)
+		if session.synced is not None:
+			self.timeouts.observe(Timeout.RESULT, p_id, time.monotonic() - session.synced)
+		if session.subset is not None and self.check_results:
+			# received after the reconstruction
+			self.check_result(session, p_id)
+
+	def on_resync(self, session, frame):
+		payload = frame.get_payload()
+		# duplicates arrive once the session has moved to its new id
+		if payload[0] != session.session_id:
+			self.apply_resync(session, payload[0], payload[1:])
+
+	def on_malicious(self, session, frame):
+		# expect Malicious behavior to be suspected
+		suspected = frame.get_payload()
+		session.stop_prot = True
+		#propagate the information in case a packet is lost
+		if not all(self.membership.is_banned(e) for e in suspected):
+			for e in suspected:
+				if self.membership.ban(e):
+					self.log("Blacklisted %s by %s", e, frame.get_origin(), level = Log.WARNING)
+			frame = Frame.Frame(Frame.Frame.MALICIOUS, session.version, self.party_id, suspected, session = session.session_id)
+			message = Link.Message(Link.Message.FRAME, self.networkInterface.get_addr(), frame)
+			self.send(message)
 
 	def get_pid(self):
 		"""
@@ -634,162 +905,300 @@ class Party():
 
 	def send(self, message, to_pid = None):
 		"""
-		Send messages to the given party.
+		Send messages to the given party. Messages are queued by the outbound scheduler, and sent
+		within a few milliseconds or when flush is called.
 
 		Arguments:
 			message (Message): the message to send.
 			to_pid (int): to id of the party whom the message is destinated to. (Optional, default: None = broadcast)
 		"""
 		if to_pid:
-			self.log(f"sending to {to_pid} {message}")
-			self.networkInterface.send_to(to_pid, message)
+			self.log("sending to %s %s", to_pid, message, level = Log.DEBUG)
+			self.outbound.send_to(to_pid, message)
 		else:
-			self.log(f"broadcasting {message}")
-			self.networkInterface.broadcast(message)
+			self.log("broadcasting %s", message, level = Log.DEBUG)
+			self.outbound.broadcast(message)
+
+	def ping(self):
+		"""
+		Tell the other parties that this party is alive.
+		"""
+		self.ping_count += 1
+		frame = Frame.Frame(Frame.Frame.PING, self.version, self.party_id, self.ping_count)
+		self.send(Link.Message(Link.Message.PING, self.networkInterface.get_addr(), frame))
+
+	def heartbeat(self):
+		"""
+		Ping the other parties periodically, until the party is stopped.
+		"""
+		while not self.stopped.wait(self.heartbeat_interval):
+			self.ping()
+
+	def get_live_parties(self):
+		"""
+		Get the known parties that are not suspected by the failure detector.
+
+		Returns:
+			List of party ids (itself included), sorted by id.
+		"""
+		return [p for p in self.known_parties if p == self.party_id or self.detector.is_alive(p)]
 
 	def leave(self):
 		"""
 		Quit the running application and advert the network.
 		"""
-		self.log(f"Leaves the network")
+		self.log("Leaves the network")
 		frame = Frame.Frame(Frame.Frame.LEAVE, self.version, self.party_id, self.party_id)
 		message = Link.Message(Link.Message.FRAME, self.networkInterface.get_addr(), frame)
 		self.send(message)
+		self.outbound.flush()
 
 	def run(self):
 		self.log("starts")
-		self.log(f"My ip is {self.networkInterface.get_addr()}")
+		self.log("My ip is %s", self.networkInterface.get_addr())
 
-		self.state = Party.AWAITING
-		self.log("AWAITING")
+		self.machine.move(self, Party.AWAITING)
+		threading.Thread(target = self.heartbeat, daemon = True).start()
 
-		begin = time.time()
-		while self.advert_start_count < self.advert_count_threshold:
-			if time.time() - begin >= self.timeout:
-				frame = Frame.Frame(Frame.Frame.ADVERT, self.version, self.party_id, self.party_id)
-				message = Link.Message(Link.Message.FRAME, self.networkInterface.get_addr(), frame)
-				self.send(message)
+		while self.advert_start_count < self.advert_count_threshold and not self.stopped.wait(self.timeout):
+			frame = Frame.Frame(Frame.Frame.ADVERT, self.version, self.party_id, self.party_id)
+			message = Link.Message(Link.Message.FRAME, self.networkInterface.get_addr(), frame)
+			self.send(message)
 
-				self.advert_start_count += 1
-				begin = time.time()
+			self.advert_start_count += 1
 
-		while True:
-			#We could have a verification on battery for IoT or an event on a computer that would break the loop
-			continue
+		#We could have a verification on battery for IoT or an event on a computer that calls stop
+		self.stopped.wait()
 
 		#leave the network
 		self.leave()
-		self.log(f"FINISH")
+		self.log("FINISH")
 
 class Master(Party):
-	def __init__(self, pid, version = Frame.Frame.PCEPS):
-		super(Master, self).__init__(pid, master = True, version = version)
+	def __init__(self, pid, version = Frame.Frame.PCEPS, networkInterface = None):
+		super(Master, self).__init__(pid, master = True, version = version, networkInterface = networkInterface)
+		self.session_ids = Master.make_session_ids() # shared by the computations run at the same time
+		self.parallel_sessions = 1 # computations run at the same time by each round of run
+		self.scheduler = Scheduler.Scheduler(self)
+
+	def make_session_ids():
+		"""
+		Get the session identifiers of a run of the Master. The parties keep the identifiers of the last computations
+		and ignore the requests using them again: a restarted Master starts from a random identifier instead of 1.
 
-	def makeCircuit(self):
-		if len(self.known_parties) == self.k:
-			picked_parties = self.known_parties
+		Returns:
+			Iterator of the session identifiers.
+		"""
+		return itertools.count(random.getrandbits(31) + 1)
+
+	def new_session_id(self):
+		"""
+		Get a fresh session identifier for a new computation.
+
+		Returns:
+			The session identifier.
+		"""
+		return next(self.session_ids)
+
+	def makeCircuit(self, session):
+		"""
+		Build the circuit summing the inputs of k random live parties.
+
+		Arguments:
+			session (Session): the computation the circuit is built for.
+
+		Returns:
+			The circuit.
+		"""
+		live = self.get_live_parties()
+		if len(live) == session.k:
+			picked_parties = live
 		else:
-			parties = self.known_parties.copy()
-			parties.remove(self.party_id)
+			parties = [p for p in live if p != self.party_id]
 			picked_parties = []
-			while len(picked_parties) < self.k:
+			while len(picked_parties) < session.k:
 				p = random.choice(parties)
 				parties.remove(p)
 				picked_parties.append(p)
-		
-		input_gates = []
-		for party in picked_parties:
-			gate = Crypto.Gate(Crypto.Gate.SHARE, value = party)
-			gate.set_prime(self.prime_p)
-			input_gates.append(gate)
 
-		self.circuit = Crypto.Circuit()
+		session.inputs = picked_parties
+		session.circuit = Party.make_sum_circuit(picked_parties, session.prime_p)
+		return session.circuit
 
-		gate = Crypto.Gate(Crypto.Gate.ADD)
-		gate.set_prime(self.prime_p)
-		gate.set_inputs(input_gates[0:2])
-		self.circuit.add_gate(gate)
-		previous_gate = gate
 
-		for i in range(len(input_gates)-2):
-			gate = Crypto.Gate(Crypto.Gate.ADD)
-			gate.set_prime(self.prime_p)
-			gate.set_inputs([previous_gate, input_gates[2+i]])
-			self.circuit.add_gate(gate)
-			previous_gate = gate
+	def prepare_session(self, circuit = None, participants = None, select = None):
+		"""
+		Set the parameters and build the circuit of a new computation.
+
+		Arguments:
+			circuit (Circuit): circuit to compute, copied. (Optional, default: None = average of the inputs of the participants)
+			participants (list): ids of the input parties, itself possibly included, fewer than the live parties. (Optional, default: None = chosen by select)
+			select (function): called with the live parties (itself included), returns the input parties. (Optional, default: None = a random threshold of random parties)
+
+		Returns:
+			The new session, or None if not enough parties are connected, an input party is unknown, there are too few or too many input parties,
+			or too many computations are running.
+		"""
+		#P2: set parameters
+		self.log("Setting parameters")
+		live = self.get_live_parties()
+		n = len(live) # every live party (itself in it)
+		self.log("%s, %d", live, n, level = Log.DEBUG)
+		if n < 3:
+			return None
+
+		if circuit is not None:
+			participants = circuit.get_input_ids()
+		elif participants is None and select is not None:
+			participants = select(live)
+		# the threshold is the number of input parties, lower than the number of parties sharing
+		if participants is not None and (not 2 <= len(participants) < n or not all(self.membership.is_known(p) for p in participants)):
+			self.log("Cannot compute with the input parties %s", participants, level = Log.WARNING)
+			return None
+
+		session = self.open_session(self.new_session_id(), self.version, applicant = self.party_id)
+		if session is None:
+			return None
+		z = Crypto.generateRandomPrime(2**31//2, 2**32//2-1) #unsigned int
+		session.prime_p = z
+
+		if participants is not None:
+			threshold = len(participants)
+		else:
+			tmax = round(n/2)-1
+			if tmax <= 2:
+				threshold = 2
+			else:
+				#randomize the threshold needed for this computation
+				threshold = random.randint(2, tmax)
+		self.log("Parameters: (session = %s, n = %s, t = %s, z = %s)", session.session_id, n, threshold, z)
+
+		#P3: prepare the circuit
+		self.log("Building up the circuit", level = Log.DEBUG)
+		session.k = threshold
+		if circuit is not None:
+			# the evaluation of a circuit overwrites it
+			session.circuit = Crypto.Circuit.from_bytes(circuit.to_bytes())
+			session.circuit.set_prime(z)
+			session.inputs = participants
+			session.average = False
+		elif participants is not None:
+			session.inputs = list(participants)
+			session.circuit = Party.make_sum_circuit(session.inputs, z)
+		else:
+			self.makeCircuit(session)
+		# the Master may be one of the input parties
+		session.isProvider = self.party_id in session.inputs
 
-		return self.circuit
+		if session.version == Frame.Frame.PCEAS:
+			session.prime_g = Crypto.generateRandomPrime(2**31//2, 2**32//2-1)
 
+		return session
 
-	def run(self):
-		self.log("starts")
-		self.log(f"My ip is {self.networkInterface.get_addr()}")
+	def send_request(self, session, flush = True):
+		"""
+		Request the computation to the network, with its parameters.
 
-		self.state = Party.AWAITING
+		Arguments:
+			session (Session): the computation to request.
+			flush (bool): send the request at once, instead of with the next frames. (Optional, default: True)
+		"""
+		#P4: Request, carrying the parameters so that the participants are synced at once
+		self.log("Sending the Request", level = Log.DEBUG)
+		if session.version == Frame.Frame.PCEAS:
+			payload = (session.prime_p, session.prime_g, session.circuit)
+		else:
+			payload = (session.prime_p, session.circuit)
+		# the parties may answer before send returns, when the frames of another computation are flushed
+		session.synced = session.requested = time.monotonic()
+		self.session_machine.move(session, Party.COMP)
+		frame = Frame.Frame(Frame.Frame.REQUEST, session.version, self.party_id, payload, session = session.session_id)
+		message = Link.Message(Link.Message.FRAME, self.networkInterface.get_addr(), frame)
+		self.send(message)
+		if flush:
+			self.outbound.flush()
 
-		while True:
-			time.sleep(30) # send every 10 min (wait 5min before + 5min after)
-
-			#P2: set parameters
-			self.log("Setting parameters")
-			z = Crypto.generateRandomPrime(2**31//2, 2**32//2-1) #unsigned int
-			self.prime_p = z
-			begin = time.time()
-			n = len(self.known_parties) # every known party (itself in it)
-			self.log(f"{self.known_parties}, {n}")
-			ok = True
-			while n < 3:
-				if time.time() - begin > self.timeout:
-					print(self.known_parties)
-					self.clean()
-					self.log(f"Not enough parties connected to run the protocol.")
-					ok=False
-					break
-
-				n = len(self.known_parties) # every known party
-
-			if ok:
-				tmax = round(n/2)-1
-				if tmax <= 2:
-					threshold = 2
-				else:
-					#randomize the threshold needed for this computation
-					threshold = random.randint(2, tmax)
-				self.log(f"Parameters: (n = {n}, t = {threshold}, z = {z})")
-
-				#P3: prepare the circuit
-				self.log(f"Building up the circuit")
-				self.k = threshold
-				self.makeCircuit()
-
-				#P4: Request
-				self.log(f"Sending the Request")
-				frame = Frame.Frame(Frame.Frame.REQUEST, self.version, self.party_id, self.party_id)
-				message = Link.Message(Link.Message.FRAME, self.networkInterface.get_addr(), frame)
-				self.send(message)
-				self.state = Party.SYNC
-
-				#P5: SYNC
-				self.log(f"Sync all the participants")
-				if self.version == Frame.Frame.PCEAS:
-					self.prime_g = Crypto.generateRandomPrime(2**31//2, 2**32//2-1)
-					payload = (self.prime_p, self.prime_g, self.circuit)
-				else:
-					payload = (self.prime_p, self.circuit)
-				frame = Frame.Frame(Frame.Frame.SYNC, self.version, self.party_id, payload)
-				message = Link.Message(Link.Message.FRAME, self.networkInterface.get_addr(), frame)
-				self.send(message)
+	def submit(self, circuit = None, participants = None, select = None, deadline = None, priority = 0):
+		"""
+		Queue a computation, run as soon as a session is free (see Scheduler.submit).
 
-				self.state = Party.COMP
-				self.log("COMPUTE")
+		Returns:
+			A future of the Outcome of the computation.
+		"""
+		return self.scheduler.submit(circuit, participants, select, deadline, priority)
 
-				#P6: compute the circuit
-				if self.version == Frame.Frame.PCEPS:
-					self.runPCEPS()
-				elif self.version == Frame.Frame.PCEAS:
-					self.runPCEAS()
+	def compute(self):
+		"""
+		Run one computation over the live parties. Several computations may run at the same time.
 
-			time.sleep(30)
+		Returns:
+			The final result, or None if the computation failed.
+		"""
+		self.wait(lambda: len(self.known_parties) >= 3, self.timeout)
+
+		session = self.prepare_session()
+		if session is None:
+			self.log("Not enough live parties or too many computations running.", level = Log.WARNING)
+			return None
+
+		self.send_request(session)
+
+		#P6: compute the circuit
+		self.run_session(session)
+		return session.final_result
+
+	def run(self):
+		self.log("starts")
+		self.log("My ip is %s", self.networkInterface.get_addr())
+
+		self.machine.move(self, Party.AWAITING)
+		threading.Thread(target = self.heartbeat, daemon = True).start()
+
+		# send every minute (wait 30s before + 30s after)
+		while not self.stopped.wait(30):
+			# independent computations over the same parties
+			concurrent.futures.wait([self.submit() for _ in range(self.parallel_sessions)])
+
+			if self.stopped.wait(30):
+				break
 
+		self.scheduler.stop()
 		self.leave()
-		self.log("FINISH")
\ No newline at end of file
+		self.log("FINISH")
+
+
+class Session():
+	"""
+	State of one computation (one request of the Master) a party takes part in.
+	Several sessions may be in flight at the same time, frames are routed to them by session id.
+	"""
+	def __init__(self, session_id, version = Frame.Frame.PCEPS, applicant = None):
+		self.session_id = session_id # identifier of the computation
+		self.version = version # protocol used by the computation
+		self.state = Party.SYNC # current state of the computation, SYNC until its parameters are set
+		self.isProvider = False
+		self.shares = {} # set of shares received from every party
+		self.B_vectors = {}
+		self.circuit = None # circuit to be computed by the parties
+		self.inputs = [] # ids of the input parties of the circuit, that its evaluation overwrites
+		self.applicant = applicant # id of the party who sent a request
+		self.k = 0 # number of parties that must participate to the computation
+		self.prime_p = 0 # prime number used as modulo during computation
+		self.prime_g = 0 # prime number used by VSS
+		self.results = {}
+		self.r_vect = {} # recombination vector of the results used for the reconstruction
+		self.consistent = True # False if a result does not match the reconstructed polynomial
+		self.subset = None # (Master) results the final result has been interpolated from, set by the reconstruction
+		self.checked = set() # (Master) parties whose result has been checked against the reconstruction
+		self.final_result = None
+		self.stop_prot = False
+		self.average = True # the circuit sums the inputs, and the final result is divided by their number
+		self.deadline = None # time after which the computation is abandoned (time.monotonic), set when opened
+		self.computed = None # time the share of the result has been computed (time.monotonic)
+		self.dropped = [] # input parties dropped from the circuit by a delta SYNC
+		self.lock = threading.Lock() # held while the result is computed and sent
+		self.synced = None # time the request and its parameters have been received (time.monotonic), reset by a delta SYNC
+		self.requested = None # (Master) time the request has been sent (time.monotonic)
+
+	def __repr__(self):
+		return f"Session: {self.session_id}, state = {Party.get_str_state(self.state)}"
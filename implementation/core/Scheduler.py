@@ -0,0 +1,188 @@
+#!/bin/bash/python3
+#encoding: utf-8
+
+import concurrent.futures
+import heapq
+import itertools
+import threading
+import time
+
+class ComputationError(Exception):
+	pass
+
+class Request:
+	"""
+	Computation submitted to the scheduler, waiting in its queue.
+	"""
+	def __init__(self, circuit = None, participants = None, select = None, deadline = None, priority = 0):
+		self.circuit = circuit
+		self.participants = participants
+		self.select = select
+		self.submitted = time.monotonic()
+		self.deadline = None if deadline is None else self.submitted + deadline # time.monotonic
+		self.priority = priority
+		self.future = concurrent.futures.Future()
+		self.session_id = None # identifier the computation has been requested with
+
+class Outcome:
+	"""
+	Final result of a computation run by the scheduler, and the time in seconds spent in each of its steps:
+	queued (waiting for a free session), setup (parameters and circuit), input (from the request to the share of the result
+	of the Master, delta SYNC included), result (until enough results to reconstruct), total (from the submission).
+	"""
+	def __init__(self, request, session, started, finished):
+		self.result = session.final_result
+		self.session_id = request.session_id # identifier the computation has been requested with
+		self.final_session_id = session.session_id # identifier it has completed with, new after a delta SYNC
+		self.inputs = session.inputs
+		self.dropped = session.dropped
+		self.consistent = session.consistent
+		self.timings = {
+			"queued": started - request.submitted,
+			"setup": session.requested - started,
+			"input": session.computed - session.requested,
+			"result": finished - session.computed,
+			"total": finished - request.submitted,
+		}
+
+	def __repr__(self):
+		return f"Outcome: session = {self.session_id} ({self.final_session_id}), result = {self.result}, timings = {self.timings}"
+
+class Scheduler:
+	"""
+	Queue of the computations requested to a Master. Requests are started by priority as soon as a session is free,
+	those started together are requested to the network in a single flush, and run concurrently on the workers of the Master.
+	"""
+	def __init__(self, master, max_in_flight = None):
+		self.master = master
+		self.max_in_flight = master.sessions.max_sessions if max_in_flight is None else max_in_flight
+		self.in_flight = 0
+		self.queue = [] # heap of (-priority, submission order, request)
+		self.order = itertools.count()
+		self.changed = threading.Condition()
+		self.thread = None
+		self.stopped = False
+
+	def submit(self, circuit = None, participants = None, select = None, deadline = None, priority = 0):
+		"""
+		Request a computation over the live parties.
+
+		Arguments:
+			circuit (Circuit): circuit to compute. (Optional, default: None = average of the inputs of the participants)
+			participants (list): ids of the input parties. (Optional, default: None = chosen by select)
+			select (function): called with the live parties, returns the input parties. (Optional, default: None = random parties)
+			deadline (float): time in seconds from now within which the result is needed. (Optional, default: None = the phase timeouts only)
+			priority (int): requests with a higher priority are started first. (Optional, default: 0)
+
+		Returns:
+			A future of the Outcome, failing with ComputationError if the computation does not complete.
+		"""
+		request = Request(circuit, participants, select, deadline, priority)
+		with self.changed:
+			if self.stopped:
+				raise ComputationError("Scheduler stopped.")
+			heapq.heappush(self.queue, (-priority, next(self.order), request))
+			if self.thread is None:
+				self.thread = threading.Thread(target = self.schedule, daemon = True)
+				self.thread.start()
+			self.changed.notify_all()
+
+		return request.future
+
+	def take(self, n):
+		"""
+		Remove the requests to start next from the queue.
+
+		Arguments:
+			n (int): maximum number of requests.
+
+		Returns:
+			List of requests, by decreasing priority then submission order.
+		"""
+		with self.changed:
+			return [heapq.heappop(self.queue)[2] for _ in range(min(n, len(self.queue)))]
+
+	def schedule(self):
+		"""
+		Start the queued requests as long as the scheduler is not stopped.
+		"""
+		while True:
+			with self.changed:
+				self.changed.wait_for(lambda: self.stopped or (self.queue and self.in_flight < self.max_in_flight))
+				if self.stopped:
+					return
+				batch = self.take(self.max_in_flight - self.in_flight)
+				self.in_flight += len(batch)
+
+			started = []
+			for request in batch:
+				begin = time.monotonic()
+				session = self.start(request)
+				if session is None:
+					self.done()
+				else:
+					started.append((request, session, begin))
+			# the requests of the batch share the datagrams
+			self.master.outbound.flush()
+
+			for request, session, begin in started:
+				self.master.workers.submit(self.run, request, session, begin)
+
+	def start(self, request):
+		"""
+		Prepare a computation and request it to the network, without flushing.
+
+		Arguments:
+			request (Request): the request.
+
+		Returns:
+			The session, or None if the request has been cancelled or has failed.
+		"""
+		if not request.future.set_running_or_notify_cancel():
+			return None
+		if request.deadline is not None and request.deadline <= time.monotonic():
+			request.future.set_exception(ComputationError("Deadline passed before the computation started."))
+			return None
+
+		try:
+			session = self.master.prepare_session(request.circuit, request.participants, request.select)
+		except Exception as e:
+			request.future.set_exception(e)
+			return None
+		if session is None:
+			request.future.set_exception(ComputationError("Not enough live parties, unknown input parties, too few or too many input parties, or too many computations running."))
+			return None
+
+		if request.deadline is not None:
+			session.deadline = min(session.deadline, request.deadline)
+		request.session_id = session.session_id
+		self.master.send_request(session, flush = False)
+		return session
+
+	def run(self, request, session, started):
+		try:
+			self.master.run_session(session)
+			if session.final_result is None:
+				request.future.set_exception(ComputationError(f"Computation of session {session.session_id} failed."))
+			else:
+				request.future.set_result(Outcome(request, session, started, time.monotonic()))
+		except Exception as e:
+			request.future.set_exception(e)
+		finally:
+			self.done()
+
+	def done(self):
+		with self.changed:
+			self.in_flight -= 1
+			self.changed.notify_all()
+
+	def stop(self):
+		"""
+		Stop starting requests, the queued ones are cancelled. Running computations complete.
+		"""
+		with self.changed:
+			self.stopped = True
+			for _, _, request in self.queue:
+				request.future.cancel()
+			self.queue = []
+			self.changed.notify_all()
@@ -0,0 +1,152 @@
+#!/bin/bash/python3
+#encoding: utf-8
+
+import threading
+import time
+
+class SessionManager:
+	"""
+	Bounded table of the computations of a party, by session id. Each session object holds the state, deadline and
+	buffers of one computation, so that several computations run at the same time over the same membership.
+	The last finished sessions are kept (late frames for them are discarded, a delta SYNC may resume them),
+	and the frames received before the request of their session are held until it arrives.
+	"""
+	def __init__(self, max_sessions = 16, max_finished = 64, max_pending_sessions = 64, max_pending_frames = 1024, lifetime = 60):
+		self.lock = threading.RLock()
+		self.running = {} # sessions in flight, by session id
+		self.finished = {} # last finished sessions, by session id
+		self.pending = {} # frames received before the request of their session, by session id
+		self.max_sessions = max_sessions
+		self.max_finished = max_finished
+		self.max_pending_sessions = max_pending_sessions
+		self.max_pending_frames = max_pending_frames # per session
+		self.lifetime = lifetime # time in seconds after which a running session may be evicted to make room
+
+	def open(self, session_id, make):
+		"""
+		Add a running session, unless the session id is already used. When the table is full,
+		the sessions whose deadline has passed are stopped and closed to make room.
+
+		Arguments:
+			session_id (int): identifier of the computation.
+			make (function): creates the session object, which must have session_id, deadline and stop_prot attributes.
+
+		Returns:
+			The new session, or None if the session is already running or finished, or the table is full.
+		"""
+		with self.lock:
+			if session_id in self.running or session_id in self.finished:
+				return None
+			if len(self.running) >= self.max_sessions:
+				self.evict(time.monotonic())
+				if len(self.running) >= self.max_sessions:
+					return None
+			session = make()
+			session.deadline = time.monotonic() + self.lifetime
+			self.running[session_id] = session
+
+		return session
+
+	def evict(self, now):
+		# lock must be held
+		for session in [s for s in self.running.values() if s.deadline <= now]:
+			session.stop_prot = True
+			self.close(session)
+
+	def get(self, session_id):
+		"""
+		Get a running session.
+
+		Arguments:
+			session_id (int): identifier of the computation.
+
+		Returns:
+			The session if it is running, None otherwize.
+		"""
+		return self.running.get(session_id)
+
+	def get_finished(self, session_id):
+		return self.finished.get(session_id)
+
+	def is_finished(self, session_id):
+		return session_id in self.finished
+
+	def close(self, session):
+		"""
+		Move a running session to the finished ones.
+
+		Arguments:
+			session (object): the session.
+
+		Returns:
+			True if the session was running.
+		"""
+		with self.lock:
+			if self.running.pop(session.session_id, None) is None:
+				return False
+			self.add_finished(session.session_id, session)
+			return True
+
+	def add_finished(self, session_id, session):
+		# lock must be held
+		self.finished[session_id] = session
+		if len(self.finished) > self.max_finished:
+			del self.finished[next(iter(self.finished))]
+
+	def rename(self, session, session_id):
+		"""
+		Move a session, running or finished, to a new session id. Frames still sent with the former id are discarded.
+
+		Arguments:
+			session (object): the session.
+			session_id (int): the new identifier.
+
+		Returns:
+			True if the session is running.
+		"""
+		with self.lock:
+			running = self.running.pop(session.session_id, None) is not None
+			self.add_finished(session.session_id, session)
+			session.session_id = session_id
+			if running:
+				self.running[session_id] = session
+			else:
+				self.add_finished(session_id, session)
+			return running
+
+	def hold(self, frame):
+		"""
+		Keep a frame received before the request of its session. The oldest sessions are forgotten beyond max_pending_sessions.
+
+		Arguments:
+			frame (Frame): the received frame.
+
+		Returns:
+			True if the frame is held, False if too many frames are already held for its session.
+		"""
+		with self.lock:
+			frames = self.pending.get(frame.get_session())
+			if frames is None:
+				if len(self.pending) >= self.max_pending_sessions:
+					del self.pending[next(iter(self.pending))]
+				frames = self.pending[frame.get_session()] = []
+			if len(frames) >= self.max_pending_frames:
+				return False
+			frames.append(frame)
+			return True
+
+	def take_held(self, session_id):
+		"""
+		Get and forget the frames held for a session.
+
+		Arguments:
+			session_id (int): identifier of the computation.
+
+		Returns:
+			List of frames, in the order they have been received.
+		"""
+		with self.lock:
+			return self.pending.pop(session_id, [])
+
+	def __len__(self):
+		return len(self.running)
@@ -0,0 +1,265 @@
+#!/bin/bash/python3
+#encoding: utf-8
+
+"""
+Shared memory transport between parties running in processes of the same host.
+
+Every directed pair of parties has its own ring buffer, a shared memory segment named
+<prefix>-<sender>-<receiver> written by the sender only and read by the receiver only, so that no lock is needed:
+- 8 bytes: read position (written by the receiver)
+- 8 bytes: write position (written by the sender)
+- data: encoded frames, each prefixed by its length (4 bytes), wrapping around the end of the buffer
+Positions only grow, the offset in the data is the position modulo the capacity.
+"""
+
+import threading
+import time
+from . import Link, Octets
+
+try:
+	from multiprocessing import shared_memory, resource_tracker
+except ImportError:
+	shared_memory = None
+
+POSITION = Octets.UINT64
+LENGTH = Octets.UINT32
+HEADER_SIZE = 2 * POSITION.size
+
+def open_segment(name, size, timeout = 1):
+	"""
+	Create a shared memory segment, or attach to it if it already exists.
+
+	Arguments:
+		name (str): name of the segment.
+		size (int): size of the segment in bytes.
+		timeout (float): time in seconds to wait for a segment created by another process to be sized. (Optional, default: 1)
+
+	Returns:
+		The segment.
+	"""
+	deadline = time.monotonic() + timeout
+	while True:
+		try:
+			segment = shared_memory.SharedMemory(name, create = True, size = size)
+			break
+		except FileExistsError:
+			pass
+		try:
+			segment = shared_memory.SharedMemory(name)
+			break
+		except ValueError:
+			# created by another process but not sized yet, an empty file cannot be mapped
+			if time.monotonic() >= deadline:
+				raise
+		except FileNotFoundError:
+			# removed meanwhile, create it again
+			pass
+		time.sleep(0.001)
+	# the receiver removes the segment when it closes, not the resource tracker of whichever process exits first
+	resource_tracker.unregister(segment._name, "shared_memory")
+	return segment
+
+class RingBuffer:
+	"""
+	Single-producer single-consumer ring buffer of frames in a shared memory segment.
+	"""
+	def __init__(self, name, capacity = 1 << 20):
+		self.segment = open_segment(name, HEADER_SIZE + capacity)
+		self.buffer = self.segment.buf
+		self.capacity = len(self.buffer) - HEADER_SIZE # the system may round the size up
+
+	def get_positions(self):
+		return POSITION.unpack_from(self.buffer, 0)[0], POSITION.unpack_from(self.buffer, POSITION.size)[0]
+
+	def write_at(self, position, data):
+		offset = position % self.capacity
+		first = min(len(data), self.capacity - offset)
+		self.buffer[HEADER_SIZE+offset:HEADER_SIZE+offset+first] = data[:first]
+		if first < len(data):
+			self.buffer[HEADER_SIZE:HEADER_SIZE+len(data)-first] = data[first:]
+
+	def read_at(self, position, length):
+		offset = position % self.capacity
+		first = min(length, self.capacity - offset)
+		data = bytes(self.buffer[HEADER_SIZE+offset:HEADER_SIZE+offset+first])
+		if first < length:
+			data += bytes(self.buffer[HEADER_SIZE:HEADER_SIZE+length-first])
+		return data
+
+	def put(self, data):
+		"""
+		Append a frame (sender side).
+
+		Arguments:
+			data (bytes): the encoded frame.
+
+		Returns:
+			True if the frame has been written, False if the buffer is full.
+		"""
+		read, write = self.get_positions()
+		if self.capacity - (write - read) < LENGTH.size + len(data):
+			return False
+
+		self.write_at(write, LENGTH.pack(len(data)))
+		self.write_at(write + LENGTH.size, data)
+		# publish the frame once it is completely written
+		POSITION.pack_into(self.buffer, POSITION.size, write + LENGTH.size + len(data))
+		return True
+
+	def get_all(self):
+		"""
+		Remove every frame written so far (receiver side).
+
+		Returns:
+			List of encoded frames.
+		"""
+		read, write = self.get_positions()
+		frames = []
+		while read < write:
+			length, = LENGTH.unpack(self.read_at(read, LENGTH.size))
+			frames.append(self.read_at(read + LENGTH.size, length))
+			read += LENGTH.size + length
+
+		if frames:
+			POSITION.pack_into(self.buffer, 0, read)
+		return frames
+
+	def close(self, unlink = False):
+		self.buffer = None
+		self.segment.close()
+		if unlink:
+			try:
+				resource_tracker.register(self.segment._name, "shared_memory")
+				self.segment.unlink()
+			except FileNotFoundError:
+				pass
+
+class ShmInterface(Link.Interface, threading.Thread):
+	"""
+	Shared memory transport, same contract as Link.NetworkInterface, the address of a party is ("shm", pid).
+	A thread polls the ring buffers of the known parties, sleeping a little longer each time they are all empty.
+	Broadcast frames are written to the ring buffer of every known party.
+	"""
+	mtu = 0 # no datagram to fill, frames are not coalesced
+
+	def __init__(self, pid, peers = (), prefix = "mpc", capacity = 1 << 20, max_sleep = 0.001):
+		if shared_memory is None:
+			raise ImportError("multiprocessing.shared_memory is not available.")
+		Link.Interface.__init__(self, "shm", pid)
+		threading.Thread.__init__(self, daemon = True)
+		self.pid = pid
+		self.prefix = prefix
+		self.capacity = capacity
+		self.max_sleep = max_sleep # longest polling interval in seconds
+		self.outbound = {} # ring buffers to the other parties, by pid
+		self.inbound = {} # ring buffers from the other parties, by pid
+		self.lock = threading.Lock()
+		self.send_lock = threading.Lock() # the threads of this party are a single producer for the other parties
+		self.quit = False
+		self.full = 0 # number of frames dropped because a ring buffer was full
+		for peer in peers:
+			self.set_party(peer, ("shm", peer))
+
+	def set_party(self, id, addr):
+		if id != self.pid:
+			# open the ring buffer now, so that frames sent before the thread starts are kept
+			self.get_inbound(id)
+		return super(ShmInterface, self).set_party(id, addr)
+
+	def get_inbound(self, pid):
+		with self.lock:
+			ring = self.inbound.get(pid)
+			if ring is None:
+				ring = self.inbound[pid] = RingBuffer(f"{self.prefix}-{pid}-{self.pid}", self.capacity)
+		return ring
+
+	def get_outbound(self, pid):
+		with self.lock:
+			ring = self.outbound.get(pid)
+			if ring is None:
+				ring = self.outbound[pid] = RingBuffer(f"{self.prefix}-{self.pid}-{pid}", self.capacity)
+		return ring
+
+	def stop(self):
+		self.quit = True
+
+	def run(self):
+		sleep = 0
+		while not self.quit:
+			batch = self.drain()
+			if batch:
+				self.deliver_batch(batch)
+				sleep = 0
+			else:
+				sleep = min(max(sleep * 2, 0.00005), self.max_sleep)
+				time.sleep(sleep)
+
+		self.close()
+
+	def drain(self):
+		"""
+		Read every frame waiting in the ring buffers.
+
+		Returns:
+			List of (bytes, address) pairs.
+		"""
+		with self.lock:
+			inbound = list(self.inbound.items())
+		batch = []
+		for pid, ring in inbound:
+			batch.extend((b, ("shm", pid)) for b in ring.get_all())
+
+		return batch
+
+	def close(self):
+		"""
+		Release the ring buffers, removing the ones read by this party.
+		"""
+		with self.lock:
+			for ring in self.outbound.values():
+				ring.close()
+			for ring in self.inbound.values():
+				ring.close(unlink = True)
+			self.outbound = {}
+			self.inbound = {}
+
+	def send_bytes(self, data, to_pid):
+		ring = self.get_outbound(to_pid)
+		with self.send_lock:
+			written = ring.put(data)
+		if written:
+			return Link.SUCCESS
+
+		self.full += 1
+		return Link.FAILED
+
+	def broadcast(self, message):
+		"""
+		Allows broadcasting of messages.
+
+		Arguments:
+			message (Message): the message to be sent.
+
+		Returns:
+			Sending status.
+		"""
+		data = message.to_bytes()
+		status = Link.SUCCESS
+		for pid in list(self.parties_addr):
+			if pid != self.pid and self.send_bytes(data, pid) != Link.SUCCESS:
+				status = Link.FAILED
+
+		return status
+
+	def send_to(self, to_pid, message):
+		"""
+		Allows a network interface to send a message to another party.
+
+		Arguments:
+			to_pid (int): pid of the party to whom the message is destinated to.
+			message (Message): the message to be sent.
+
+		Returns:
+			Sending status.
+		"""
+		return self.send_bytes(message.to_bytes(), to_pid)
@@ -0,0 +1,111 @@
+#!/bin/bash/python3
+#encoding: utf-8
+
+import time
+
+class Transition:
+	"""
+	Row of a transition table: the handler run when an event is received in a state,
+	the guard that must accept the event first, and the state reached afterwards.
+	"""
+	def __init__(self, handler, guard = None, target = None):
+		self.handler = handler
+		self.guard = guard
+		self.target = target
+		self.count = 0 # number of times the handler has been run
+		self.rejected = 0 # number of events refused by the guard
+		self.time = 0 # total time spent in the handler, in seconds
+
+class StateMachine:
+	"""
+	Table-driven state machine. Transitions are looked up by (state, event, version),
+	the state is read from and written to the state attribute of the subject given to dispatch
+	(a party or one of its sessions).
+	"""
+	def __init__(self, name):
+		self.name = name
+		self.table = {} # transitions by (state, event, version)
+		self.on_entry = {} # actions run when entering a state, by state
+		self.on_exit = {} # actions run when leaving a state, by state
+		self.unhandled = 0 # number of events without transition in the current state
+
+	def add(self, states, events, versions, handler, guard = None, target = None):
+		"""
+		Register a transition for every combination of the given states, events and versions.
+
+		Arguments:
+			states (list): states in which the transition applies.
+			events (list): events (frame types) triggering the transition.
+			versions (list): protocol versions the transition applies to.
+			handler (function): called with the arguments of dispatch, may return the next state.
+			guard (function): called with the arguments of dispatch, the event is ignored if it returns False. (Optional, default: None)
+			target (int): state reached once the handler has run. (Optional, default: None = unchanged)
+		"""
+		for state in states:
+			for event in events:
+				for version in versions:
+					self.table[(state, event, version)] = Transition(handler, guard, target)
+
+	def add_entry(self, state, action):
+		self.on_entry.setdefault(state, []).append(action)
+
+	def add_exit(self, state, action):
+		self.on_exit.setdefault(state, []).append(action)
+
+	def dispatch(self, subject, event, version, *args):
+		"""
+		Run the transition of an event in the current state of a subject.
+
+		Arguments:
+			subject (object): holder of the state attribute.
+			event (int): the event, usually the type of the received frame.
+			version (int): protocol version of the event.
+			args: arguments given to the guard and the handler.
+
+		Returns:
+			True if a transition has been run, False if the event has been ignored.
+		"""
+		transition = self.table.get((subject.state, event, version))
+		if transition is None:
+			self.unhandled += 1
+			return False
+
+		if transition.guard is not None and not transition.guard(*args):
+			transition.rejected += 1
+			return False
+
+		begin = time.perf_counter()
+		target = transition.handler(*args)
+		if target is None:
+			target = transition.target
+		if target is not None and target != subject.state:
+			self.move(subject, target)
+		transition.count += 1
+		transition.time += time.perf_counter() - begin
+
+		return True
+
+	def move(self, subject, state):
+		"""
+		Change the state of a subject, running the exit and entry actions.
+
+		Arguments:
+			subject (object): holder of the state attribute.
+			state (int): the new state.
+		"""
+		for action in self.on_exit.get(subject.state, []):
+			action(subject)
+		subject.state = state
+		for action in self.on_entry.get(state, []):
+			action(subject)
+
+	def get_stats(self):
+		"""
+		Get the counters of the transitions that have been used.
+
+		Returns:
+			Dictionary of {"count", "rejected", "time"} by (state, event, version), and the number of unhandled events.
+		"""
+		stats = {key: {"count": t.count, "rejected": t.rejected, "time": t.time} for key, t in self.table.items() if t.count or t.rejected}
+		stats["unhandled"] = self.unhandled
+		return stats
@@ -0,0 +1,345 @@
+#!/bin/bash/python3
+#encoding: utf-8
+
+"""
+TCP transport. Each frame is prefixed by its length (4 bytes, network byte order).
+The first 2 bytes sent on a new connection are the listening port of the party who opened it,
+so that the connection can be reused in both directions.
+"""
+
+import selectors
+import socket
+import struct
+import threading
+import time
+from . import Frame, Link, Octets
+
+LENGTH = Octets.UINT32
+PORT = struct.Struct(">H")
+
+MAX_FRAME_SIZE = 16 * 2**20 # larger frames are considered as a protocol error and close the connection
+
+class StreamProtocolException(Exception):
+	pass
+
+class StreamParser:
+	"""
+	Incremental parser of length-prefixed frames: bytes are fed as they are received
+	and the complete frames are returned.
+	"""
+	def __init__(self, max_frame_size = MAX_FRAME_SIZE):
+		self.buffer = bytearray()
+		self.max_frame_size = max_frame_size
+
+	def feed(self, data):
+		"""
+		Add received bytes.
+
+		Arguments:
+			data (bytes): the received bytes.
+
+		Returns:
+			List of the complete frames, as bytes.
+
+		Raises:
+			StreamProtocolException: A length prefix exceeds the maximum frame size.
+		"""
+		self.buffer += data
+		frames = []
+		i = 0
+		while len(self.buffer) - i >= LENGTH.size:
+			length, = LENGTH.unpack_from(self.buffer, i)
+			if length > self.max_frame_size:
+				raise StreamProtocolException(f"Frame of {length} bytes exceeds {self.max_frame_size} bytes.")
+			if len(self.buffer) - i - LENGTH.size < length:
+				break
+			i += LENGTH.size
+			frames.append(bytes(self.buffer[i:i+length]))
+			i += length
+
+		if i:
+			del self.buffer[:i]
+
+		return frames
+
+class Connection:
+	"""
+	Connection with a remote party.
+	"""
+	def __init__(self, sock, addr = None):
+		self.sock = sock
+		self.addr = addr # listening address of the remote party, None until the handshake is received
+		self.parser = StreamParser()
+		self.lock = threading.Lock() # serializes the writers
+
+	def send(self, data):
+		with self.lock:
+			self.sock.sendall(LENGTH.pack(len(data)) + data)
+
+class StreamInterface(Link.Interface, threading.Thread):
+	"""
+	TCP transport, same contract as Link.NetworkInterface. One long-lived connection per known party
+	is opened when a frame is first sent to it, and reused for the following computations.
+	Broadcast frames are sent to every known party. After a failed connection, no new attempt is made to the same party
+	for a delay doubled at each failure, so that a party that left does not block every frame sent.
+
+	Parties are discovered with a datagram interface, if given: ADVERT and LEAVE frames, alone or packed in a container,
+	are broadcast with it, and the frames it receives are handed to the party. The listening port is then expected to be
+	the same as the datagram port.
+	"""
+	DATAGRAM_TYPES = (Frame.Frame.ADVERT, Frame.Frame.LEAVE) # broadcast with the datagram interface, to reach the parties not connected yet
+
+	def __init__(self, ip = '0.0.0.0', port = Link.MPC_PORT, datagram = None, timeout = 10, min_retry_delay = 0.5, max_retry_delay = 30):
+		Link.Interface.__init__(self, ip, port)
+		threading.Thread.__init__(self, daemon = True)
+		self.timeout = timeout # connection and sending timeout in seconds
+		self.min_retry_delay = min_retry_delay # delay in seconds before connecting again to a party after a first failure
+		self.max_retry_delay = max_retry_delay
+		self.datagram = datagram
+		if datagram is not None:
+			self.membership = datagram.membership # shared address book
+			self.parties_addr = datagram.parties_addr
+			datagram.set_recv_handler(lambda message: self.on_recv_callback(message))
+			datagram.set_batch_handler(lambda messages: self.hand_over(messages))
+
+		self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+		self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+		self.listener.bind((ip, port))
+		self.listener.listen()
+		self.port = self.listener.getsockname()[1]
+
+		self.selector = selectors.DefaultSelector()
+		self.selector.register(self.listener, selectors.EVENT_READ)
+		# written to wake the selector up when a connection is added
+		self.waker, self.wakee = socket.socketpair()
+		self.selector.register(self.wakee, selectors.EVENT_READ)
+		self.pending = [] # connections waiting to be registered by the selector thread
+
+		self.pool = {} # connections by listening address of the remote party
+		self.pool_lock = threading.Lock()
+		self.unreachable = {} # by listening address of the party: [time (time.monotonic) of the next connection attempt, delay]
+		self.quit = False
+		self.connects = 0 # number of connections opened by this party
+		self.accepts = 0 # number of connections accepted
+		self.protocol_errors = 0
+
+	def start(self):
+		if self.datagram is not None:
+			self.datagram.start()
+		threading.Thread.start(self)
+
+	def stop(self):
+		self.quit = True
+		if self.datagram is not None:
+			self.datagram.stop()
+		self.wake()
+
+	def wake(self):
+		try:
+			self.waker.send(b"\0")
+		except OSError:
+			# already stopped
+			pass
+
+	def run(self):
+		while not self.quit:
+			for key, _ in self.selector.select(timeout = 1):
+				if key.fileobj is self.listener:
+					self.accept()
+				elif key.fileobj is self.wakee:
+					self.wakee.recv(4096)
+				else:
+					self.read(key.data)
+
+			with self.pool_lock:
+				pending, self.pending = self.pending, []
+			for connection in pending:
+				self.selector.register(connection.sock, selectors.EVENT_READ, connection)
+
+		for key in list(self.selector.get_map().values()):
+			key.fileobj.close()
+		self.selector.close()
+		self.waker.close()
+
+	def accept(self):
+		sock, _ = self.listener.accept()
+		sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+		sock.settimeout(self.timeout)
+		self.accepts += 1
+		connection = Connection(sock)
+		self.selector.register(sock, selectors.EVENT_READ, connection)
+
+	def read(self, connection):
+		try:
+			data = connection.sock.recv(65536)
+		except OSError:
+			data = b""
+		if not data:
+			self.close(connection)
+			return
+
+		if connection.addr is None:
+			# handshake: listening port of the remote party
+			connection.parser.buffer += data
+			if len(connection.parser.buffer) < PORT.size:
+				return
+			port, = PORT.unpack_from(connection.parser.buffer)
+			data = bytes(connection.parser.buffer[PORT.size:])
+			del connection.parser.buffer[:]
+			connection.addr = (connection.sock.getpeername()[0], port)
+			with self.pool_lock:
+				# reuse the connection to answer
+				self.pool.setdefault(connection.addr, connection)
+				self.unreachable.pop(connection.addr, None)
+
+		try:
+			frames = connection.parser.feed(data)
+		except StreamProtocolException:
+			self.protocol_errors += 1
+			self.close(connection)
+			return
+
+		if frames:
+			self.deliver_batch([(b, connection.addr) for b in frames])
+
+	def close(self, connection):
+		# called by the selector thread only
+		try:
+			self.selector.unregister(connection.sock)
+		except (KeyError, ValueError):
+			pass
+		connection.sock.close()
+		self.discard(connection)
+
+	def discard(self, connection):
+		with self.pool_lock:
+			if self.pool.get(connection.addr) is connection:
+				del self.pool[connection.addr]
+
+	def connect(self, addr):
+		"""
+		Get the connection to a party, opening it if needed.
+
+		Arguments:
+			addr (tuple): listening address of the party.
+
+		Returns:
+			The connection.
+
+		Raises:
+			OSError: The connection failed, or the last one failed less than its retry delay ago.
+		"""
+		with self.pool_lock:
+			connection = self.pool.get(addr)
+			unreachable = self.unreachable.get(addr)
+		if connection is not None:
+			return connection
+		if unreachable is not None and time.monotonic() < unreachable[0]:
+			raise ConnectionRefusedError(f"{addr} unreachable, no new attempt before its retry delay.")
+
+		sock = None
+		try:
+			sock = socket.create_connection(addr, timeout = self.timeout)
+			sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+			sock.sendall(PORT.pack(self.port))
+		except OSError:
+			if sock is not None:
+				sock.close()
+			delay = self.min_retry_delay if unreachable is None else min(2 * unreachable[1], self.max_retry_delay)
+			with self.pool_lock:
+				self.unreachable[addr] = [time.monotonic() + delay, delay]
+			raise
+
+		connection = Connection(sock, addr)
+		with self.pool_lock:
+			self.unreachable.pop(addr, None)
+			existing = self.pool.get(addr)
+			if existing is not None:
+				# opened concurrently by another thread
+				sock.close()
+				return existing
+			self.pool[addr] = connection
+			self.pending.append(connection)
+		self.connects += 1
+		self.wake()
+
+		return connection
+
+	def send_bytes(self, data, addr):
+		# a pooled connection may have been closed by the remote party: retry once with a new one
+		for _ in range(2):
+			connection = None
+			try:
+				connection = self.connect(addr)
+				connection.send(data)
+				return Link.SUCCESS
+			except OSError:
+				if connection is None:
+					# no connection to the party
+					break
+				# the selector thread closes it when reading the end of the stream
+				self.discard(connection)
+				try:
+					connection.sock.shutdown(socket.SHUT_RDWR)
+				except OSError:
+					pass
+
+		return Link.FAILED
+
+	def broadcast(self, message):
+		"""
+		Allows broadcasting of messages.
+
+		Arguments:
+			message (Message): the message to be sent.
+
+		Returns:
+			Sending status.
+		"""
+		frame = message.content
+		if self.datagram is not None and frame.get_type() in StreamInterface.DATAGRAM_TYPES:
+			return self.datagram.broadcast(message)
+		if self.datagram is not None and frame.get_type() == Frame.Frame.CONTAINER:
+			# the Coalescer packs the ADVERT and LEAVE frames with the other broadcast frames
+			frames = frame.get_payload()
+			announces = [f for f in frames if Link.get_frame_type(f) in StreamInterface.DATAGRAM_TYPES]
+			if announces:
+				status = self.datagram.broadcast(self.repack(message, announces))
+				others = [f for f in frames if Link.get_frame_type(f) not in StreamInterface.DATAGRAM_TYPES]
+				if not others:
+					return status
+				message = self.repack(message, others)
+
+		data = message.to_bytes()
+		status = Link.SUCCESS
+		for addr in list(self.parties_addr.values()):
+			if addr != self.get_addr() and self.send_bytes(data, addr) != Link.SUCCESS:
+				status = Link.FAILED
+
+		return status
+
+	def repack(self, message, frames):
+		container = Frame.Frame(Frame.Frame.CONTAINER, message.content.get_version(), message.content.get_origin(), frames)
+		return Link.Message(Link.Message.FRAME, message.get_origin(), container)
+
+	def send_to(self, to_pid, message):
+		"""
+		Allows a network interface to send a message to another party.
+
+		Arguments:
+			to_pid (int): pid of the party to whom the message is destinated to.
+			message (Message): the message to be sent.
+
+		Returns:
+			Sending status.
+		"""
+		return self.send_bytes(message.to_bytes(), self.parties_addr[to_pid])
+
+	def get_stats(self):
+		"""
+		Get the statistics of the connection pool.
+
+		Returns:
+			Dictionary with the number of pooled, opened and accepted connections, of unreachable parties, and the protocol and decoding errors.
+		"""
+		return {"connections": len(self.pool), "unreachable": len(self.unreachable), "connects": self.connects, "accepts": self.accepts, "protocol_errors": self.protocol_errors, "decode_errors": self.decode_errors}
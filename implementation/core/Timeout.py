@@ -0,0 +1,94 @@
+#!/bin/bash/python3
+#encoding: utf-8
+
+import threading
+
+# phases of a computation whose duration is measured for each peer
+INPUT = 1 # from the REQUEST frame to the share of an input party
+RESULT = 2 # from the REQUEST frame to the result of a party
+
+class Estimate:
+	"""
+	Smoothed duration of a phase for a peer, and its variation.
+	"""
+	def __init__(self, sample):
+		self.srtt = sample
+		self.rttvar = sample / 2
+
+class TimeoutEstimator:
+	"""
+	Estimator of the time a phase takes for each peer, from the durations observed in the previous computations,
+	smoothed as the round-trip time of the reliability layer (RFC 6298).
+	"""
+	def __init__(self):
+		self.estimates = {} # by (phase, peer)
+		self.lock = threading.Lock()
+
+	def observe(self, phase, peer, sample):
+		"""
+		Record the duration of a phase for a peer.
+
+		Arguments:
+			phase (int): INPUT or RESULT.
+			peer (int): id of the party.
+			sample (float): observed duration in seconds.
+		"""
+		with self.lock:
+			estimate = self.estimates.get((phase, peer))
+			if estimate is None:
+				self.estimates[(phase, peer)] = Estimate(sample)
+			else:
+				estimate.rttvar = 0.75 * estimate.rttvar + 0.25 * abs(estimate.srtt - sample)
+				estimate.srtt = 0.875 * estimate.srtt + 0.125 * sample
+
+	def backoff(self, phase, peers, timeout):
+		"""
+		Double the timeout of peers that did not complete a phase in time, so that a slower link is not cut short again.
+
+		Arguments:
+			phase (int): INPUT or RESULT.
+			peers (list): ids of the late parties.
+			timeout (float): the timeout that expired, in seconds.
+		"""
+		with self.lock:
+			for peer in peers:
+				estimate = self.estimates.get((phase, peer))
+				if estimate is not None:
+					estimate.srtt = 2 * max(estimate.srtt, timeout)
+
+	def get(self, phase, peer):
+		"""
+		Get the time within which a peer is expected to complete a phase.
+
+		Arguments:
+			phase (int): INPUT or RESULT.
+			peer (int): id of the party.
+
+		Returns:
+			The timeout in seconds, None if no duration has been observed yet.
+		"""
+		estimate = self.estimates.get((phase, peer))
+		if estimate is None:
+			return None
+		return estimate.srtt + 4 * estimate.rttvar
+
+	def get_timeout(self, phase, peers, min_timeout, max_timeout, needed = None):
+		"""
+		Get the timeout of a phase waiting for several peers.
+
+		Arguments:
+			phase (int): INPUT or RESULT.
+			peers (list): ids of the parties waited for.
+			min_timeout (float): lower bound in seconds.
+			max_timeout (float): upper bound in seconds, also used for the peers without estimate.
+			needed (int): number of peers needed to complete the phase. (Optional, default: None = all of them)
+
+		Returns:
+			The timeout in seconds.
+		"""
+		timeouts = sorted(max_timeout if t is None else t for t in (self.get(phase, peer) for peer in peers))
+		if not timeouts:
+			return max_timeout
+		if needed is None or needed > len(timeouts):
+			needed = len(timeouts)
+		return min(max(timeouts[max(needed, 1)-1], min_timeout), max_timeout)
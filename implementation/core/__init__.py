@@ -4,5 +4,16 @@
 from . import Octets
 from . import Party
 from . import Crypto
+from . import Membership
+from . import Log
+from . import SessionManager
+from . import Scheduler
+from . import FailureDetector
+from . import StateMachine
+from . import Timeout
 from . import Link
-from . import Frame
\ No newline at end of file
+from . import Frame
+from . import AsyncLink
+from . import AsyncParty
+from . import StreamLink
+from . import ShmLink
@@ -1,11 +1,105 @@
 #!/bin/bash/python3
 #encoding: utf-8
 
-from core import Party, Frame
+from core import AsyncParty, Party, Frame, Link, Log, ShmLink
+import asyncio
+import multiprocessing
 import sys
 import os
+import time
+
+async def simulate(n, version = Frame.Frame.PCEAS):
+	"""
+	Run one computation between n parties in this process, over a loopback medium.
+
+	Arguments:
+		n (int): number of parties, the Master included.
+		version (int): protocol used by the Master. (Optional, default: PCEAS)
+
+	Returns:
+		The final result, or None if the computation failed.
+	"""
+	loopback = Link.Loopback()
+	master = AsyncParty.AsyncMaster(1, version = version, networkInterface = Link.LoopbackInterface(loopback, 1))
+	parties = [master] + [AsyncParty.AsyncParty(pid, networkInterface = Link.LoopbackInterface(loopback, pid)) for pid in range(2, n+1)]
+	for party in parties:
+		await party.start()
+		party.state = Party.Party.AWAITING
+		# skip the discovery: n parties answering each other's ADVERT frames make n² broadcasts
+		party.known_parties = list(range(1, n+1))
+		for pid in range(1, n+1):
+			party.networkInterface.set_party(pid, ("loopback", pid))
+
+	return await master.compute()
+
+def make_shm_party(pid, n, prefix, master = False, version = Frame.Frame.PCEAS):
+	interface = ShmLink.ShmInterface(pid, peers = range(1, n+1), prefix = prefix)
+	if master:
+		party = Party.Master(pid, version = version, networkInterface = interface)
+	else:
+		party = Party.Party(pid, networkInterface = interface)
+	party.state = Party.Party.AWAITING
+	party.known_parties = list(range(1, n+1))
+	interface.start()
+
+	return party
+
+def serve_shm_party(pid, n, prefix, done, duration):
+	party = make_shm_party(pid, n, prefix)
+	done.wait(duration)
+	# the interface removes its ring buffers when it stops
+	party.networkInterface.stop()
+	party.networkInterface.join()
+
+def simulate_processes(n, version = Frame.Frame.PCEAS, duration = 60):
+	"""
+	Run one computation between n parties, each in its own process, over shared memory.
+
+	Arguments:
+		n (int): number of parties, the Master included.
+		version (int): protocol used by the Master. (Optional, default: PCEAS)
+		duration (float): maximum lifetime of the parties in seconds. (Optional, default: 60)
+
+	Returns:
+		The final result, or None if the computation failed.
+	"""
+	prefix = f"mpc{os.getpid()}"
+	master = make_shm_party(1, n, prefix, master = True, version = version)
+	done = multiprocessing.Event()
+	processes = [multiprocessing.Process(target = serve_shm_party, args = (pid, n, prefix, done, duration)) for pid in range(2, n+1)]
+	for process in processes:
+		process.start()
+
+	session = master.prepare_session()
+	master.send_request(session)
+	master.run_session(session)
+
+	done.set()
+	for process in processes:
+		process.join()
+	master.networkInterface.stop()
+	master.networkInterface.join()
+
+	return session.final_result
 
 if __name__ == '__main__':
+	# python3 simulator.py -debug ... logs every frame sent and received
+	Log.setup(Log.DEBUG if "-debug" in sys.argv else Log.INFO)
+
+	if "-processes" in sys.argv:
+		# python3 simulator.py -processes [number of parties]
+		i = sys.argv.index("-processes")
+		n = int(sys.argv[i+1]) if len(sys.argv) > i+1 else 10
+		print(simulate_processes(n))
+		sys.exit(0)
+
+	if "-loopback" in sys.argv:
+		# python3 simulator.py -loopback [number of parties]
+		i = sys.argv.index("-loopback")
+		n = int(sys.argv[i+1]) if len(sys.argv) > i+1 else 10
+		print(asyncio.run(simulate(n)))
+		sys.exit(0)
+
 	id = os.getenv('PARTY_ID') # ou paramètrer manuellement
 	with open("/tmp/log.log", "a") as f:
 		print(sys.byteorder)
@@ -14,10 +108,22 @@ if __name__ == '__main__':
 	master = False
 	if "-master" in sys.argv:
 		master = True
+
+	# python3 simulator.py [-ip address] [-port port] [-multicast group address]
+	options = {}
+	for option in ("-ip", "-port", "-multicast"):
+		if option in sys.argv:
+			options[option] = sys.argv[sys.argv.index(option)+1]
+	networkInterface = Link.NetworkInterface(
+		ip = options.get("-ip", "0.0.0.0"),
+		port = int(options.get("-port", Link.MPC_PORT)),
+		multicast_group = (options["-multicast"], Link.MPC_GROUP_PORT) if "-multicast" in options else None
+	)
 	
 	if master:
-		party = Party.Master(int(1), version = Frame.Frame.PCEAS)
+		party = Party.Master(int(1), version = Frame.Frame.PCEAS, networkInterface = networkInterface)
 	else:
-		party = Party.Party(int(id))
+		party = Party.Party(int(id), networkInterface = networkInterface)
+	networkInterface.start()
 
 	party.run()